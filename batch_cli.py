@@ -0,0 +1,233 @@
+# Wsadowe generowanie kreacji mailowych bez interfejsu Streamlit.
+#
+# Użycie:
+#   python batch_cli.py manifest.jsonl --output wyniki/ --workers 4
+#
+# Manifest (CSV z nagłówkiem lub JSONL) opisuje jedno zadanie w wierszu:
+#   id            - identyfikator zadania (opcjonalny, domyślnie skrót treści PDF, szablonu
+#                   i parametrów generowania; identyfikatory muszą być unikalne)
+#   pdf           - ścieżka do e-booka
+#   persona       - opis persony (lub persona_file - ścieżka do pliku z opisem)
+#   template      - ścieżka do szablonu HTML ze zmiennymi {!{ nazwa_zmiennej }!}
+#   tone          - ton komunikacji (domyślnie "przyjazny")
+#   model         - model OpenAI (domyślnie "o4-mini")
+#   author_info   - informacje o autorze (opcjonalne)
+#   lengths       - długości sekcji jako obiekt JSON, np. {"intro": 400}
+# Ścieżki względne liczone są względem katalogu manifestu.
+#
+# Dla każdego zadania zapisywane są pliki <id>.html i <id>.json. Zadania, dla których
+# oba pliki już istnieją i powstały z tych samych danych (PDF, szablon, parametry),
+# są pomijane - przerwany przebieg można po prostu wznowić.
+
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from mailgen.core import (
+    DEFAULT_VAR_LENGTHS,
+    analyze_pdf_with_openai,
+    extract_variables_from_template,
+    get_generation_stats,
+    read_pdf,
+    supports_structured_output,
+    replace_variables_in_html,
+)
+from mailgen.metrics import get_metrics
+from mailgen.rate_limiter import get_rate_limiter
+from mailgen.token_budget import PageTokenCounter, has_exact_token_count
+
+
+# Funkcja do wczytania zadań z manifestu CSV lub JSONL
+def load_manifest(manifest_path, structured_output=False):
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        if manifest_path.lower().endswith(".csv"):
+            jobs = list(csv.DictReader(f))
+        else:
+            jobs = [json.loads(line) for line in f if line.strip()]
+
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = [normalize_job(job, base_dir, structured_output) for job in jobs]
+
+    # Dwa zadania o tym samym identyfikatorze nadpisywałyby nawzajem swoje pliki wynikowe
+    ids = [job["id"] for job in jobs]
+    duplicates = sorted({job_id for job_id in ids if ids.count(job_id) > 1})
+    if duplicates:
+        raise ValueError(f"Powtórzone identyfikatory zadań w manifeście: {', '.join(duplicates)}")
+    return jobs
+
+
+# Funkcja do wyliczenia skrótu zawartości pliku (czytanego blokami)
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Funkcja do uzupełnienia domyślnych wartości i rozwiązania ścieżek zadania
+def normalize_job(job, base_dir, structured_output=False):
+    def resolve(path):
+        return path if os.path.isabs(path) else os.path.join(base_dir, path)
+
+    job = {key: value for key, value in job.items() if value not in (None, "")}
+
+    if "persona_file" in job:
+        with open(resolve(job.pop("persona_file")), "r", encoding="utf-8") as f:
+            job["persona"] = f.read()
+
+    lengths = job.get("lengths") or {}
+    if isinstance(lengths, str):
+        lengths = json.loads(lengths)
+
+    normalized = {
+        "pdf": resolve(job["pdf"]),
+        "template": resolve(job["template"]),
+        "persona": job["persona"],
+        "tone": job.get("tone", "przyjazny"),
+        "model": job.get("model", "o4-mini"),
+        "author_info": job.get("author_info", ""),
+        "lengths": {**DEFAULT_VAR_LENGTHS, **{k: int(v) for k, v in lengths.items()}},
+    }
+
+    # Skrót treści PDF i szablonu oraz parametrów generowania - zmiana któregokolwiek z nich
+    # sprawia, że zapisany wynik jest nieaktualny i zadanie zostanie wykonane ponownie
+    fingerprint = json.dumps(
+        {
+            **normalized,
+            "pdf": file_digest(normalized["pdf"]),
+            "template": file_digest(normalized["template"]),
+            "structured_output": structured_output,
+        },
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    normalized["fingerprint"] = hashlib.sha256(fingerprint.encode("utf-8")).hexdigest()
+
+    # Identyfikator deterministyczny - te same dane dają ten sam plik wynikowy
+    normalized["id"] = str(job["id"]) if "id" in job else normalized["fingerprint"][:16]
+    return normalized
+
+
+# Funkcja do atomowego zapisu pliku wynikowego
+def write_atomic(path, content):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+# Funkcja zwracająca ścieżki plików wynikowych zadania
+def output_paths(output_dir, job):
+    return (
+        os.path.join(output_dir, f"{job['id']}.html"),
+        os.path.join(output_dir, f"{job['id']}.json"),
+    )
+
+
+# Funkcja sprawdzająca, czy zadanie zostało już wykonane dla tych samych danych
+# (pliki wynikowe istnieją, a zapisany skrót danych zgadza się ze skrótem zadania)
+def is_job_done(output_dir, job):
+    html_path, json_path = output_paths(output_dir, job)
+    if not (os.path.exists(html_path) and os.path.exists(json_path)):
+        return False
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            return json.load(f)["job"].get("fingerprint") == job["fingerprint"]
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+# Funkcja wykonująca pojedyncze zadanie: PDF -> JSON -> HTML
+def run_job(job, output_dir, structured_output=False):
+    html_path, json_path = output_paths(output_dir, job)
+
+    with open(job["pdf"], "rb") as f:
+        pdf_text = read_pdf(f.read(), token_counter=PageTokenCounter(job["model"]))
+
+    with open(job["template"], "r", encoding="utf-8") as f:
+        html_template = f.read()
+
+    required_variables = extract_variables_from_template(html_template)
+    if "author_credentials" in html_template and job["author_info"].strip():
+        required_variables.add("author_credentials")
+    if not required_variables:
+        raise RuntimeError(f"Brak zmiennych w szablonie: {job['template']}")
+
+    lengths = {var: job["lengths"].get(var, 300) for var in required_variables}
+    result = analyze_pdf_with_openai(
+        pdf_text,
+        job["persona"],
+        required_variables,
+        job["author_info"],
+        model=job["model"],
+        tone=job["tone"],
+        lengths=lengths,
+        structured_output=structured_output
+    )
+    json_data = result.data
+
+    final_html = replace_variables_in_html(html_template, json_data)
+
+    # JSON zapisywany jako ostatni - jego obecność oznacza zakończone zadanie
+    write_atomic(html_path, final_html)
+    write_atomic(json_path, json.dumps({"job": job, "data": json_data, "usage": result.usage, "retried_keys": result.retried_keys}, ensure_ascii=False, indent=2))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Wsadowe generowanie kreacji mailowych z e-booków.")
+    parser.add_argument("manifest", help="Plik CSV lub JSONL z listą zadań")
+    parser.add_argument("--output", "-o", default="output", help="Katalog na pliki wynikowe")
+    parser.add_argument("--workers", "-w", type=int, default=4, help="Liczba równoległych zadań")
+    parser.add_argument("--structured-output", action="store_true", help="Wysyłaj schemat JSON jako response_format (structured outputs)")
+    parser.add_argument("--metrics-out", help="Plik na pomiary etapów: .prom (format Prometheus) lub .jsonl (JSON Lines)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output, exist_ok=True)
+    try:
+        jobs = load_manifest(args.manifest, args.structured_output)
+    except (OSError, ValueError, KeyError) as e:
+        print(f"[BŁĄD] Nieprawidłowy manifest {args.manifest}: {e}", file=sys.stderr)
+        return 2
+
+    # Pominięcie zadań zakończonych w poprzednich przebiegach dla tych samych danych
+    pending = [job for job in jobs if not is_job_done(args.output, job)]
+    print(f"Zadania: {len(jobs)}, do wykonania: {len(pending)}, pominięte: {len(jobs) - len(pending)}")
+    estimated_models = sorted({job["model"] for job in pending if not has_exact_token_count(job["model"])})
+    if estimated_models:
+        print(f"[UWAGA] Tokenizer (tiktoken) niedostępny dla modeli {', '.join(estimated_models)} - liczba tokenów e-booków będzie szacowana", file=sys.stderr)
+
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = {executor.submit(run_job, job, args.output, args.structured_output): job for job in pending}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                future.result()
+                print(f"[OK] {job['id']}")
+            except Exception as e:
+                failed += 1
+                print(f"[BŁĄD] {job['id']}: {e}", file=sys.stderr)
+
+    print(f"Zakończono: {len(pending) - failed} udanych, {failed} nieudanych")
+    # Tryb liczony tak jak w analyze_pdf_with_openai - modele bez obsługi schematu generują w trybie "prompt"
+    for mode in sorted({"json_schema" if args.structured_output and supports_structured_output(job["model"]) else "prompt" for job in pending}):
+        stats = get_generation_stats().stats()[mode]
+        if stats["runs"]:
+            print(f"Ponowienia ({mode}): {stats['retry_rate']:.0%} generowań ({stats['retried_keys']} sekcji), zmarnowane tokeny: {stats['wasted_tokens']}")
+    limiter_stats = get_rate_limiter().stats()
+    if limiter_stats["rate_limited"] or limiter_stats["retries"]:
+        print(f"Limity API: {limiter_stats['rate_limited']} odpowiedzi 429, {limiter_stats['retries']} ponowień zapytań")
+    if args.metrics_out:
+        metrics = get_metrics()
+        write_atomic(os.path.abspath(args.metrics_out), metrics.to_prometheus() if args.metrics_out.endswith(".prom") else metrics.to_jsonl())
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
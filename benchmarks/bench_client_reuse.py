@@ -0,0 +1,74 @@
+# Sprawdzenie ponownego użycia połączeń przez współdzielonego klienta OpenAI
+# (mailgen.openai_clients): kolejne wywołania analyze_pdf_with_openai na lokalnym serwerze
+# testowym powinny nawiązać jedno połączenie TCP. Dla porównania mierzony jest też nowy
+# klient tworzony przy każdym zapytaniu (jedno połączenie na zapytanie).
+# Kod wyjścia 1, jeśli współdzielony klient nawiązał więcej niż jedno połączenie.
+#
+# Użycie (z katalogu głównego repozytorium):
+#   python benchmarks/bench_client_reuse.py --calls 10
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_openai import MockOpenAIServer  # noqa: E402
+
+BENCH_TEXT = "Rozdzial 1. Plan dnia i nawyki, ktore oszczedzaja czas. " * 200
+BENCH_VARIABLES = {"intro", "faq", "call_to_action"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Liczba połączeń TCP przy kolejnych wywołaniach generowania.")
+    parser.add_argument("--calls", type=int, default=10, help="Liczba kolejnych wywołań analyze_pdf_with_openai")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stały czas odpowiedzi serwera testowego (s)")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(latency=args.latency)
+    # Konfiguracja przed importem mailgen (katalog pamięci podręcznej, adres serwera, bez limitów)
+    os.environ["MAILGEN_CACHE_DIR"] = tempfile.mkdtemp(prefix="mailgen-bench-")
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ.setdefault("MAILGEN_RATE_LIMIT_RPM", "0")
+    os.environ.setdefault("MAILGEN_RATE_LIMIT_TPM", "0")
+
+    from openai import OpenAI
+
+    from mailgen.core import analyze_pdf_with_openai
+    from mailgen.openai_clients import close_openai_clients
+
+    try:
+        # Współdzielony klient - bez pamięci podręcznej odpowiedzi, więc każde wywołanie to zapytanie
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            analyze_pdf_with_openai(BENCH_TEXT, "Zapracowany menedżer", BENCH_VARIABLES, bypass_cache=True)
+        shared_time = time.perf_counter() - start
+        shared = (server.requests, server.connections)
+
+        # Nowy klient przy każdym zapytaniu
+        server.reset()
+        start = time.perf_counter()
+        for _ in range(args.calls):
+            with OpenAI(api_key="sk-bench") as client:
+                client.chat.completions.create(model="o4-mini", messages=[{"role": "user", "content": "Test"}])
+        fresh_time = time.perf_counter() - start
+        fresh = (server.requests, server.connections)
+    finally:
+        close_openai_clients()
+        server.close()
+
+    print(f"{'klient':<18} {'zapytania':>10} {'połączenia':>11} {'czas [s]':>9}")
+    print(f"{'współdzielony':<18} {shared[0]:>10} {shared[1]:>11} {shared_time:>9.3f}")
+    print(f"{'nowy na zapytanie':<18} {fresh[0]:>10} {fresh[1]:>11} {fresh_time:>9.3f}")
+
+    if shared[1] != 1:
+        print(f"BŁĄD: współdzielony klient nawiązał {shared[1]} połączeń (oczekiwane: 1)", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,98 @@
+# Benchmark harmonogramu zapytań (mailgen.rate_limiter) na lokalnym serwerze testowym,
+# który udaje API OpenAI i odpowiada 429 z nagłówkiem Retry-After po przekroczeniu limitu
+# zapytań na sekundę. Porównywane są: same ponowienia (bez kubełków i AIMD) oraz
+# harmonogram z limitem RPM i adaptacyjną liczbą jednoczesnych zapytań (także przy
+# zawyżonym limicie RPM, gdy tempo musi dobrać AIMD).
+#
+# Użycie (z katalogu głównego repozytorium):
+#   python benchmarks/bench_rate_limiter.py --requests 200 --threads 32 --quota-rps 20
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.mock_openai import MockOpenAIServer  # noqa: E402
+from mailgen.openai_clients import get_openai_client  # noqa: E402
+from mailgen.rate_limiter import RateLimitScheduler  # noqa: E402
+
+
+# Funkcja wysyłająca requests zapytań z threads wątków przez podany harmonogram
+def run_scenario(server, client, scheduler, requests, threads):
+    server.reset()
+    time.sleep(1.1)  # Puste okno limitu serwera przed każdym scenariuszem
+    remaining = iter(range(requests))
+    lock = threading.Lock()
+    results = {"ok": 0, "failed": 0}
+    messages = [{"role": "user", "content": "x" * 300}]
+
+    def worker():
+        while True:
+            with lock:
+                if next(remaining, None) is None:
+                    return
+            try:
+                scheduler.run(lambda: client.chat.completions.create(model="bench", messages=messages), 100)
+                outcome = "ok"
+            except Exception:
+                outcome = "failed"
+            with lock:
+                results[outcome] += 1
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        **results,
+        "rejected_429": server.rejected,
+        "seconds": round(elapsed, 2),
+        "throughput_rps": round(results["ok"] / elapsed, 2),
+        "quota_utilization": round(results["ok"] / elapsed / server.quota_rps, 2),
+        "scheduler": scheduler.stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark harmonogramu zapytań na serwerze zwracającym 429")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--quota-rps", type=int, default=20, help="Limit zapytań na sekundę serwera testowego")
+    parser.add_argument("--latency", type=float, default=0.2, help="Czas odpowiedzi serwera (s)")
+    args = parser.parse_args()
+
+    server = MockOpenAIServer(latency=args.latency, quota_rps=args.quota_rps)
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    client = get_openai_client("sk-bench", max_retries=0)
+
+    scenarios = {
+        # Same ponowienia: stała liczba jednoczesnych zapytań, bez kubełków
+        "retries_only": RateLimitScheduler(
+            requests_per_minute=0, tokens_per_minute=0, concurrency=args.threads,
+            min_concurrency=args.threads, max_concurrency=args.threads, max_retries=20, base_delay=0.5
+        ),
+        # Harmonogram: limit RPM nieco poniżej limitu serwera i AIMD
+        "scheduler": RateLimitScheduler(
+            requests_per_minute=int(args.quota_rps * 60 * 0.95), tokens_per_minute=0,
+            concurrency=args.threads, max_concurrency=args.threads, max_retries=20, base_delay=0.5
+        ),
+        # Limit RPM zawyżony dwukrotnie (np. błędna konfiguracja) - tempo dobiera AIMD
+        "scheduler_overestimated_rpm": RateLimitScheduler(
+            requests_per_minute=args.quota_rps * 60 * 2, tokens_per_minute=0,
+            concurrency=args.threads, max_concurrency=args.threads, max_retries=20, base_delay=0.5
+        ),
+    }
+    for name, scheduler in scenarios.items():
+        print(name, json.dumps(run_scenario(server, client, scheduler, args.requests, args.threads), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# Mikrobenchmark oczyszczania odpowiedzi modelu: dawna ścieżka (legacy_sanitize - odtworzona
+# wieloprzebiegowa normalizacja z osobnym usuwaniem tytułów sekcji) kontra jednoprzebiegowy
+# sanitize_generated_data z prekompilowanymi wzorcami, którego używa generowanie.
+#
+# Użycie (z katalogu głównego repozytorium):
+#   python benchmarks/bench_sanitizer.py --payloads 500 --field-kb 20
+
+import argparse
+import copy
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailgen.core import ALL_VARIABLES  # noqa: E402
+from mailgen.sanitizer import SECTION_TITLE_PATTERNS, sanitize_generated_data  # noqa: E402
+
+TITLE_PATTERNS = {key: pattern.pattern for key, pattern in SECTION_TITLE_PATTERNS.items()}
+
+
+# Dawna implementacja (normalize_json_data i usuwanie tytułów sprzed jednoprzebiegowego
+# oczyszczania): kilka przejść po słowniku, sklejanie +=, wzorce kompilowane w locie
+def legacy_sanitize(data):
+    if "contents" in data and isinstance(data["contents"], list):
+        html_content = "<ul>"
+        for item in data["contents"]:
+            if isinstance(item, dict) and "rozdzial" in item and "opis" in item:
+                html_content += f"<li><strong>{item['rozdzial']}</strong> - {item['opis']}</li>"
+            elif isinstance(item, str):
+                html_content += f"<li>{item}</li>"
+        html_content += "</ul>"
+        data["contents"] = html_content
+
+    if "faq" in data and isinstance(data["faq"], list):
+        html_content = ""
+        for item in data["faq"]:
+            if isinstance(item, dict) and "pytanie" in item and "odpowiedz" in item:
+                html_content += f"<strong>{item['pytanie']}</strong><br>{item['odpowiedz']}<br><br>"
+            elif isinstance(item, dict) and "question" in item and "answer" in item:
+                html_content += f"<strong>{item['question']}</strong><br>{item['answer']}<br><br>"
+        data["faq"] = html_content
+
+    for key in data:
+        if not isinstance(data[key], str):
+            if isinstance(data[key], list):
+                data[key] = ", ".join(str(item) for item in data[key])
+            else:
+                data[key] = str(data[key])
+
+    for key in data:
+        if isinstance(data[key], str):
+            data[key] = re.sub(r'<div\s+class="[^"]*">(.*?)</div>', r'\1', data[key], flags=re.DOTALL)
+            data[key] = re.sub(r'<div>(.*?)</div>', r'\1', data[key], flags=re.DOTALL)
+            data[key] = re.sub(r'<([a-z]+)\s+class="[^"]*"', r'<\1', data[key])
+
+    for key, pattern in TITLE_PATTERNS.items():
+        if key in data:
+            data[key] = re.sub(pattern, '', data[key], flags=re.IGNORECASE)
+    return data
+
+
+# Funkcja budująca duże, realistyczne odpowiedzi modelu (większość pól bez divów i klas)
+def build_payloads(count, field_kb):
+    paragraph = "<strong>Konkretna korzyść</strong> dla czytelnika, opisana <em>językiem rezultatów</em>. "
+    body = paragraph * max(1, field_kb * 1024 // len(paragraph))
+    payloads = []
+    for i in range(count):
+        payload = {name: f"{body} {i}" for name in ALL_VARIABLES}
+        payload["intro"] = f"Wstęp: {body}"
+        payload["example"] = f'<div class="quote">{body}</div>'
+        payload["contents"] = [{"rozdzial": f"Rozdział {n}", "opis": paragraph} for n in range(20)]
+        payload["faq"] = [{"pytanie": f"Pytanie {n}?", "odpowiedz": paragraph} for n in range(15)]
+        payloads.append(payload)
+    return payloads
+
+
+def measure(label, sanitize, payloads):
+    payloads = copy.deepcopy(payloads)
+    start = time.perf_counter()
+    results = [sanitize(payload) for payload in payloads]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<16} {elapsed * 1000:9.1f} ms  {len(payloads) / elapsed:9.0f} odpowiedzi/s")
+    return elapsed, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark oczyszczania odpowiedzi modelu.")
+    parser.add_argument("--payloads", type=int, default=500)
+    parser.add_argument("--field-kb", type=int, default=20)
+    args = parser.parse_args()
+
+    payloads = build_payloads(args.payloads, args.field_kb)
+    print(f"{args.payloads} odpowiedzi po {len(ALL_VARIABLES)} pól, około {args.field_kb} KB na pole")
+
+    legacy_time, legacy_results = measure("wieloprzebiegowo", legacy_sanitize, payloads)
+    single_time, single_results = measure("jednoprzebiegowo", sanitize_generated_data, payloads)
+
+    # Sprawdzenie, że obie ścieżki dają identyczny wynik
+    assert legacy_results == single_results
+    print(f"Przyspieszenie: {legacy_time / single_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
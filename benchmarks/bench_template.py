@@ -0,0 +1,110 @@
+# Porównanie przepustowości renderowania szablonu: dotychczasowa ścieżka re.sub
+# z funkcją zwrotną kontra szablon skompilowany (mailgen.template_engine), oraz zmiana
+# jednej sekcji: pełne renderowanie kontra wstawienie tylko zmienionego miejsca (RenderedTemplate).
+#
+# Użycie (z katalogu głównego repozytorium):
+#   python benchmarks/bench_template.py --payloads 2000 --sections 40
+
+import argparse
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from mailgen.core import ALL_VARIABLES  # noqa: E402
+from mailgen.template_engine import RenderedTemplate, compile_template  # noqa: E402
+
+
+# Dotychczasowa implementacja (re.sub + funkcja zwrotna przy każdym renderowaniu)
+def render_with_regex(html_content, json_data):
+    pattern = r'\{!\{\s*([a-zA-Z_]+)\s*\}!\}'
+
+    def replacer(match):
+        var_name = match.group(1)
+        if var_name in json_data:
+            return json_data[var_name]
+        else:
+            return f"[Zmienna {var_name} nie znaleziona]"
+
+    return re.sub(pattern, replacer, html_content)
+
+
+# Funkcja budująca syntetyczny szablon z podaną liczbą sekcji
+def build_template(sections):
+    names = list(ALL_VARIABLES)
+    blocks = []
+    for i in range(sections):
+        name = names[i % len(names)]
+        blocks.append(
+            f'<div class="section"><h2>Sekcja {i}</h2>'
+            f'<p style="margin: 0 0 1em 0; color: #333;">{{!{{ {name} }}!}}</p>'
+            f'<p>{"Stały tekst kreacji mailowej. " * 20}</p></div>'
+        )
+    return "<html><body>" + "\n".join(blocks) + "</body></html>"
+
+
+# Funkcja budująca zestaw różnych danych JSON do renderowania
+def build_payloads(count):
+    return [
+        {name: f"<strong>Treść {name} nr {i}</strong> " + "lorem ipsum " * 30 for name in ALL_VARIABLES}
+        for i in range(count)
+    ]
+
+
+def measure(label, render, template, payloads):
+    start = time.perf_counter()
+    for payload in payloads:
+        render(template, payload)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {elapsed * 1000:9.1f} ms  {len(payloads) / elapsed:10.0f} renderowań/s")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark renderowania szablonów HTML.")
+    parser.add_argument("--payloads", type=int, default=2000)
+    parser.add_argument("--sections", type=int, default=40)
+    args = parser.parse_args()
+
+    template = build_template(args.sections)
+    payloads = build_payloads(args.payloads)
+    compiled = compile_template(template)
+
+    # Sprawdzenie, że obie ścieżki dają identyczny wynik
+    assert render_with_regex(template, payloads[0]) == compiled.render(payloads[0])
+
+    print(f"Szablon: {len(template)} znaków, {args.sections} zmiennych, {args.payloads} zestawów danych")
+    regex_time = measure("re.sub", render_with_regex, template, payloads)
+    compiled_time = measure("skompilowany", lambda _, payload: compiled.render(payload), template, payloads)
+    print(f"Przyspieszenie: {regex_time / compiled_time:.1f}x")
+
+    # Edycja jednej sekcji (jak w edytorze): kolejne wersje treści zmiennej intro
+    data = dict(payloads[0])
+    edits = [f"Poprawiony wstęp nr {i}" for i in range(len(payloads))]
+
+    def render_full(_, text):
+        data["intro"] = text
+        compiled.render(data)
+
+    rendered = RenderedTemplate(compiled, data)
+
+    def render_slot(_, text):
+        data["intro"] = text
+        rendered.update(data)
+
+    # Pełny HTML składany za każdym razem (np. gdy wyświetlany jest kod kreacji)
+    def render_slot_html(_, text):
+        render_slot(_, text)
+        return rendered.html
+
+    full_time = measure("pełne", render_full, template, edits)
+    slot_time = measure("jedno miejsce", render_slot, template, edits)
+    measure("miejsce+HTML", render_slot_html, template, edits)
+    assert rendered.html == compiled.render(data)
+    print(f"Przyspieszenie przy zmianie jednej sekcji: {full_time / slot_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+# Lokalny serwer udający endpoint chat completions API OpenAI (do benchmarków offline).
+# Odpowiada po zadanym opóźnieniu (stałym oraz zależnym od liczby tokenów odpowiedzi)
+# gotowymi treściami: obiektem JSON z kluczami, o które prosi prompt lub schemat
+# response_format, albo zwykłym tekstem (np. streszczenia fragmentów e-booka).
+# Obsługuje odpowiedzi strumieniowe (stream=True) i opcjonalny limit zapytań na sekundę
+# (429 z nagłówkiem Retry-After) i liczy nawiązane połączenia TCP (ponowne użycie połączeń
+# keep-alive przez klienta). Treści są deterministyczne - kolejne uruchomienia
+# benchmarku wysyłają i otrzymują te same dane.
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RATE_LIMIT_ERROR = {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}}
+
+# Klucze wymienione w instrukcjach generowania ("1. intro - opis...") i ich długości
+PROMPT_KEY_PATTERN = re.compile(r"^\s*\d+\.\s+([a-z_]+)\s+-\s", re.MULTILINE)
+PROMPT_LENGTH_PATTERN = re.compile(r"^\s*-\s+([a-z_]+):\s+około\s+(\d+)\s+znaków", re.MULTILINE)
+
+FILLER_SENTENCES = (
+    "Dzięki prostym krokom z tego poradnika <strong>oszczędzasz czas</strong> każdego dnia.",
+    "Zobacz, jak 3 sprawdzone nawyki zmieniają sposób, w jaki planujesz pracę.",
+    "Każdy rozdział kończy się ćwiczeniem, które wykonasz w 15 minut.",
+    "Przykłady z praktyki pokazują, że <em>małe zmiany</em> dają trwałe efekty.",
+    "Nie potrzebujesz specjalistycznej wiedzy - wystarczy chęć do działania.",
+)
+
+# Domyślna długość odpowiedzi tekstowej (np. streszczenia fragmentu e-booka)
+TEXT_RESPONSE_CHARS = 800
+
+
+# Funkcja budująca deterministyczny tekst o zadanej długości (seed - przesunięcie zdań)
+def filler_text(length, seed=0):
+    parts = []
+    total = 0
+    i = seed
+    while total < length:
+        sentence = FILLER_SENTENCES[i % len(FILLER_SENTENCES)]
+        parts.append(sentence)
+        total += len(sentence) + 1
+        i += 1
+    return " ".join(parts)
+
+
+# Funkcja wyznaczająca klucze odpowiedzi JSON (None - odpowiedź tekstowa)
+def requested_keys(body):
+    response_format = body.get("response_format") or {}
+    schema = (response_format.get("json_schema") or {}).get("schema") or {}
+    if schema.get("properties"):
+        return list(schema["properties"])
+
+    last_message = (body.get("messages") or [{}])[-1].get("content") or ""
+    if isinstance(last_message, list):
+        last_message = " ".join(part.get("text", "") for part in last_message if isinstance(part, dict))
+    if "JSON" not in last_message:
+        return None
+    keys = list(dict.fromkeys(PROMPT_KEY_PATTERN.findall(last_message)))
+    return keys or None
+
+
+# Funkcja budująca treść odpowiedzi na zapytanie
+def build_content(body):
+    keys = requested_keys(body)
+    if keys is None:
+        return filler_text(TEXT_RESPONSE_CHARS)
+
+    last_message = str((body.get("messages") or [{}])[-1].get("content") or "")
+    lengths = {key: int(length) for key, length in PROMPT_LENGTH_PATTERN.findall(last_message)}
+    data = {key: filler_text(lengths.get(key, 300), seed=i) for i, key in enumerate(keys)}
+    return json.dumps(data, ensure_ascii=False)
+
+
+# Przybliżona liczba tokenów tekstu (serwer nie korzysta z tokenizera)
+def approximate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+class MockOpenAIServer:
+    # latency - stały czas odpowiedzi (s); tokens_per_second - tempo "generowania" odpowiedzi
+    # (0 - bez dodatkowego opóźnienia); quota_rps - limit zapytań na sekundę (0 - bez limitu)
+    def __init__(self, latency=0.0, tokens_per_second=0, quota_rps=0, chunk_chars=64):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.quota_rps = quota_rps
+        self.chunk_chars = chunk_chars
+        self.requests = 0
+        self.connections = 0
+        self.accepted = []
+        self.rejected = 0
+        self.last_json_content = None
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/v1"
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.connections = 0
+            self.accepted.clear()
+            self.rejected = 0
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    # Funkcja sprawdzająca limit zapytań w oknie przesuwnym jednej sekundy
+    def _admit(self):
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            if not self.quota_rps:
+                return True
+            recent = [t for t in self.accepted[-self.quota_rps:] if now - t < 1.0]
+            if len(recent) >= self.quota_rps:
+                self.rejected += 1
+                return False
+            self.accepted.append(now)
+            return True
+
+    def _respond(self, body):
+        content = build_content(body)
+        if content.startswith("{"):
+            with self._lock:
+                self.last_json_content = content
+        prompt_tokens = approximate_tokens(json.dumps(body.get("messages") or [], ensure_ascii=False))
+        completion_tokens = approximate_tokens(content)
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        }
+        delay = self.latency
+        if self.tokens_per_second:
+            delay += completion_tokens / self.tokens_per_second
+        return content, usage, delay
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            # Wywoływane raz dla każdego przyjętego połączenia (kolejne zapytania keep-alive
+            # korzystają z tego samego obiektu obsługi)
+            def setup(self):
+                super().setup()
+                with server._lock:
+                    server.connections += 1
+
+            def _send_json(self, status, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _write_chunk(self, payload):
+                data = f"data: {payload}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+            def _stream(self, model, content, usage, delay):
+                self.send_response(200)
+                self.send_header("content-type", "text/event-stream")
+                self.send_header("transfer-encoding", "chunked")
+                self.end_headers()
+
+                pieces = [content[i:i + server.chunk_chars] for i in range(0, len(content), server.chunk_chars)] or [""]
+                pause = delay / len(pieces)
+                base = {"id": "bench", "object": "chat.completion.chunk", "created": 0, "model": model}
+                for piece in pieces:
+                    time.sleep(pause)
+                    chunk = {**base, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self._write_chunk(json.dumps(chunk, ensure_ascii=False))
+                self._write_chunk(json.dumps({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}))
+                self._write_chunk(json.dumps({**base, "choices": [], "usage": usage}))
+                self._write_chunk("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("content-length", 0))) or b"{}")
+                if not server._admit():
+                    self._send_json(429, RATE_LIMIT_ERROR, {"retry-after": "1"})
+                    return
+
+                model = body.get("model", "bench")
+                content, usage, delay = server._respond(body)
+                if body.get("stream"):
+                    self._stream(model, content, usage, delay)
+                    return
+
+                time.sleep(delay)
+                self._send_json(200, {
+                    "id": "bench",
+                    "object": "chat.completion",
+                    "created": 0,
+                    "model": model,
+                    "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                    "usage": usage,
+                })
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
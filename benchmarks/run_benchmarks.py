@@ -0,0 +1,335 @@
+# Powtarzalny benchmark całego przepływu generowania offline: syntetyczne e-booki PDF
+# (benchmarks/synthetic_pdf.py) i lokalny serwer udający API OpenAI (benchmarks/mock_openai.py)
+# z konfigurowalnym opóźnieniem i gotowymi odpowiedziami JSON.
+#
+# Mierzone są:
+# - cały przepływ read_pdf -> extract_variables_from_template -> analyze_pdf_with_openai
+#   (z oczyszczaniem odpowiedzi sanitize_generated_data) -> replace_variables_in_html,
+#   "na zimno" (puste pamięci podręczne)
+#   i "na ciepło" (tekst PDF, streszczenie i odpowiedź modelu z pamięci podręcznej),
+# - każdy etap osobno (dla każdej liczby stron lub - etapy niezależne od e-booka - raz).
+#
+# Wyniki (mediana, p95 i minimum w ms) zapisywane są w pliku JSON razem z opisem środowiska
+# i konfiguracji. Z opcją --compare wyniki porównywane są z wcześniejszym plikiem; wzrost
+# mediany ponad próg jest zgłaszany jako regresja (kod wyjścia 1).
+#
+# Użycie (z katalogu głównego repozytorium):
+#   python benchmarks/run_benchmarks.py --pages 10,50,100,250,500 --repeats 5
+#   python benchmarks/run_benchmarks.py --output nowy.json --compare bazowy.json --threshold 0.1
+
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.mock_openai import MockOpenAIServer  # noqa: E402
+from benchmarks.synthetic_pdf import make_ebook_pdf  # noqa: E402
+
+# Uwaga: moduły mailgen odczytują konfigurację ze zmiennych środowiskowych przy imporcie,
+# dlatego importowane są dopiero w configure_environment (po ustawieniu katalogu
+# pamięci podręcznej i adresu serwera testowego).
+
+DEFAULT_PAGES = "10,50,100,250,500"
+
+RESULTS_DIR = os.path.join(REPO_ROOT, "benchmarks", "results")
+
+BENCH_PERSONA = "Właścicielka małej firmy usługowej, 35-45 lat, chce lepiej planować czas i zwiększyć sprzedaż bez dużego budżetu."
+
+# Minimalny czas jednej serii wywołań szybkich etapów (liczba wywołań dobierana automatycznie)
+MIN_BATCH_SECONDS = 0.05
+
+# Zmiany mediany poniżej tej wartości (ms) nie są zgłaszane jako regresje (szum pomiaru)
+MIN_REGRESSION_DELTA_MS = 1.0
+
+
+# Funkcja ustawiająca środowisko (tymczasowy katalog pamięci podręcznej, serwer testowy,
+# brak limitów zapytań) i importująca moduły aplikacji
+def configure_environment(cache_dir, base_url):
+    os.environ["MAILGEN_CACHE_DIR"] = cache_dir
+    os.environ["OPENAI_BASE_URL"] = base_url
+    os.environ["OPENAI_API_KEY"] = "sk-bench"
+    os.environ.setdefault("MAILGEN_RATE_LIMIT_RPM", "0")
+    os.environ.setdefault("MAILGEN_RATE_LIMIT_TPM", "0")
+
+    from mailgen import core
+    return core
+
+
+# Funkcja budująca szablon kreacji mailowej z podaną liczbą zmiennych
+def build_template(variable_names):
+    blocks = [
+        f'<tr><td style="padding: 16px; font-family: Arial, sans-serif;">{{!{{ {name} }}!}}</td></tr>'
+        for name in variable_names
+    ]
+    return '<html><body><table width="600" align="center">\n' + "\n".join(blocks) + "\n</table></body></html>"
+
+
+# Funkcja czyszcząca pamięci podręczne aplikacji (pomiar "na zimno").
+# Odpowiedzi modelu omijane są przez bypass_cache, więc ich baza nie jest czyszczona.
+def clear_caches(core, pdf_only=False):
+    caches = [core.get_pdf_cache()]
+    if not pdf_only:
+        caches += [core.get_digest_cache(), core.get_token_cache(), core.get_retrieval_cache()]
+        core.get_retrieval_index.cache_clear()
+        core.compile_template.cache_clear()
+    for cache in caches:
+        for name in os.listdir(cache.directory):
+            os.remove(os.path.join(cache.directory, name))
+
+
+# Funkcja mierząca czas wywołań func (w sekundach na wywołanie).
+# setup wykonywane jest przed każdym pomiarem (poza mierzonym czasem); batch - szybkie
+# etapy mierzone są seriami wywołań o łącznym czasie co najmniej MIN_BATCH_SECONDS.
+def measure(func, repeats, setup=None, batch=False):
+    number = 1
+    if batch:
+        while True:
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            if time.perf_counter() - start >= MIN_BATCH_SECONDS:
+                break
+            number *= 2
+
+    timings = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - start) / number)
+    return timings, number
+
+
+# Funkcja zwracająca statystyki pomiarów (w milisekundach)
+def summarize(timings, number):
+    ordered = sorted(timings)
+    return {
+        "median_ms": round(statistics.median(ordered) * 1000, 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+        "min_ms": round(ordered[0] * 1000, 3),
+        "runs": len(ordered),
+        "calls_per_run": number,
+    }
+
+
+class FlowBenchmark:
+    def __init__(self, core, template, model, structured_output, stream):
+        self.core = core
+        self.template = template
+        self.model = model
+        self.structured_output = structured_output
+        self.stream = stream
+
+    def analyze(self, pdf_text, required_variables, bypass_cache):
+        return self.core.analyze_pdf_with_openai(
+            pdf_text,
+            BENCH_PERSONA,
+            required_variables,
+            model=self.model,
+            lengths={var: 300 for var in required_variables},
+            bypass_cache=bypass_cache,
+            structured_output=self.structured_output,
+            on_section=(lambda name, content: None) if self.stream else None
+        )
+
+    # Cały przepływ: PDF -> zmienne szablonu -> generowanie (z oczyszczaniem odpowiedzi) -> HTML
+    def end_to_end(self, pdf_bytes, bypass_cache):
+        pdf_text = self.core.read_pdf(pdf_bytes)
+        required_variables = self.core.extract_variables_from_template(self.template)
+        result = self.analyze(pdf_text, required_variables, bypass_cache)
+        return self.core.replace_variables_in_html(self.template, result.data)
+
+
+# Funkcja mierząca przepływ i etapy zależne od e-booka dla jednej liczby stron
+def run_pages(bench, server, pages, repeats, seed):
+    core = bench.core
+    pdf_bytes = make_ebook_pdf(pages, seed=seed)
+    required_variables = core.extract_variables_from_template(bench.template)
+
+    # Sprawdzenie poprawności przed pomiarem: wszystkie zmienne podstawione
+    clear_caches(core)
+    html = bench.end_to_end(pdf_bytes, bypass_cache=True)
+    if "[Zmienna" in html:
+        raise SystemExit(f"Niepełny wynik dla {pages} stron - sprawdź odpowiedzi serwera testowego.")
+    pdf_text = core.read_pdf(pdf_bytes)
+    strategy = core.plan_ebook_context(pdf_text, bench.model).strategy
+
+    def cold():
+        clear_caches(core)
+
+    cases = {
+        "end_to_end_cold": (lambda: bench.end_to_end(pdf_bytes, bypass_cache=True), cold, False),
+        "end_to_end_warm": (lambda: bench.end_to_end(pdf_bytes, bypass_cache=False), None, False),
+        "read_pdf_cold": (lambda: core.read_pdf(pdf_bytes), lambda: clear_caches(core, pdf_only=True), False),
+        "read_pdf_warm": (lambda: core.read_pdf(pdf_bytes), None, True),
+        "analyze_pdf_with_openai_cold": (lambda: bench.analyze(pdf_text, required_variables, True), cold, False),
+        "analyze_pdf_with_openai_warm": (lambda: bench.analyze(pdf_text, required_variables, False), None, False),
+    }
+
+    rows = []
+    for stage, (func, setup, batch) in cases.items():
+        server.reset()
+        timings, number = measure(func, repeats, setup, batch)
+        rows.append({
+            "name": f"pages={pages}/{stage}",
+            "pages": pages,
+            "stage": stage,
+            **summarize(timings, number),
+            "mock_requests_per_run": round(server.requests / (repeats * number), 2),
+        })
+    info = {"pages": pages, "pdf_bytes": len(pdf_bytes), "text_chars": len(pdf_text), "strategy": strategy}
+    return rows, info
+
+
+# Funkcja mierząca etapy niezależne od e-booka (szablon i dane odpowiedzi modelu)
+def run_payload_stages(bench, server, repeats):
+    from mailgen.sanitizer import sanitize_generated_data
+
+    core = bench.core
+    raw_data = json.loads(server.last_json_content)
+    data = sanitize_generated_data(dict(raw_data))
+
+    cases = {
+        "extract_variables_from_template_cold": (
+            lambda: core.extract_variables_from_template(bench.template), core.compile_template.cache_clear, False
+        ),
+        "extract_variables_from_template_warm": (lambda: core.extract_variables_from_template(bench.template), None, True),
+        "sanitize_generated_data": (lambda: sanitize_generated_data(dict(raw_data)), None, True),
+        "replace_variables_in_html": (lambda: core.replace_variables_in_html(bench.template, data), None, True),
+    }
+
+    rows = []
+    for stage, (func, setup, batch) in cases.items():
+        timings, number = measure(func, repeats, setup, batch)
+        rows.append({"name": f"payload/{stage}", "pages": None, "stage": stage, **summarize(timings, number)})
+    return rows
+
+
+# Funkcja zwracająca skrót bieżącego commita (z oznaczeniem niezatwierdzonych zmian)
+def git_revision():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--untracked-files=no"], cwd=REPO_ROOT, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+# Funkcja porównująca wyniki z plikiem bazowym; zwraca listę regresji
+def compare_results(current, baseline, threshold):
+    baseline_rows = {row["name"]: row for row in baseline["results"]}
+    regressions = []
+    print(f"\nPorównanie z {baseline['meta'].get('git_revision')} ({baseline['meta'].get('timestamp')}):")
+    for row in current["results"]:
+        base = baseline_rows.get(row["name"])
+        if base is None or not base["median_ms"]:
+            continue
+        ratio = row["median_ms"] / base["median_ms"]
+        regression = ratio > 1 + threshold and row["median_ms"] - base["median_ms"] > MIN_REGRESSION_DELTA_MS
+        marker = "  REGRESJA" if regression else ""
+        print(f"  {row['name']:<50} {base['median_ms']:>11.3f} -> {row['median_ms']:>11.3f} ms  ({ratio - 1:+.1%}){marker}")
+        if regression:
+            regressions.append(row["name"])
+
+    for key in ("model", "latency", "tokens_per_second", "structured_output", "stream"):
+        if baseline["meta"]["config"].get(key) != current["meta"]["config"].get(key):
+            print(f"  Uwaga: inna konfiguracja ({key}) - wyniki mogą nie być porównywalne.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark przepływu generowania na syntetycznych PDF i serwerze testowym.")
+    parser.add_argument("--pages", default=DEFAULT_PAGES, help="Liczby stron e-booków (oddzielone przecinkami)")
+    parser.add_argument("--repeats", type=int, default=5, help="Liczba pomiarów każdego etapu")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stały czas odpowiedzi serwera testowego (s)")
+    parser.add_argument("--tokens-per-second", type=float, default=0, help="Tempo generowania odpowiedzi serwera (0 - bez opóźnienia)")
+    parser.add_argument("--model", default="o4-mini")
+    parser.add_argument("--sections", type=int, default=8, help="Liczba zmiennych w szablonie")
+    parser.add_argument("--structured-output", action="store_true")
+    parser.add_argument("--stream", action="store_true", help="Odpowiedzi strumieniowe (jak w interfejsie)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Plik wyników JSON (domyślnie benchmarks/results/<commit>-<czas>.json)")
+    parser.add_argument("--compare", help="Plik wyników bazowych do porównania")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Dopuszczalny wzrost mediany (ułamek)")
+    args = parser.parse_args()
+
+    page_counts = [int(value) for value in args.pages.split(",") if value.strip()]
+    server = MockOpenAIServer(latency=args.latency, tokens_per_second=args.tokens_per_second)
+
+    with tempfile.TemporaryDirectory(prefix="mailgen-bench-") as cache_dir:
+        core = configure_environment(cache_dir, server.base_url)
+        template = build_template(list(core.ALL_VARIABLES)[:args.sections])
+        bench = FlowBenchmark(core, template, args.model, args.structured_output, args.stream)
+
+        results = []
+        documents = []
+        for pages in page_counts:
+            rows, info = run_pages(bench, server, pages, args.repeats, args.seed)
+            results += rows
+            documents.append(info)
+            for row in rows:
+                print(f"{row['name']:<50} mediana {row['median_ms']:>11.3f} ms   p95 {row['p95_ms']:>11.3f} ms")
+        for row in run_payload_stages(bench, server, args.repeats):
+            results.append(row)
+            print(f"{row['name']:<50} mediana {row['median_ms']:>11.3f} ms   p95 {row['p95_ms']:>11.3f} ms")
+    server.close()
+
+    timestamp = datetime.datetime.now(datetime.timezone.utc)
+    report = {
+        "meta": {
+            "git_revision": git_revision(),
+            "timestamp": timestamp.isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "config": {
+                "pages": page_counts,
+                "repeats": args.repeats,
+                "latency": args.latency,
+                "tokens_per_second": args.tokens_per_second,
+                "model": args.model,
+                "sections": args.sections,
+                "structured_output": args.structured_output,
+                "stream": args.stream,
+                "seed": args.seed,
+            },
+            "documents": documents,
+        },
+        "results": results,
+    }
+
+    output = args.output or os.path.join(
+        RESULTS_DIR, f"{report['meta']['git_revision'] or 'bench'}-{timestamp:%Y%m%d-%H%M%S}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\nWyniki zapisane w {output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_results(report, baseline, args.threshold)
+        if regressions:
+            print(f"\nRegresje ({len(regressions)}): {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nBrak regresji.")
+
+
+if __name__ == "__main__":
+    main()
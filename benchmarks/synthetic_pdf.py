@@ -0,0 +1,74 @@
+# Generator syntetycznych e-booków PDF do benchmarków (bez zależności zewnętrznych).
+# Tekst stron jest deterministyczny (ziarno losowania), więc ten sam zestaw parametrów
+# daje zawsze identyczny plik - a wyniki kolejnych uruchomień benchmarku są porównywalne.
+# Strony mają nagłówki rozdziałów i akapity o objętości zbliżonej do typowego e-booka.
+
+import random
+
+# Słownictwo bez polskich znaków - standardowa czcionka Helvetica (WinAnsi) ich nie obsługuje
+WORDS = (
+    "czas praca plan cel nawyk zdrowie energia dzien tydzien miesiac rok zespol klient "
+    "sprzedaz marketing strategia budzet wynik analiza dane proces projekt zadanie lista "
+    "metoda przyklad pytanie odpowiedz problem rozwiazanie krok etap decyzja priorytet "
+    "motywacja rozwoj wiedza umiejetnosc praktyka cwiczenie test pomiar efekt zmiana "
+    "szybko prosto skutecznie regularnie codziennie zawsze czesto rzadko dobrze lepiej "
+    "warto trzeba mozna nalezy pamietaj sprawdz zapisz zaplanuj porownaj wybierz zacznij"
+).split()
+
+LINES_PER_PAGE = 32
+WORDS_PER_LINE = 10
+PAGES_PER_CHAPTER = 12
+
+
+# Funkcja zabezpieczająca tekst przed znakami specjalnymi literału PDF
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+# Funkcja generująca wiersze tekstu kolejnych stron
+def generate_pages(pages, seed=0, lines_per_page=LINES_PER_PAGE):
+    rng = random.Random(seed)
+    result = []
+    for page in range(pages):
+        lines = []
+        if page % PAGES_PER_CHAPTER == 0:
+            chapter = page // PAGES_PER_CHAPTER + 1
+            lines.append(f"Rozdzial {chapter}. {' '.join(rng.choices(WORDS, k=3)).capitalize()}")
+        while len(lines) < lines_per_page:
+            words = rng.choices(WORDS, k=WORDS_PER_LINE)
+            if rng.random() < 0.2:
+                words.insert(rng.randrange(len(words)), f"{rng.randint(2, 95)}%")
+            line = " ".join(words).capitalize()
+            lines.append(line + ("." if rng.random() < 0.5 else ","))
+        lines.append(f"- {page + 1} -")
+        result.append(lines)
+    return result
+
+
+# Funkcja budująca plik PDF (bajty) o podanej liczbie stron
+def make_ebook_pdf(pages, seed=0, lines_per_page=LINES_PER_PAGE):
+    page_lines = generate_pages(pages, seed, lines_per_page)
+    count = len(page_lines)
+    kids = " ".join(f"{3 + i * 2} 0 R" for i in range(count))
+    objects = [
+        "<< /Type /Catalog /Pages 2 0 R >>",
+        f"<< /Type /Pages /Kids [{kids}] /Count {count} "
+        "/Resources << /Font << /F1 << /Type /Font /Subtype /Type1 /BaseFont /Helvetica "
+        "/Encoding /WinAnsiEncoding >> >> >> >>",
+    ]
+    for i, lines in enumerate(page_lines):
+        text = " T* ".join(f"({_escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 56 780 Td {text} ET"
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents {4 + i * 2} 0 R >>")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, obj in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += f"{number} 0 obj\n{obj}\nendobj\n".encode("latin-1")
+    xref_offset = len(output)
+    output += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1")
+    output += "".join(f"{offset:010d} 00000 n \n" for offset in offsets).encode("latin-1")
+    output += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n".encode("latin-1")
+    return bytes(output)
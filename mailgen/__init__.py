@@ -0,0 +1 @@
+# Pakiet z logiką generatora treści marketingowych (bez zależności od interfejsu Streamlit)
@@ -0,0 +1,823 @@
+import asyncio
+import functools
+import json
+import logging
+import os
+import re
+from dataclasses import dataclass, field
+
+from mailgen.digest import DigestCache, get_ebook_context
+from mailgen.errors import (
+    GenerationCancelledError,
+    GenerationError,
+    MailGenError,
+    MissingApiKeyError,
+    PdfReadError,
+    ResponseParseError,
+    ResponseValidationError,
+)
+from mailgen.openai_clients import get_async_openai_client, get_openai_client
+from mailgen.pdf_cache import PdfTextCache
+from mailgen.prompts import EBOOK_SYSTEM_PROMPT, build_messages, extract_usage
+from mailgen.rate_limiter import estimate_request_tokens, get_rate_limiter
+from mailgen.json_stream import IncrementalJsonObjectParser
+from mailgen.metrics import get_metrics, timed
+from mailgen.response_cache import ResponseCache, create_completion, stream_completion
+from mailgen.retrieval import RetrievalIndexCache, load_or_build_index, select_relevant_text, should_retrieve
+from mailgen.sanitizer import sanitize_field, sanitize_generated_data, strip_section_title
+from mailgen.settings import (
+    CACHE_DIR,
+    DIGEST_CACHE_MAX_BYTES,
+    PDF_CACHE_MAX_BYTES,
+    RETRIEVAL_CACHE_MAX_BYTES,
+    TOKEN_CACHE_MAX_BYTES,
+)
+from mailgen.structured_output import (
+    GenerationStats,
+    build_response_format,
+    estimate_wasted_tokens,
+    find_invalid_keys,
+    supports_structured_output,
+)
+from mailgen.template_engine import RenderedTemplate, compile_template
+from mailgen.token_budget import TokenCountCache, count_document_tokens, count_tokens, estimate_output_tokens, plan_context
+
+# Logika generatora niezależna od Streamlit: funkcje zgłaszają wyjątki z mailgen.errors
+# i zwracają wyniki w postaci klas danych, dzięki czemu można je wywoływać z wątków,
+# procesów roboczych i skryptów wsadowych.
+
+logger = logging.getLogger(__name__)
+
+# Wzór do wydobycia obiektu JSON z odpowiedzi modelu
+JSON_OBJECT_PATTERN = re.compile(r'({[\s\S]*})')
+
+# Lista wszystkich dostępnych zmiennych z opisami
+ALL_VARIABLES = {
+    "intro": "Wstęp — akapit otwierający, prezentuje kontekst sytuacyjny odbiorcy i główny problem, bez podawania nazwy e-booka ani zachęty do zakupu",
+
+    "why_created": "Cel powstania e-booka — precyzyjne wskazanie luki rynkowej lub potrzeby edukacyjnej, wyjaśnienie motywacji autora lub zespołu, bez użycia pierwszej osoby liczby pojedynczej",
+
+    "contents": "Zawartość e-booka — szczegółowy spis kluczowych rozdziałów, modułów, dodatków lub checklist wraz z krótkimi opisami, umożliwiający szybkie zrozumienie struktury materiału",
+
+    "problems_solved": "Problemy rozwiązane — jednoznaczna lista bolączek eliminowanych dzięki treści, sformułowana w języku korzyści mierzalnych dla odbiorcy",
+
+    "target_audience": "Grupa docelowa — jasne wskazanie, kto skorzysta z publikacji oraz komu może ona nie przynieść wartości, z podaniem konkretnych cech lub poziomu zaawansowania",
+
+    "example": "Przykład z e-booka — cytowany fragment, kod, tabela lub ilustracja prezentująca styl oraz praktyczną wartość materiału",
+
+    "call_to_action": "Wezwanie do działania — pojedynczy, zwięzły komunikat w trybie rozkazującym, zachęcający do pobrania lub zakupu, ewentualnie z elementem limitu czasowego lub ilościowego",
+
+    "key_benefits": "Główne korzyści — uporządkowany zbiór konkretnych efektów, jakie czytelnik osiągnie po wdrożeniu wiedzy, pisany językiem rezultatów, nie cech produktu",
+
+    "guarantee": "Gwarancja jakości — jednoznaczna deklaracja dotycząca wartości merytorycznej lub możliwości zwrotu, eliminująca ryzyko po stronie klienta",
+
+    "testimonials": "Opinie — autentyczne cytaty czytelników lub ekspertów, opatrzone imieniem, stanowiskiem lub firmą i odnoszące się bezpośrednio do efektów osiągniętych dzięki e-bookowi",
+
+    "value_summary": "Podsumowanie wartości — syntetyczne zestawienie najważniejszych punktów i korzyści zamykające treść oferty, przygotowujące odbiorcę do finalnego CTA",
+
+    "faq": "FAQ — lista najczęściej stawianych pytań z klarownymi odpowiedziami rozwiewającymi wątpliwości dotyczące zawartości, formatu i procesu zakupu",
+
+    "urgency": "Pilność — wyraźna informacja o ograniczeniu czasowym, ilościowym lub cenowym, budująca presję szybkiej decyzji bez użycia scenariuszy straszenia",
+
+    "comparison": "Porównanie — przejrzyste zestawienie przewag e-booka nad alternatywnymi rozwiązaniami, wskazujące unikalne cechy oraz mierzalne różnice",
+
+    "transformation_story": "Historia transformacji — opis stanu przed oraz po zastosowaniu wiedzy z e-booka z uwzględnieniem konkretnych metryk lub rezultatów",
+
+    "author_credentials": "Kwalifikacje autora — fakty potwierdzające kompetencje, takie jak doświadczenie branżowe, liczba zrealizowanych projektów lub uzyskane certyfikaty"
+}
+
+# Domyślne długości zmiennych (w znakach)
+DEFAULT_VAR_LENGTHS = {
+    # Podstawowe zmienne
+    "intro": 300,
+    "why_created": 300,
+    "contents": 400,
+    "problems_solved": 350,
+    "target_audience": 300,
+    "example": 300,
+    
+    # Korzyści i wartość
+    "key_benefits": 400,
+    "guarantee": 300,
+    "value_summary": 300,
+    "comparison": 400,
+    
+    # Elementy perswazyjne
+    "call_to_action": 250,
+    "testimonials": 500,
+    "urgency": 250,
+    "transformation_story": 400,
+    
+    # Dodatkowe elementy
+    "faq": 800,
+    "author_credentials": 300
+}
+
+
+# Wynik generowania treści dla wszystkich wymaganych zmiennych
+# (retried_keys - klucze wygenerowane ponownie, bo zabrakło ich w pierwszej odpowiedzi)
+@dataclass
+class GenerationResult:
+    data: dict
+    usage: list = field(default_factory=list)
+    retried_keys: list = field(default_factory=list)
+
+
+# Wynik generowania pojedynczej sekcji
+@dataclass
+class SectionResult:
+    section_name: str
+    content: str
+    usage: list = field(default_factory=list)
+
+
+# Wynik równoległej regeneracji wielu sekcji (udane sekcje i błędy osobno)
+@dataclass
+class BatchRegenerationResult:
+    sections: dict = field(default_factory=dict)
+    errors: dict = field(default_factory=dict)
+
+    @property
+    def usage(self):
+        return [entry for result in self.sections.values() for entry in result.usage]
+
+
+# Pamięć podręczna tekstu PDF współdzielona w obrębie procesu
+@functools.lru_cache(maxsize=None)
+def get_pdf_cache():
+    return PdfTextCache(os.path.join(CACHE_DIR, "pdf_text"), PDF_CACHE_MAX_BYTES)
+
+
+# Pamięć podręczna odpowiedzi modelu (SQLite) - identyczne zapytania nie są wysyłane ponownie
+@functools.lru_cache(maxsize=None)
+def get_response_cache():
+    return ResponseCache(os.path.join(CACHE_DIR, "responses.sqlite3"))
+
+
+# Pamięć podręczna streszczeń dużych e-booków (wspólna dla generowania i regeneracji sekcji)
+@functools.lru_cache(maxsize=None)
+def get_digest_cache():
+    return DigestCache(os.path.join(CACHE_DIR, "digests"), DIGEST_CACHE_MAX_BYTES)
+
+
+# Pamięć podręczna liczby tokenów dokumentów (klucz to skrót treści i tokenizer)
+@functools.lru_cache(maxsize=None)
+def get_token_cache():
+    return TokenCountCache(os.path.join(CACHE_DIR, "token_counts"), TOKEN_CACHE_MAX_BYTES)
+
+
+# Pamięć podręczna indeksów fragmentów e-booków (dobór fragmentów przy regeneracji sekcji)
+@functools.lru_cache(maxsize=None)
+def get_retrieval_cache():
+    return RetrievalIndexCache(os.path.join(CACHE_DIR, "retrieval"), RETRIEVAL_CACHE_MAX_BYTES)
+
+
+# Indeks fragmentów e-booka - wczytany lub zbudowany raz i przechowywany w pamięci procesu
+@functools.lru_cache(maxsize=4)
+def get_retrieval_index(pdf_text):
+    return load_or_build_index(pdf_text, get_retrieval_cache())
+
+
+# Liczniki ponownych generowań i zmarnowanych tokenów (wspólne w obrębie procesu)
+@functools.lru_cache(maxsize=None)
+def get_generation_stats():
+    return GenerationStats()
+
+
+# Funkcja zwracająca klucz API: przekazany jawnie lub ze zmiennej środowiskowej
+def resolve_api_key(api_key=None):
+    api_key = api_key or os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        raise MissingApiKeyError("Brak klucza API OpenAI. Ustaw zmienną środowiskową OPENAI_API_KEY lub dodaj ją do sekretu Streamlit.")
+    return api_key
+
+
+# Funkcja do zamiany zużycia tokenów z odpowiedzi na wpis z etykietą
+def _usage_entries(label, usage):
+    return [{"label": label, **usage}] if usage else []
+
+
+# Funkcja do odczytywania zawartości pliku PDF (bajty lub obiekt plikowy)
+# (on_page jest wywoływane po zdekodowaniu każdej strony, np. do aktualizacji postępu;
+# token_counter - mailgen.token_budget.PageTokenCounter liczący tokeny stron w trakcie odczytu)
+@timed("read_pdf")
+def read_pdf(pdf_source, max_pages=None, max_chars=None, on_page=None, token_counter=None):
+    # Import na żądanie - pypdf potrzebny jest tylko przy faktycznym odczycie
+    from mailgen.pdf_extract import extract_pdf_text
+
+    try:
+        if isinstance(pdf_source, (bytes, bytearray)):
+            pdf_bytes = bytes(pdf_source)
+        elif hasattr(pdf_source, "getvalue"):
+            pdf_bytes = pdf_source.getvalue()
+        else:
+            pdf_bytes = pdf_source.read()
+
+        # Sprawdź, czy ten sam plik nie był już wcześniej przetwarzany
+        pdf_cache = get_pdf_cache()
+        cache_key = pdf_cache.make_key(pdf_bytes, variant=f"pages={max_pages or 0};chars={max_chars or 0}")
+        cached_text = pdf_cache.get(cache_key)
+        if cached_text is not None:
+            return cached_text
+
+        # Tokeny strony liczone są od razu, zanim zostanie odczytana następna
+        def page_callback(page_num, page_count, page_text):
+            if token_counter is not None:
+                token_counter.add(page_text)
+            if on_page is not None:
+                on_page(page_num, page_count, page_text)
+
+        # Odczytaj tekst kolejnych stron (duże dokumenty w puli procesów)
+        pdf_text = extract_pdf_text(pdf_bytes, max_pages=max_pages, max_chars=max_chars, on_page=page_callback)
+
+        # Plan zapytania (plan_ebook_context) skorzysta z policzonej już sumy tokenów
+        if token_counter is not None:
+            token_counter.store(pdf_text, get_token_cache())
+        pdf_cache.put(cache_key, pdf_text)
+        return pdf_text
+    except Exception as e:
+        raise PdfReadError(f"Błąd podczas odczytywania pliku PDF: {e}") from e
+
+# Funkcja do zaplanowania postaci e-booka w prompcie (pełny tekst, przycięty lub streszczenie)
+# na podstawie liczby tokenów e-booka i instrukcji, okna kontekstu modelu
+# oraz rezerwy na odpowiedź wynikającej z długości sekcji
+def plan_ebook_context(pdf_text, model, instructions="", lengths=None):
+    document_tokens = count_document_tokens(pdf_text, model, get_token_cache())
+    prompt_tokens = count_tokens(EBOOK_SYSTEM_PROMPT + instructions, model)
+    output_tokens = estimate_output_tokens(lengths or {}, model)
+    return plan_context(len(pdf_text), document_tokens, model, prompt_tokens, output_tokens)
+
+
+# Funkcja do analizy szablonu HTML i znalezienia używanych zmiennych
+def extract_variables_from_template(html_template):
+    # Zbiór zmiennych wyznaczany przy kompilacji szablonu (eliminując duplikaty)
+    return set(compile_template(html_template).variables)
+
+
+# Funkcja do dynamicznego tworzenia schematu JSON na podstawie wymaganych zmiennych
+def create_dynamic_json_schema(required_variables):
+    schema = {
+        "type": "object",
+        "required": list(required_variables),
+        "properties": {}
+    }
+    
+    # Dodanie właściwości dla każdej wymaganej zmiennej
+    for var in required_variables:
+        if var in ALL_VARIABLES:
+            schema["properties"][var] = {
+                "type": "string", 
+                "description": ALL_VARIABLES[var]
+            }
+    
+    return schema
+
+
+# Funkcja do generowania sekcji dla kwalifikacji autora
+# (przy błędzie API zwraca oryginalne informacje o autorze)
+def generate_author_credentials(author_info, model="o4-mini", api_key=None):
+    if not author_info or author_info.strip() == "":
+        return None
+
+    try:
+        api_key = resolve_api_key(api_key)
+    except MissingApiKeyError:
+        return author_info  # Fallback do oryginalnych danych
+
+    try:
+        # Współdzielony klient OpenAI (pula połączeń utrzymywana między wywołaniami)
+        client = get_openai_client(api_key)
+
+        # Prompt dla AI do przetworzenia informacji o autorze
+        prompt = f"""
+        Na podstawie poniższych surowych informacji o autorze, stwórz profesjonalny, 
+        angażujący i zwięzły biogram podkreślający jego kompetencje, doświadczenie i autorytet. 
+        Napisz w trzeciej osobie. Użyj maksymalnie 3-4 zdań.
+        
+        INFORMACJE O AUTORZE:
+        {author_info}
+        
+        Zwróć tylko przetworzoną treść bez dodatkowych tytułów, wprowadzeń czy formatowań.
+        Możesz używać podstawowego formatowania HTML (<strong>, <em>) dla podkreślenia 
+        kluczowych informacji.
+        """
+
+        # Wywołanie API OpenAI (przez wspólny harmonogram zapytań)
+        messages = [
+            {"role": "system", "content": "Jesteś ekspertem w tworzeniu profesjonalnych biogramów autorów."},
+            {"role": "user", "content": prompt}
+        ]
+        response = get_rate_limiter().run(
+            lambda: client.chat.completions.create(model=model, messages=messages),
+            estimate_request_tokens(messages)
+        )
+
+        # Zwrócenie wygenerowanego biogramu
+        return response.choices[0].message.content.strip()
+
+    except Exception as e:
+        # W przypadku błędu, zwróć oryginalne dane
+        logger.warning("Nie udało się przetworzyć informacji o autorze, używam oryginalnych danych: %s", e)
+        return author_info
+
+
+# Funkcja zwracająca instrukcję dla wybranego tonu komunikacji
+def get_tone_instruction(tone):
+    tone_instruction = ""
+    if tone == "profesjonalny":
+        tone_instruction = "Użyj rzeczowego, uprzejmego języka, bez emocjonalnych wyrażeń. Zachowaj profesjonalny ton."
+    elif tone == "przyjazny":
+        tone_instruction = "Użyj ciepłego, osobistego i otwartego języka. Bądź przyjazny i bezpośredni."
+    elif tone == "zabawny":
+        tone_instruction = "Użyj lekkiego, żartobliwego języka z elementami humoru. Nie przesadzaj, ale bądź zabawny."
+    elif tone == "motywujący":
+        tone_instruction = "Użyj inspirującego, podnoszącego na duchu języka. Zachęcaj i motywuj czytelnika."
+    elif tone == "poważny":
+        tone_instruction = "Użyj formalnego, zdystansowanego i neutralnego języka. Zachowaj powagę i oficjalny ton."
+    elif tone == "empatyczny":
+        tone_instruction = "Użyj wspierającego języka, który pokazuje zrozumienie dla emocji i potrzeb odbiorcy."
+    
+    return tone_instruction
+
+
+# Funkcja do przygotowania instrukcji dla pojedynczej sekcji
+# (treść e-booka trafia do osobnej, wcześniejszej wiadomości - patrz mailgen.prompts)
+def build_section_instructions(persona, section_name, tone="przyjazny", length=300):
+    tone_instruction = get_tone_instruction(tone)
+    
+    # Opis dla wybranej sekcji
+    section_description = ALL_VARIABLES.get(section_name, "Sekcja treści marketingowej")
+    
+    prompt = f"""
+    Przeanalizuj powyższy e-book i utwórz wysokiej jakości treść marketingową dla JEDNEJ sekcji.
+    
+    PERSONA:
+    {persona}
+    
+    TON KOMUNIKACJI:
+    {tone_instruction}
+    
+    WYMAGANA SEKCJA:
+    {section_name} - {section_description}
+    Długość: około {length} znaków
+    
+    WAŻNE WSKAZÓWKI DLA TWORZENIA TREŚCI:
+    - Stwórz treść, która jest WYSOCE ANGAŻUJĄCA i PRZEKONUJĄCA marketingowo
+    - Używaj języka, który wzbudza emocje i zainteresowanie
+    - Zastosuj konkretne, obrazowe przykłady i opisy
+    - Wykorzystaj krótkie, dynamiczne zdania naprzemiennie z bardziej złożonymi
+    - Podkreśl unikalne korzyści i wartość, wykorzystaj tzw. "unique selling points"
+    - Pisz w drugiej osobie (Ty, Twój) aby stworzyć bezpośredni kontakt z czytelnikiem
+    - Używaj aktywnych czasowników i unikaj strony biernej
+    - NIE DODAWAJ TYTUŁÓW SEKCJI, tylko jej zawartość
+    - UŻYWAJ TYLKO PODSTAWOWEGO FORMATOWANIA HTML - wyłącznie <strong>, <em>, <br>, <li> dla list oraz <ul> dla list punktowanych
+    - NIE DODAWAJ znaczników <div>, <span>, <p>, <blockquote>, <dl>, atrybutów 'class', 'id' lub jakichkolwiek innych elementów formatowania
+    
+    Zwróć TYLKO treść sekcji, bez dodatkowego tekstu przed lub po, bez nazwy sekcji, bez formatowania JSON.
+    """
+    return prompt
+
+
+# Funkcja do oczyszczenia wygenerowanej treści sekcji (tytuły, listy)
+def clean_section_content(section_name, content):
+    # Usuń ewentualne tytuły sekcji (wzorce skompilowane raz w mailgen.sanitizer)
+    content = strip_section_title(section_name, content)
+    
+    # Formatowanie specjalne dla list
+    if section_name == "contents" and "<ul>" not in content and "<li>" not in content:
+        lines = content.split("\n")
+        if len(lines) > 1:
+            content = "<ul>" + "".join([f"<li>{line.strip()}</li>" for line in lines if line.strip()]) + "</ul>"
+    
+    if section_name == "key_benefits" and "<ul>" not in content and "<li>" not in content:
+        lines = content.split("\n")
+        if len(lines) > 1:
+            content = "<ul>" + "".join([f"<li>{line.strip()}</li>" for line in lines if line.strip()]) + "</ul>"
+    
+    return content
+
+
+# Funkcja zwracająca treść e-booka do regeneracji jednej sekcji. Jeśli pełny tekst mieści się
+# w budżecie zapytania, trafia do promptu tak samo jak przy generowaniu wszystkich sekcji -
+# wspólny prefiks wiadomości pozwala korzystać z pamięci podręcznej promptu po stronie API.
+# Dopiero gdy pełny tekst trzeba by przyciąć lub streścić, model dostaje fragmenty najbardziej
+# związane z sekcją (zapytaniem jest jej opis z ALL_VARIABLES): taki prompt nie współdzieli
+# prefiksu z generowaniem ani nie korzysta ze streszczenia e-booka, ale jest wielokrotnie krótszy.
+def get_section_ebook_text(client, pdf_text, section_name, model, instructions, length):
+    plan = plan_ebook_context(pdf_text, model, instructions, {section_name: length})
+    if plan.strategy != "full" and should_retrieve(pdf_text):
+        query = f"{section_name.replace('_', ' ')} {ALL_VARIABLES.get(section_name, '')}"
+        pdf_text = select_relevant_text(pdf_text, get_retrieval_index(pdf_text), query)
+        plan = plan_ebook_context(pdf_text, model, instructions, {section_name: length})
+
+    return get_ebook_context(client, model, pdf_text, get_digest_cache(), plan)
+
+
+# Funkcja do ponownego generowania pojedynczej sekcji
+# (current_content - obecna treść sekcji; wchodzi do klucza pamięci podręcznej, dzięki czemu
+# każde kliknięcie "Wygeneruj ponownie" daje nową wersję, a odświeżenie strony - tę samą)
+@timed("regenerate_single_section")
+def regenerate_single_section(pdf_text, persona, section_name, author_info="", model="o4-mini", tone="przyjazny", length=300, bypass_cache=False, current_content=None, api_key=None):
+    api_key = resolve_api_key(api_key)
+
+    try:
+        # Współdzielony klient OpenAI (pula połączeń utrzymywana między wywołaniami)
+        client = get_openai_client(api_key)
+
+        # Specjalny przypadek dla informacji o autorze
+        if section_name == "author_credentials" and author_info:
+            content = generate_author_credentials(author_info, model=model, api_key=api_key)
+            return SectionResult(section_name, content)
+
+        with get_metrics().span("build_prompt"):
+            # Przygotowanie promptu dla OpenAI - tylko dla jednej sekcji
+            instructions = build_section_instructions(persona, section_name, tone=tone, length=length)
+
+            # Fragmenty e-booka związane z sekcją (krótki e-book - w całości)
+            ebook_text = get_section_ebook_text(client, pdf_text, section_name, model, instructions, length)
+
+        # Wywołanie API OpenAI (treść e-booka jako stały prefiks wiadomości)
+        with get_metrics().span("api_request", model=model, stream=False) as span:
+            content, usage = create_completion(
+                client,
+                model,
+                build_messages(ebook_text, instructions),
+                response_cache=get_response_cache(),
+                bypass_cache=bypass_cache,
+                previous_content=current_content
+            )
+            span.labels["cache"] = "miss" if usage else "hit"
+            span.add_usage(usage)
+
+        return SectionResult(
+            section_name,
+            clean_section_content(section_name, content.strip()),
+            _usage_entries(f"Sekcja {section_name}", usage)
+        )
+
+    except MailGenError:
+        raise
+    except Exception as e:
+        raise GenerationError(f"Błąd podczas generowania sekcji {section_name}: {e}") from e
+
+
+# Funkcja do równoległej regeneracji wielu sekcji przez asynchronicznego klienta OpenAI.
+# Liczba jednoczesnych zapytań ograniczona jest parametrem concurrency.
+# Błędy pojedynczych sekcji nie przerywają pozostałych - trafiają do result.errors.
+@timed("regenerate_sections_concurrently")
+def regenerate_sections_concurrently(pdf_text, persona, section_names, author_info="", model="o4-mini", tone="przyjazny", lengths=None, concurrency=4, bypass_cache=False, current_contents=None, api_key=None):
+    api_key = resolve_api_key(api_key)
+    lengths = lengths or {}
+    current_contents = current_contents or {}
+    response_cache = get_response_cache()
+
+    # Indeks fragmentów budowany raz, przed równoległymi zapytaniami - o ile pełny tekst
+    # nie zmieści się w zapytaniu o najdłuższą sekcję (patrz get_section_ebook_text)
+    try:
+        longest = max(section_names, key=lambda name: lengths.get(name, 300), default=None)
+        if longest is not None and should_retrieve(pdf_text) and plan_ebook_context(
+            pdf_text, model, lengths={longest: lengths.get(longest, 300)}
+        ).strategy != "full":
+            get_retrieval_index(pdf_text)
+    except Exception as e:
+        raise GenerationError(f"Błąd podczas przygotowania treści e-booka: {e}") from e
+
+    async def regenerate_one(client, semaphore, section_name):
+        async with semaphore:
+            if section_name == "author_credentials" and author_info:
+                content = await asyncio.to_thread(generate_author_credentials, author_info, model, api_key)
+                return SectionResult(section_name, content)
+
+            length = lengths.get(section_name, 300)
+            instructions = build_section_instructions(persona, section_name, tone=tone, length=length)
+            # Fragmenty e-booka związane z sekcją (tak jak przy regeneracji pojedynczej sekcji)
+            ebook_text = await asyncio.to_thread(
+                get_section_ebook_text, get_openai_client(api_key), pdf_text, section_name, model, instructions, length
+            )
+            messages = build_messages(ebook_text, instructions)
+
+            # Ten sam klucz pamięci podręcznej co przy regeneracji pojedynczej sekcji
+            cache_key = response_cache.fingerprint(model, messages, previous_content=current_contents.get(section_name))
+            content = None if bypass_cache else response_cache.get(cache_key)
+            usage = None
+            if content is None:
+                with get_metrics().span("api_request", model=model, stream=False, cache="miss") as span:
+                    # Wspólny harmonogram zapytań - semafor ogranicza tylko tę serię sekcji
+                    response = await get_rate_limiter().run_async(
+                        lambda: client.chat.completions.create(model=model, messages=messages),
+                        estimate_request_tokens(messages)
+                    )
+                    content = response.choices[0].message.content
+                    response_cache.put(cache_key, content)
+                    usage = extract_usage(response)
+                    span.add_usage(usage)
+
+            return SectionResult(
+                section_name,
+                clean_section_content(section_name, content.strip()),
+                _usage_entries(f"Sekcja {section_name}", usage)
+            )
+
+    async def regenerate_all():
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        async with get_async_openai_client(api_key) as client:
+            return await asyncio.gather(
+                *(regenerate_one(client, semaphore, name) for name in section_names),
+                return_exceptions=True
+            )
+
+    result = BatchRegenerationResult()
+    for section_name, section_result in zip(section_names, asyncio.run(regenerate_all())):
+        if isinstance(section_result, Exception):
+            result.errors[section_name] = GenerationError(f"Błąd podczas generowania sekcji {section_name}: {section_result}")
+        elif section_result.content:
+            result.sections[section_name] = section_result
+    return result
+
+
+# Funkcja do przygotowania instrukcji generowania treści dla podanych zmiennych
+# (treść e-booka trafia do osobnej, wcześniejszej wiadomości - patrz mailgen.prompts)
+def build_generation_instructions(persona, required_variables, author_info="", tone="przyjazny", lengths=None):
+    # Dostosowanie tonu komunikacji
+    tone_instruction = get_tone_instruction(tone)
+    
+    # Dodanie informacji o długościach sekcji, jeśli są dostępne
+    length_instructions = ""
+    if lengths:
+        length_instructions = "DŁUGOŚCI SEKCJI:\n"
+        for var in sorted(required_variables):
+            if var in lengths:
+                length_instructions += f"- {var}: około {lengths.get(var)} znaków\n"
+    
+    # Informacje o autorze
+    author_instructions = ""
+    if "author_credentials" in required_variables and author_info and author_info.strip():
+        author_instructions = f"""
+            INFORMACJE O AUTORZE:
+            {author_info}
+            
+            Wykorzystaj powyższe informacje by stworzyć przekonującą sekcję author_credentials.
+            """
+    
+    # Stała kolejność zmiennych (zbiór nie gwarantuje kolejności między uruchomieniami)
+    ordered_variables = [var for var in ALL_VARIABLES if var in required_variables]
+    
+    # Przygotowanie listy wymaganych zmiennych z opisami
+    variables_instructions = "WYMAGANE ZMIENNE:\n"
+    for var in ordered_variables:
+        if var in ALL_VARIABLES:
+            variables_instructions += f"{var} - {ALL_VARIABLES[var]}\n"
+    
+    # Przygotowanie instrukcji dla OpenAI koncentrując się tylko na wymaganych zmiennych
+    instructions = f"""
+        Przeanalizuj pełny tekst e-booka z poprzedniej wiadomości i wygeneruj bloki treści marketingowej ściśle odpowiadające wskazanej personie.
+
+        ⚠️ GENERUJ WYŁĄCZNIE treści dla kluczy wymienionych w sekcji [OPISY ZMIENNYCH].  
+        ⚠️ NIE twórz dodatkowych kluczy ani nie zmieniaj ich nazewnictwa czy kolejności.
+        
+        [PERSONA]
+        {persona}
+        
+        TON KOMUNIKACJI:
+        {tone_instruction}
+        
+        {variables_instructions}
+        
+        {length_instructions}
+        
+        {author_instructions}
+        
+        Zwróć wynik w formacie JSON zawierający TYLKO poniższe wymagane klucze:
+
+        [OPISY ZMIENNYCH]
+        """
+    
+    # Dodaj opis każdej wymaganej zmiennej
+    for i, var in enumerate(ordered_variables, 1):
+        if var in ALL_VARIABLES:
+            instructions += f"\n{i}. {var} - {ALL_VARIABLES[var]}. Nie dodawaj tytułów, tylko samą treść."
+    
+    instructions += """
+        
+        WAŻNE WSKAZÓWKI DLA TWORZENIA TREŚCI:
+        • Twórz teksty maksymalnie angażujące, skupione na praktycznej wartości.  
+        • Podkreślaj unique selling points – konkrety zamiast ogólników.  
+        • Pisz w drugiej osobie („Ty”, „Twój”) i stosuj aktywne czasowniki.  
+        • Mieszaj krótkie zdania z rozbudowanymi dla rytmu i dynamiki.  
+        • Wplataj obrazowe przykłady i dane liczbowe (jeśli znajdują się w e-booku).  
+        • NIE dodawaj tytułów sekcji – zwróć wyłącznie treść odpowiadającą zmiennym.  
+        • Dopuszczalne tagi HTML: <strong>, <em>, <ul>, <li>, <br>.  
+            – Zakaz używania <div>, <span>, <p>, <blockquote>, <dl>, atrybutów class/id i inline-style.  
+        • Jeśli brak danych w e-booku dla danej zmiennej, zwróć pusty string "" (nie placeholder).
+        
+        Odpowiedź musi być w formacie JSON, używaj minimalnego formatowania HTML.
+        WAŻNE: Zwróć TYLKO obiekt JSON bez dodatkowego tekstu przed lub po.
+        """
+    return instructions
+
+
+# Funkcja do wydobycia obiektu JSON z odpowiedzi modelu (None, jeśli odpowiedź nie jest obiektem JSON).
+# Z odpowiedzi uciętej w połowie (np. limit tokenów) odzyskiwane są domknięte klucze.
+# Wartości null są pomijane - traktowane są jak brakujące klucze.
+def parse_generated_json(content):
+    if not content:
+        return None
+    try:
+        # Wydobycie fragmentu JSON z odpowiedzi (na wypadek, gdyby model dodał tekst przed/po JSON)
+        json_match = JSON_OBJECT_PATTERN.search(content)
+        data = json.loads(json_match.group(1) if json_match else content)
+    except json.JSONDecodeError:
+        parser = IncrementalJsonObjectParser()
+        parser.feed(content)
+        data = parser.values or None
+    if not isinstance(data, dict):
+        return None
+    return {key: value for key, value in data.items() if value is not None}
+
+
+# Funkcja tworząca odbiornik fragmentów strumienia: przekazuje do on_section każdą
+# sekcję (już oczyszczoną), gdy tylko jej wartość w obiekcie JSON zostanie domknięta
+def _section_stream_handler(variables, on_section):
+    parser = IncrementalJsonObjectParser()
+
+    def on_delta(text):
+        for key, value in parser.feed(text):
+            if key in variables and value is not None:
+                on_section(key, sanitize_field(key, value))
+
+    return on_delta
+
+
+# Funkcja do wysłania zapytania o treści dla podanych zmiennych
+# (treść e-booka jako stały prefiks wiadomości - zapytanie naprawcze współdzieli go z pierwszym)
+# (on_section - tryb strumieniowy: sekcje przekazywane są w miarę generowania)
+def _request_variables(client, model, ebook_text, instructions, variables, use_schema, bypass_cache, on_section=None, should_cancel=None):
+    messages = build_messages(ebook_text, instructions)
+
+    # Schemat zmiennych jako ograniczenie odpowiedzi (jeśli model je obsługuje)
+    response_format = None
+    if use_schema:
+        response_format = build_response_format([var for var in ALL_VARIABLES if var in variables], ALL_VARIABLES)
+
+    with get_metrics().span("api_request", model=model, stream=on_section is not None) as span:
+        if on_section is not None:
+            content, usage = stream_completion(
+                client,
+                model,
+                messages,
+                _section_stream_handler(variables, on_section),
+                response_cache=get_response_cache(),
+                bypass_cache=bypass_cache,
+                response_format=response_format,
+                should_cancel=should_cancel
+            )
+        else:
+            content, usage = create_completion(
+                client,
+                model,
+                messages,
+                response_cache=get_response_cache(),
+                bypass_cache=bypass_cache,
+                response_format=response_format
+            )
+        # Odpowiedź z pamięci podręcznej nie ma zużycia tokenów
+        span.labels["cache"] = "miss" if usage else "hit"
+        span.add_usage(usage)
+    cache_key = get_response_cache().fingerprint(
+        model, messages, **({"response_format": response_format} if response_format else {})
+    )
+    return content, usage, cache_key
+
+
+# Funkcja przerywająca generowanie między etapami (should_cancel - jak w analyze_pdf_with_openai)
+def _raise_if_cancelled(should_cancel):
+    if should_cancel is not None and should_cancel():
+        raise GenerationCancelledError("Generowanie zostało przerwane.")
+
+
+# Funkcja do wywołania API OpenAI dla wymaganych zmiennych.
+# Odpowiedź porównywana jest ze schematem wymaganych zmiennych; brakujące lub błędne klucze
+# uzupełnia jedno małe zapytanie naprawcze (ten sam prefiks wiadomości, to samo streszczenie),
+# zamiast powtarzania całego generowania.
+# (structured_output - schemat JSON wysyłany jako response_format, jeśli model go obsługuje;
+# on_section(nazwa, treść) - tryb strumieniowy: wywoływane, gdy tylko sekcja jest gotowa;
+# should_cancel() - zwraca True, aby przerwać generowanie przed końcem odpowiedzi)
+@timed("analyze_pdf_with_openai")
+def analyze_pdf_with_openai(pdf_text, persona, required_variables, author_info="", model="o4-mini", tone="przyjazny", lengths=None, bypass_cache=False, structured_output=False, on_section=None, should_cancel=None, api_key=None):
+    # Zmiennych spoza ALL_VARIABLES model nie wygeneruje (nie ma ich w instrukcjach ani schemacie) -
+    # odrzucenie przed pierwszym zapytaniem zamiast nieudanej naprawy
+    unknown_variables = sorted(var for var in required_variables if var not in ALL_VARIABLES)
+    if unknown_variables:
+        raise MailGenError(f"Nieznane zmienne w szablonie HTML: {', '.join(unknown_variables)}")
+    
+    api_key = resolve_api_key(api_key)
+    use_schema = structured_output and supports_structured_output(model)
+    mode = "json_schema" if use_schema else "prompt"
+    content = None
+    usage = None
+
+    try:
+        # Współdzielony klient OpenAI (pula połączeń utrzymywana między wywołaniami)
+        client = get_openai_client(api_key)
+        response_cache = get_response_cache()
+        
+        with get_metrics().span("build_prompt") as span:
+            # Instrukcje dla wszystkich wymaganych zmiennych
+            instructions = build_generation_instructions(persona, required_variables, author_info, tone, lengths)
+            
+            # Pełny tekst, przycięty tekst lub streszczenie map-reduce - tak, aby prompt
+            # i odpowiedź o zadanych długościach sekcji zmieściły się w oknie kontekstu
+            output_lengths = {var: (lengths or {}).get(var, 300) for var in required_variables}
+            plan = plan_ebook_context(pdf_text, model, instructions, output_lengths)
+            ebook_text = get_ebook_context(client, model, pdf_text, get_digest_cache(), plan)
+            span.labels["strategy"] = plan.strategy
+        
+        # Streszczanie obszernego e-booka trwa długo - przerwanie przed zapytaniem o treści
+        _raise_if_cancelled(should_cancel)
+        
+        # Wywołanie API OpenAI dla wszystkich wymaganych zmiennych
+        content, usage, cache_key = _request_variables(
+            client, model, ebook_text, instructions, required_variables, use_schema, bypass_cache,
+            on_section, should_cancel
+        )
+        usage_entries = _usage_entries("Generowanie treści", usage)
+        
+        # Porównanie odpowiedzi ze schematem wymaganych zmiennych
+        json_schema = create_dynamic_json_schema(required_variables)
+        raw_data = parse_generated_json(content)
+        parsed = raw_data is not None
+        raw_data = raw_data or {}
+        invalid_keys = find_invalid_keys(sanitize_generated_data(dict(raw_data)), json_schema)
+        
+        if invalid_keys:
+            logger.info("Odpowiedź bez poprawnych kluczy %s - wysyłam zapytanie naprawcze", ", ".join(invalid_keys))
+            # Nie zapamiętuj niepełnej odpowiedzi - zostanie zastąpiona uzupełnioną
+            response_cache.delete(cache_key)
+            
+            repair_keys = invalid_keys
+            # Kwalifikacje autora mogą powstać bez treści e-booka (jak dotychczas)
+            if "author_credentials" in invalid_keys and author_info and author_info.strip():
+                raw_data["author_credentials"] = generate_author_credentials(author_info, model=model, api_key=api_key)
+                if on_section is not None:
+                    on_section("author_credentials", sanitize_field("author_credentials", raw_data["author_credentials"]))
+                repair_keys = [key for key in invalid_keys if key != "author_credentials"]
+            
+            if repair_keys:
+                _raise_if_cancelled(should_cancel)
+                repair_instructions = build_generation_instructions(persona, set(repair_keys), author_info, tone, lengths)
+                repair_content, repair_usage, repair_cache_key = _request_variables(
+                    client, model, ebook_text, repair_instructions, set(repair_keys), use_schema, bypass_cache,
+                    on_section, should_cancel
+                )
+                usage_entries += _usage_entries("Naprawa: " + ", ".join(repair_keys), repair_usage)
+                repaired = parse_generated_json(repair_content) or {}
+                raw_data.update({key: repaired[key] for key in repair_keys if key in repaired})
+                
+                remaining_keys = find_invalid_keys(sanitize_generated_data(dict(raw_data)), json_schema)
+                if remaining_keys:
+                    response_cache.delete(repair_cache_key)
+                    # Zmarnowana część pierwszej odpowiedzi i całe nieudane zapytanie naprawcze
+                    get_generation_stats().record(
+                        mode,
+                        len(invalid_keys),
+                        estimate_wasted_tokens(usage, len(invalid_keys), len(required_variables), parsed)
+                        + estimate_wasted_tokens(repair_usage, 1, 1, parsed=False)
+                    )
+                    if not parsed:
+                        raise ResponseParseError("Błąd parsowania JSON: odpowiedź modelu nie zawiera poprawnego obiektu JSON", content)
+                    raise ResponseValidationError(f"Błąd walidacji JSON: brak poprawnych wartości dla kluczy {', '.join(remaining_keys)}")
+            
+            # Zapamiętanie uzupełnionej odpowiedzi - odświeżenie strony nie powtórzy naprawy
+            response_cache.put(cache_key, json.dumps(raw_data, ensure_ascii=False))
+        
+        get_generation_stats().record(
+            mode,
+            len(invalid_keys),
+            estimate_wasted_tokens(usage, len(invalid_keys), len(required_variables), parsed)
+        )
+        
+        # Normalizacja danych JSON i usunięcie tytułów sekcji (jedno przejście)
+        return GenerationResult(sanitize_generated_data(raw_data), usage_entries, invalid_keys)
+    
+    except MailGenError:
+        raise
+    except Exception as e:
+        raise GenerationError(f"Błąd podczas analizy z OpenAI: {e}") from e
+
+
+# Funkcja do podstawiania wartości z JSON w kreacji mailowej
+@timed("render")
+def replace_variables_in_html(html_content, json_data):
+    # Szablon kompilowany raz i zapamiętywany - kolejne renderowania to tylko złączenie fragmentów
+    return compile_template(html_content).render(json_data)
+
+
+# Funkcja do przyrostowego podstawiania wartości w kreacji mailowej. previous to wynik
+# poprzedniego wywołania (RenderedTemplate) - dla tego samego szablonu podstawiane są
+# ponownie tylko zmienne, których wartość się zmieniła.
+@timed("render")
+def render_html_incremental(html_content, json_data, previous=None):
+    if previous is None or previous.template.source != html_content:
+        return RenderedTemplate(compile_template(html_content), json_data)
+    previous.update(json_data)
+    return previous
@@ -0,0 +1,158 @@
+import hashlib
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from mailgen.disk_cache import DiskTextCache
+from mailgen.metrics import timed
+from mailgen.rate_limiter import estimate_request_tokens, get_rate_limiter
+from mailgen.token_budget import (
+    DIGEST_OUTPUT_TOKENS,
+    SAFETY_MARGIN_TOKENS,
+    count_tokens,
+    get_model_limits,
+    trim_to_tokens,
+)
+
+# O tym, czy e-book jest streszczany, decyduje plan zapytania (mailgen.token_budget)
+
+# Domyślna długość pojedynczego fragmentu e-booka (plan zapytania dobiera ją do modelu)
+DIGEST_CHUNK_CHARS = int(os.environ.get("MAILGEN_DIGEST_CHUNK_CHARS", "40000"))
+
+# Liczba równoległych zapytań o streszczenia fragmentów
+DIGEST_MAX_WORKERS = int(os.environ.get("MAILGEN_DIGEST_MAX_WORKERS", "4"))
+
+# Wersja promptów streszczających - zmiana unieważnia zapisane streszczenia
+DIGEST_PROMPT_VERSION = "1"
+
+CHUNK_SYSTEM_PROMPT = "Jesteś analitykiem treści, który przygotowuje rzetelne notatki z e-booków dla copywriterów."
+
+CHUNK_PROMPT = """
+Poniżej znajduje się fragment {index} z {total} e-booka. Przygotuj zwięzłe, rzeczowe notatki,
+które pozwolą później napisać treści marketingowe bez dostępu do pełnego tekstu.
+
+Uwzględnij:
+- tematy, rozdziały i najważniejsze tezy fragmentu,
+- konkretne liczby, dane, przykłady, cytaty i checklisty (cytuj dosłownie, jeśli są krótkie),
+- problemy czytelnika, które fragment rozwiązuje, i obiecywane efekty,
+- informacje o autorze, jeśli się pojawiają.
+
+Nie dodawaj informacji spoza fragmentu. Pisz po polsku, w punktach.
+
+FRAGMENT E-BOOKA:
+{chunk}
+"""
+
+MERGE_PROMPT = """
+Poniżej znajdują się notatki z kolejnych fragmentów jednego e-booka. Połącz je w jedno
+uporządkowane streszczenie całej publikacji, zachowując kolejność rozdziałów.
+
+Zachowaj wszystkie konkretne liczby, przykłady, cytaty, opinie i informacje o autorze.
+Usuń powtórzenia. Nie dodawaj informacji spoza notatek. Pisz po polsku.
+
+NOTATKI:
+{digests}
+"""
+
+
+# Generator dzielący strumień tekstu (np. kolejne strony PDF) na fragmenty
+# o długości około chunk_chars, z podziałem w miarę możliwości na granicy akapitu
+def iter_text_chunks(pieces, chunk_chars=DIGEST_CHUNK_CHARS):
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_chars:
+            split_at = buffer.rfind("\n", chunk_chars // 2, chunk_chars)
+            if split_at == -1:
+                split_at = chunk_chars
+            yield buffer[:split_at]
+            buffer = buffer[split_at:]
+    if buffer.strip():
+        yield buffer
+
+
+# Funkcja do podziału tekstu na fragmenty
+def chunk_text(text, chunk_chars=DIGEST_CHUNK_CHARS):
+    return list(iter_text_chunks([text], chunk_chars))
+
+
+# Funkcja do streszczenia pojedynczego fragmentu e-booka
+def summarize_chunk(client, model, chunk, index, total):
+    messages = [
+        {"role": "system", "content": CHUNK_SYSTEM_PROMPT},
+        {"role": "user", "content": CHUNK_PROMPT.format(index=index, total=total, chunk=chunk)}
+    ]
+    response = get_rate_limiter().run(
+        lambda: client.chat.completions.create(model=model, messages=messages),
+        estimate_request_tokens(messages)
+    )
+    return response.choices[0].message.content.strip()
+
+
+# Funkcja do połączenia streszczeń fragmentów w jedno streszczenie całości
+# (streszczenia przycinane są równo, jeśli razem nie mieszczą się w oknie kontekstu modelu)
+def merge_digests(client, model, chunk_digests):
+    if len(chunk_digests) == 1:
+        return chunk_digests[0]
+
+    limits = get_model_limits(model)
+    merge_budget = limits.context_window - DIGEST_OUTPUT_TOKENS - limits.reasoning_reserve - 2 * SAFETY_MARGIN_TOKENS
+    per_digest_budget = merge_budget // len(chunk_digests)
+    chunk_digests = [trim_to_tokens(digest, per_digest_budget, model) for digest in chunk_digests]
+
+    numbered = "\n\n".join(
+        f"--- FRAGMENT {i} ---\n{digest}" for i, digest in enumerate(chunk_digests, 1)
+    )
+    messages = [
+        {"role": "system", "content": CHUNK_SYSTEM_PROMPT},
+        {"role": "user", "content": MERGE_PROMPT.format(digests=numbered)}
+    ]
+    response = get_rate_limiter().run(
+        lambda: client.chat.completions.create(model=model, messages=messages),
+        estimate_request_tokens(messages)
+    )
+    return response.choices[0].message.content.strip()
+
+
+# Funkcja do zbudowania streszczenia e-booka metodą map-reduce:
+# fragmenty streszczane są równolegle, a następnie łączone jednym zapytaniem
+@timed("digest")
+def build_digest(client, model, pdf_text, chunk_chars=DIGEST_CHUNK_CHARS, max_workers=DIGEST_MAX_WORKERS):
+    chunks = chunk_text(pdf_text, chunk_chars)
+    total = len(chunks)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        chunk_digests = list(executor.map(
+            lambda item: summarize_chunk(client, model, item[1], item[0], total),
+            enumerate(chunks, 1)
+        ))
+
+    return merge_digests(client, model, chunk_digests)
+
+
+# Trwała pamięć podręczna streszczeń - klucz to skrót treści e-booka, model,
+# długość fragmentów i wersja promptów
+class DigestCache(DiskTextCache):
+    def make_key(self, pdf_text, model, chunk_chars=DIGEST_CHUNK_CHARS):
+        text_hash = hashlib.sha256(pdf_text.encode("utf-8")).hexdigest()
+        key_source = f"{text_hash}:{model}:{chunk_chars}:{DIGEST_PROMPT_VERSION}"
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+# Funkcja zwracająca tekst e-booka do promptu zgodnie z planem zapytania
+# (mailgen.token_budget.ContextPlan): pełny tekst, tekst przycięty do budżetu
+# lub (zapisane) streszczenie map-reduce, w razie potrzeby także przycięte
+def get_ebook_context(client, model, pdf_text, digest_cache, plan):
+    if plan.strategy == "full":
+        return pdf_text
+    if plan.strategy == "trimmed":
+        return trim_to_tokens(pdf_text, plan.document_budget, model)
+
+    cache_key = digest_cache.make_key(pdf_text, model, plan.chunk_chars)
+    digest = digest_cache.get(cache_key)
+    if digest is None:
+        digest = build_digest(client, model, pdf_text, plan.chunk_chars)
+        digest_cache.put(cache_key, digest)
+
+    if count_tokens(digest, model) > plan.document_budget:
+        digest = trim_to_tokens(digest, plan.document_budget, model)
+    return digest
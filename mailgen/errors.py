@@ -0,0 +1,43 @@
+# Wyjątki zgłaszane przez logikę generatora (interfejs decyduje, jak je pokazać)
+
+
+# Wspólna klasa bazowa wszystkich błędów generatora
+class MailGenError(Exception):
+    pass
+
+
+# Brak klucza API OpenAI
+class MissingApiKeyError(MailGenError):
+    pass
+
+
+# Błąd odczytu pliku PDF
+class PdfReadError(MailGenError):
+    pass
+
+
+# Błąd podczas generowania treści przez model
+class GenerationError(MailGenError):
+    pass
+
+
+# Odpowiedź modelu nie jest poprawnym JSON-em (surowa odpowiedź w raw_content)
+class ResponseParseError(GenerationError):
+    def __init__(self, message, raw_content):
+        super().__init__(message)
+        self.raw_content = raw_content
+
+
+# Odpowiedź modelu nie spełnia schematu JSON wymaganych zmiennych
+class ResponseValidationError(GenerationError):
+    pass
+
+
+# Generowanie przerwane przed otrzymaniem pełnej odpowiedzi
+class GenerationCancelledError(GenerationError):
+    pass
+
+
+# Limit zapytań API (odpowiedź 429) nie ustąpił mimo kolejnych prób
+class RateLimitExceededError(GenerationError):
+    pass
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+
+from mailgen.errors import GenerationCancelledError
+
+# Trwała kolejka zadań w bazie SQLite z pulą wątków roboczych. Zadania (np. odczyt PDF
+# i generowanie treści) wykonywane są poza wątkiem skryptu Streamlit, mają status,
+# licznik prób i zapisany wynik - odświeżenie strony nie przerywa pracy, a interfejs
+# może w każdej chwili ponownie podłączyć się do zadania po jego identyfikatorze.
+
+logger = logging.getLogger(__name__)
+
+# Liczba wątków roboczych
+JOB_WORKERS = int(os.environ.get("MAILGEN_JOB_WORKERS", "2"))
+
+# Maksymalna liczba prób wykonania zadania
+JOB_MAX_ATTEMPTS = int(os.environ.get("MAILGEN_JOB_MAX_ATTEMPTS", "3"))
+
+# Czas bez sygnału życia, po którym zadanie uznawane jest za porzucone (np. po restarcie
+# procesu) i wraca do kolejki
+JOB_LEASE_SECONDS = int(os.environ.get("MAILGEN_JOB_LEASE_SECONDS", "900"))
+
+# Czas przechowywania zakończonych zadań (domyślnie 7 dni)
+JOB_RETENTION_SECONDS = int(os.environ.get("MAILGEN_JOB_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+# Opóźnienie kolejnej próby: JOB_RETRY_DELAY * 2^(numer próby - 1) sekund
+JOB_RETRY_DELAY = float(os.environ.get("MAILGEN_JOB_RETRY_DELAY", "5"))
+
+# Co ile sekund wątek roboczy odświeża sygnał życia zadania (i sprawdza, czy nie zażądano przerwania)
+HEARTBEAT_INTERVAL = 1.0
+
+# Co ile sekund sygnał życia odświeżany jest w tle przez cały czas wykonywania zadania
+# (kilka razy w okresie JOB_LEASE_SECONDS)
+LEASE_RENEW_INTERVAL = min(30.0, JOB_LEASE_SECONDS / 4)
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed", "cancelled")
+FINISHED_STATUSES = ("succeeded", "failed", "cancelled")
+
+JOB_COLUMNS = "id, kind, status, payload, result, progress, error, attempts, max_attempts, cancel_requested, created, updated"
+
+
+# Zadanie w kolejce (bez danych wejściowych - te pobiera się osobno, get_input)
+@dataclass
+class Job:
+    id: str
+    kind: str
+    status: str
+    payload: dict
+    result: dict = None
+    progress: dict = field(default_factory=dict)
+    error: str = None
+    attempts: int = 0
+    max_attempts: int = JOB_MAX_ATTEMPTS
+    cancel_requested: bool = False
+    created: float = 0.0
+    updated: float = 0.0
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            id=row[0],
+            kind=row[1],
+            status=row[2],
+            payload=json.loads(row[3]),
+            result=json.loads(row[4]) if row[4] else None,
+            progress=json.loads(row[5]) if row[5] else {},
+            error=row[6],
+            attempts=row[7],
+            max_attempts=row[8],
+            cancel_requested=bool(row[9]),
+            created=row[10],
+            updated=row[11],
+        )
+
+
+# Kolejka zadań w bazie SQLite (jedno połączenie współdzielone przez wątki, chronione blokadą)
+class JobQueue:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+                "payload TEXT NOT NULL, input BLOB, result TEXT, progress TEXT, error TEXT, "
+                "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, "
+                "cancel_requested INTEGER NOT NULL DEFAULT 0, worker TEXT, "
+                "created REAL NOT NULL, updated REAL NOT NULL, "
+                "available_at REAL NOT NULL, heartbeat REAL)"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_pending ON jobs (status, available_at, created)"
+            )
+
+    # Funkcja dodająca zadanie do kolejki; zwraca jego identyfikator
+    def submit(self, kind, payload, input_data=None, max_attempts=JOB_MAX_ATTEMPTS):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO jobs (id, kind, status, payload, input, max_attempts, created, updated, available_at) "
+                "VALUES (?, ?, 'queued', ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, json.dumps(payload, ensure_ascii=False), input_data, max_attempts, now, now, now)
+            )
+        return job_id
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._connection.execute(f"SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return Job.from_row(row) if row else None
+
+    def get_input(self, job_id):
+        with self._lock:
+            row = self._connection.execute("SELECT input FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row[0] if row else None
+
+    # Funkcja zwracająca ostatnio dodane zadania (najnowsze najpierw)
+    def list(self, limit=20):
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {JOB_COLUMNS} FROM jobs ORDER BY created DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [Job.from_row(row) for row in rows]
+
+    # Funkcja pobierająca najstarsze oczekujące zadanie i oznaczająca je jako wykonywane
+    # (jedna instrukcja UPDATE - dwa wątki nie dostaną tego samego zadania)
+    def claim(self, worker_id):
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, worker = ?, "
+                "heartbeat = ?, updated = ?, cancel_requested = 0 "
+                "WHERE id = (SELECT id FROM jobs WHERE status = 'queued' AND available_at <= ? "
+                "ORDER BY created LIMIT 1) "
+                f"RETURNING {JOB_COLUMNS}",
+                (worker_id, now, now, now)
+            ).fetchone()
+        return Job.from_row(row) if row else None
+
+    # Funkcja odświeżająca sygnał życia zadania (opcjonalnie z postępem);
+    # zwraca True, jeśli zażądano przerwania zadania
+    def heartbeat(self, job_id, progress=None):
+        now = time.time()
+        with self._lock, self._connection:
+            if progress is None:
+                self._connection.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (now, job_id))
+            else:
+                self._connection.execute(
+                    "UPDATE jobs SET heartbeat = ?, updated = ?, progress = ? WHERE id = ?",
+                    (now, now, json.dumps(progress, ensure_ascii=False), job_id)
+                )
+            row = self._connection.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def complete(self, job_id, result):
+        self._finish(job_id, "succeeded", result=json.dumps(result, ensure_ascii=False), error=None)
+
+    # Funkcja zapisująca błąd zadania: przy błędzie przejściowym zadanie wraca do kolejki
+    # z rosnącym opóźnieniem, dopóki nie wyczerpie limitu prób
+    def fail(self, job_id, error, retryable=False):
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT attempts, max_attempts FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row and retryable and row[0] < row[1]:
+                self._connection.execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, worker = NULL, updated = ?, available_at = ? WHERE id = ?",
+                    (error, now, now + JOB_RETRY_DELAY * 2 ** (row[0] - 1), job_id)
+                )
+                return
+            self._connection.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, worker = NULL, updated = ? WHERE id = ?",
+                (error, now, job_id)
+            )
+
+    def mark_cancelled(self, job_id):
+        self._finish(job_id, "cancelled")
+
+    def _finish(self, job_id, status, result=None, **columns):
+        with self._lock, self._connection:
+            # Opcjonalne kolumny (np. error=None czyści błąd poprzedniej próby)
+            assignments = "".join(f", {column} = ?" for column in columns)
+            self._connection.execute(
+                f"UPDATE jobs SET status = ?, result = COALESCE(?, result), worker = NULL, updated = ?{assignments} WHERE id = ?",
+                (status, result, time.time(), *columns.values(), job_id)
+            )
+
+    # Funkcja przerywająca zadanie: oczekujące jest anulowane od razu, wykonywane -
+    # przy najbliższym sygnale życia wątku roboczego
+    def cancel(self, job_id):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = 'cancelled', updated = ? WHERE id = ? AND status = 'queued'", (now, job_id)
+            )
+            self._connection.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated = ? WHERE id = ? AND status = 'running'", (now, job_id)
+            )
+
+    # Funkcja przywracająca do kolejki zadania porzucone przez wątki robocze (np. po restarcie
+    # procesu); zadania, które wyczerpały limit prób, oznaczane są jako nieudane
+    def requeue_stale(self, lease_seconds=JOB_LEASE_SECONDS):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "UPDATE jobs SET status = CASE WHEN attempts < max_attempts THEN 'queued' ELSE 'failed' END, "
+                "error = COALESCE(error, 'Zadanie przerwane (brak sygnału życia wątku roboczego)'), "
+                "worker = NULL, updated = ?, available_at = ? "
+                "WHERE status = 'running' AND heartbeat < ?",
+                (now, now, now - lease_seconds)
+            )
+
+    # Funkcja usuwająca zakończone zadania starsze niż retention_seconds
+    def purge(self, retention_seconds=JOB_RETENTION_SECONDS):
+        with self._lock, self._connection:
+            self._connection.execute(
+                "DELETE FROM jobs WHERE status IN ('succeeded', 'failed', 'cancelled') AND updated < ?",
+                (time.time() - retention_seconds,)
+            )
+
+    def stats(self):
+        with self._lock:
+            rows = self._connection.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = dict.fromkeys(JOB_STATUSES, 0)
+        counts.update(dict(rows))
+        return counts
+
+
+# Kontekst wykonywanego zadania przekazywany do funkcji obsługi: zapis postępu
+# i sprawdzanie żądania przerwania (z ograniczeniem częstotliwości zapisów do bazy).
+# Użyty jako menedżer kontekstu odświeża sygnał życia z osobnego wątku przez cały czas
+# wykonywania zadania - także w długich etapach bez postępu (streszczanie e-booka,
+# generowanie bez strumienia), więc requeue_stale nie przekaże zadania drugiemu wątkowi.
+class JobContext:
+    def __init__(self, queue, job, renew_interval=LEASE_RENEW_INTERVAL):
+        self.queue = queue
+        self.job = job
+        self.renew_interval = renew_interval
+        self._last_heartbeat = time.monotonic()
+        self._cancel_requested = False
+        self._done = threading.Event()
+        self._renew_thread = None
+
+    def __enter__(self):
+        self._renew_thread = threading.Thread(
+            target=self._renew_lease, name=f"mailgen-job-lease-{self.job.id[:8]}", daemon=True
+        )
+        self._renew_thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._done.set()
+        self._renew_thread.join()
+
+    def _renew_lease(self):
+        while not self._done.wait(self.renew_interval):
+            try:
+                if self.queue.heartbeat(self.job.id):
+                    self._cancel_requested = True
+            except Exception:
+                logger.exception("Nie udało się odświeżyć sygnału życia zadania %s", self.job.id)
+
+    def report_progress(self, progress):
+        self._last_heartbeat = time.monotonic()
+        self._cancel_requested = self.queue.heartbeat(self.job.id, progress)
+
+    def should_cancel(self):
+        if time.monotonic() - self._last_heartbeat >= HEARTBEAT_INTERVAL:
+            self._last_heartbeat = time.monotonic()
+            self._cancel_requested = self.queue.heartbeat(self.job.id)
+        return self._cancel_requested
+
+    # Funkcja przerywająca zadanie między etapami, jeśli zażądano przerwania
+    def raise_if_cancelled(self):
+        if self.should_cancel():
+            raise GenerationCancelledError("Generowanie zostało przerwane.")
+
+
+# Pula wątków roboczych wykonujących zadania z kolejki. handlers to słownik
+# {rodzaj zadania: funkcja(job, context) -> wynik (dict)}; is_retryable(wyjątek)
+# decyduje, czy po błędzie zadanie ma zostać ponowione.
+class JobWorkerPool:
+    def __init__(self, queue, handlers, workers=JOB_WORKERS, is_retryable=None, poll_interval=1.0):
+        self.queue = queue
+        self.handlers = handlers
+        self.workers = max(1, workers)
+        self.is_retryable = is_retryable or (lambda error: False)
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self.queue.requeue_stale()
+        self.queue.purge()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, args=(f"{os.getpid()}-{i}",), name=f"mailgen-job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                job = self.queue.claim(worker_id)
+            except Exception:
+                logger.exception("Nie udało się pobrać zadania z kolejki")
+                job = None
+
+            if job is None:
+                try:
+                    self.queue.requeue_stale()
+                except Exception:
+                    logger.exception("Nie udało się przywrócić porzuconych zadań do kolejki")
+                self._stop.wait(self.poll_interval)
+                continue
+            self._execute(job)
+
+    def _execute(self, job):
+        handler = self.handlers.get(job.kind)
+        if handler is None:
+            self.queue.fail(job.id, f"Nieznany rodzaj zadania: {job.kind}")
+            return
+
+        try:
+            with JobContext(self.queue, job) as context:
+                result = handler(job, context)
+        except GenerationCancelledError:
+            self.queue.mark_cancelled(job.id)
+        except Exception as e:
+            logger.warning("Zadanie %s zakończone błędem (próba %s/%s): %s", job.id, job.attempts, job.max_attempts, e)
+            self.queue.fail(job.id, str(e), retryable=self.is_retryable(e))
+        else:
+            self.queue.complete(job.id, result)
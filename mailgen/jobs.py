@@ -0,0 +1,115 @@
+import functools
+import os
+
+from mailgen import core
+from mailgen.errors import MailGenError, RateLimitExceededError
+from mailgen.job_queue import JobQueue, JobWorkerPool
+from mailgen.rate_limiter import classify_error
+from mailgen.settings import CACHE_DIR
+from mailgen.token_budget import PageTokenCounter
+
+# Zadania generowania wykonywane w tle (mailgen.job_queue): odczyt PDF, generowanie
+# treści i podstawienie ich w szablonie. Częściowe wyniki (gotowe sekcje) zapisywane są
+# jako postęp zadania, więc interfejs może je pokazywać jeszcze przed zakończeniem.
+# Klucz API nie jest zapisywany w bazie - wątki robocze korzystają z OPENAI_API_KEY.
+
+GENERATE_JOB = "generate"
+
+
+# Kolejka zadań współdzielona w obrębie procesu
+@functools.lru_cache(maxsize=None)
+def get_job_queue():
+    return JobQueue(os.path.join(CACHE_DIR, "jobs.sqlite3"))
+
+
+# Pula wątków roboczych uruchamiana raz na proces (przy pierwszym użyciu)
+@functools.lru_cache(maxsize=None)
+def get_job_workers():
+    return JobWorkerPool(get_job_queue(), {GENERATE_JOB: run_generation_job}, is_retryable=is_retryable_error).start()
+
+
+# Funkcja decydująca, czy błąd zadania jest przejściowy i warto spróbować ponownie: wyczerpany
+# limit zapytań albo (także jako przyczyna błędu generowania) 429, błąd serwera, przekroczony
+# czas lub błąd połączenia. Pozostałe błędy (niepoprawna odpowiedź modelu, za długie sekcje,
+# odrzucony klucz API) kończą zadanie od razu - ponowienie zużyłoby tokeny bez szans na sukces.
+def is_retryable_error(error):
+    seen = set()
+    while error is not None and id(error) not in seen:
+        if isinstance(error, RateLimitExceededError) or classify_error(error) is not None:
+            return True
+        seen.add(id(error))
+        error = error.__cause__
+    return False
+
+
+# Funkcja dodająca zadanie generowania do kolejki; zwraca identyfikator zadania
+def submit_generation_job(pdf_bytes, persona, html_template, author_info="", model="o4-mini", tone="przyjazny", lengths=None, structured_output=False, bypass_cache=False, max_pages=None, max_chars=None):
+    payload = {
+        "persona": persona,
+        "html_template": html_template,
+        "author_info": author_info or "",
+        "model": model,
+        "tone": tone,
+        "lengths": dict(lengths or {}),
+        "structured_output": structured_output,
+        "bypass_cache": bypass_cache,
+        "max_pages": max_pages,
+        "max_chars": max_chars,
+    }
+    return get_job_queue().submit(GENERATE_JOB, payload, input_data=pdf_bytes)
+
+
+# Funkcja odczytująca tekst PDF zadania (dla regeneracji sekcji po podłączeniu się do wyniku;
+# dzięki pamięci podręcznej PDF nie wymaga ponownego odczytu pliku)
+def read_job_pdf_text(job, token_counter=None):
+    return core.read_pdf(
+        get_job_queue().get_input(job.id), max_pages=job.payload["max_pages"],
+        max_chars=job.payload["max_chars"], token_counter=token_counter
+    )
+
+
+# Funkcja wykonująca zadanie generowania (wywoływana w wątku roboczym)
+def run_generation_job(job, context):
+    payload = job.payload
+    context.report_progress({"stage": "pdf", "sections": {}})
+    pdf_text = read_job_pdf_text(job, PageTokenCounter(payload["model"]))
+    context.raise_if_cancelled()
+
+    html_template = payload["html_template"]
+    author_info = payload["author_info"]
+    required_variables = core.extract_variables_from_template(html_template)
+    if "author_credentials" in html_template and author_info.strip():
+        required_variables.add("author_credentials")
+    if not required_variables:
+        raise MailGenError("Nie znaleziono żadnych zmiennych w szablonie HTML.")
+
+    # Gotowe sekcje zapisywane jako postęp zadania (tryb strumieniowy)
+    sections = {}
+
+    def on_section(section_name, content):
+        sections[section_name] = content
+        context.report_progress({"stage": "generate", "sections": sections})
+
+    context.report_progress({"stage": "generate", "sections": sections})
+    result = core.analyze_pdf_with_openai(
+        pdf_text,
+        payload["persona"],
+        required_variables,
+        author_info,
+        model=payload["model"],
+        tone=payload["tone"],
+        lengths={var: payload["lengths"].get(var, 300) for var in required_variables},
+        bypass_cache=payload["bypass_cache"],
+        structured_output=payload["structured_output"],
+        on_section=on_section,
+        should_cancel=context.should_cancel
+    )
+    context.raise_if_cancelled()
+
+    return {
+        "data": result.data,
+        "html": core.replace_variables_in_html(html_template, result.data),
+        "required_variables": sorted(required_variables),
+        "usage": result.usage,
+        "retried_keys": result.retried_keys,
+    }
@@ -0,0 +1,109 @@
+import json
+
+# Przyrostowy parser obiektu JSON zwracanego przez model: kolejne fragmenty odpowiedzi
+# (np. tokeny ze strumienia) są dopisywane do bufora, a parser zwraca pary klucz-wartość
+# najwyższego poziomu, gdy tylko wartość zostanie domknięta. Każdy znak analizowany jest
+# tylko raz. Tekst przed pierwszym "{" (np. komentarz modelu) jest pomijany.
+
+
+class IncrementalJsonObjectParser:
+    def __init__(self):
+        self.values = {}
+        self._text = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        self._token_start = 0
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    @property
+    def done(self):
+        return self._state == "done"
+
+    # Funkcja zapisująca domkniętą wartość (niepoprawne fragmenty są pomijane)
+    def _complete(self, raw_value, completed):
+        try:
+            value = json.loads(raw_value)
+        except json.JSONDecodeError:
+            return
+        self.values[self._key] = value
+        completed.append((self._key, value))
+
+    # Funkcja dopisująca fragment tekstu; zwraca listę nowo domkniętych par (klucz, wartość)
+    def feed(self, chunk):
+        self._text += chunk
+        text = self._text
+        completed = []
+        i = self._pos
+
+        while i < len(text) and self._state != "done":
+            c = text[i]
+            state = self._state
+
+            if state == "start":
+                if c == "{":
+                    self._state = "key"
+            elif state == "key":
+                if c == '"':
+                    self._token_start = i
+                    self._state = "key_string"
+                elif c == "}":
+                    self._state = "done"
+            elif state == "key_string":
+                if self._escape:
+                    self._escape = False
+                elif c == "\\":
+                    self._escape = True
+                elif c == '"':
+                    self._key = json.loads(text[self._token_start:i + 1])
+                    self._state = "colon"
+            elif state == "colon":
+                if c == ":":
+                    self._state = "value"
+            elif state == "value":
+                if not c.isspace():
+                    # Pierwszy znak wartości analizowany ponownie w stanie value_body
+                    self._token_start = i
+                    self._depth = 0
+                    self._in_string = False
+                    self._state = "value_body"
+                    continue
+            elif state == "value_body":
+                if self._in_string:
+                    if self._escape:
+                        self._escape = False
+                    elif c == "\\":
+                        self._escape = True
+                    elif c == '"':
+                        self._in_string = False
+                        if self._depth == 0:
+                            self._complete(text[self._token_start:i + 1], completed)
+                            self._state = "comma"
+                elif c == '"':
+                    self._in_string = True
+                elif c in "{[":
+                    self._depth += 1
+                elif c in "}]":
+                    if self._depth == 0:
+                        # Koniec całego obiektu po wartości prostej (liczba, true, null...)
+                        self._complete(text[self._token_start:i].strip(), completed)
+                        self._state = "done"
+                    else:
+                        self._depth -= 1
+                        if self._depth == 0:
+                            self._complete(text[self._token_start:i + 1], completed)
+                            self._state = "comma"
+                elif c == "," and self._depth == 0:
+                    self._complete(text[self._token_start:i].strip(), completed)
+                    self._state = "key"
+            elif state == "comma":
+                if c == ",":
+                    self._state = "key"
+                elif c == "}":
+                    self._state = "done"
+            i += 1
+
+        self._pos = i
+        return completed
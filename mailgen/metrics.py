@@ -0,0 +1,252 @@
+import bisect
+import collections
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Pomiary czasu i zużycia tokenów kolejnych etapów generowania (odczyt PDF, budowa promptu,
+# zapytanie do API, normalizacja, walidacja, renderowanie). Rejestr jest wspólny dla procesu;
+# dane można pokazać w panelu diagnostycznym albo wyeksportować jako JSON Lines lub tekst
+# w formacie Prometheus (opcjonalnie także przez prosty serwer HTTP do zbierania metryk).
+
+logger = logging.getLogger(__name__)
+
+# Liczba ostatnich pomiarów przechowywanych w pamięci (percentyle, eksport JSON Lines)
+METRICS_RECENT_EVENTS = int(os.environ.get("MAILGEN_METRICS_RECENT_EVENTS", "2000"))
+
+# Plik, do którego dopisywany jest każdy pomiar w formacie JSON Lines (puste - wyłączone)
+METRICS_JSONL_PATH = os.environ.get("MAILGEN_METRICS_JSONL", "")
+
+# Port serwera HTTP z metrykami w formacie Prometheus (/metrics); 0 - wyłączony
+METRICS_PORT = int(os.environ.get("MAILGEN_METRICS_PORT", "0"))
+
+# Granice przedziałów histogramu czasu etapów (w sekundach)
+DURATION_BUCKETS = (0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+TOKEN_KINDS = ("prompt_tokens", "cached_tokens", "completion_tokens")
+
+
+# Funkcja zamieniająca etykiety pomiaru na klucz statystyk: posortowane pary (nazwa, wartość)
+# z wartościami jako tekst (np. stream=True -> "true"), dzięki czemu statystyki etapu
+# są osobne dla każdego modelu, trafienia lub chybienia pamięci podręcznej itp.
+def label_key(labels):
+    return tuple(sorted(
+        (str(name), str(value).lower() if isinstance(value, bool) else str(value))
+        for name, value in labels.items()
+    ))
+
+
+# Funkcja zabezpieczająca wartość etykiety w formacie tekstowym Prometheus
+def _escape_label_value(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Funkcja budująca listę etykiet serii Prometheus: etap, etykiety pomiaru i dodatkowe (np. le)
+def _prometheus_labels(stage, labels, **extra):
+    pairs = [("stage", stage), *labels, *extra.items()]
+    return ",".join(f'{name}="{_escape_label_value(str(value))}"' for name, value in pairs)
+
+
+# Pomiar jednego wywołania etapu: etykiety i zużycie tokenów można uzupełnić w trakcie
+class Span:
+    def __init__(self, stage, labels):
+        self.stage = stage
+        self.labels = dict(labels)
+        self.tokens = dict.fromkeys(TOKEN_KINDS, 0)
+
+    # Funkcja dodająca zużycie tokenów (słownik z extract_usage lub lista wpisów z etykietami)
+    def add_usage(self, usage):
+        entries = usage if isinstance(usage, list) else [usage]
+        for entry in entries:
+            if entry:
+                for kind in TOKEN_KINDS:
+                    self.tokens[kind] += entry.get(kind, 0) or 0
+
+
+# Statystyki etapu (dla jednego zestawu etykiet): liczba wywołań (z podziałem na status), histogram czasu i suma tokenów
+class StageStats:
+    def __init__(self):
+        self.calls = collections.Counter()
+        self.bucket_counts = [0] * (len(DURATION_BUCKETS) + 1)
+        self.duration_sum = 0.0
+        self.duration_max = 0.0
+        self.tokens = dict.fromkeys(TOKEN_KINDS, 0)
+
+    def observe(self, duration, status, tokens):
+        self.calls[status] += 1
+        self.bucket_counts[bisect.bisect_left(DURATION_BUCKETS, duration)] += 1
+        self.duration_sum += duration
+        self.duration_max = max(self.duration_max, duration)
+        for kind, count in tokens.items():
+            self.tokens[kind] += count
+
+
+class MetricsRegistry:
+    def __init__(self, recent_events=METRICS_RECENT_EVENTS, jsonl_path=METRICS_JSONL_PATH):
+        self.jsonl_path = jsonl_path
+        self._stages = {}
+        self._recent = collections.deque(maxlen=recent_events)
+        self._lock = threading.Lock()
+
+    # Funkcja mierząca czas bloku kodu; status "error", jeśli blok zakończył się wyjątkiem
+    @contextmanager
+    def span(self, stage, **labels):
+        span = Span(stage, labels)
+        start = time.perf_counter()
+        status = "error"
+        try:
+            yield span
+            status = "ok"
+        finally:
+            self.observe(span, time.perf_counter() - start, status)
+
+    def observe(self, span, duration, status):
+        event = {
+            "ts": round(time.time(), 3),
+            "stage": span.stage,
+            "status": status,
+            "duration_ms": round(duration * 1000, 3),
+            **{key: value for key, value in span.labels.items()},
+            **{kind: count for kind, count in span.tokens.items() if count},
+        }
+        key = (span.stage, label_key(span.labels))
+        with self._lock:
+            self._stages.setdefault(key, StageStats()).observe(duration, status, span.tokens)
+            self._recent.append((key, event))
+
+        if self.jsonl_path:
+            try:
+                with open(self.jsonl_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(event, ensure_ascii=False) + "\n")
+            except OSError as e:
+                logger.warning("Nie udało się zapisać pomiaru do %s: %s", self.jsonl_path, e)
+
+    # Funkcja zwracająca podsumowanie etapów z podziałem według etykiet
+    # (percentyle z ostatnich pomiarów)
+    def summary(self):
+        with self._lock:
+            stages = dict(self._stages)
+            durations = collections.defaultdict(list)
+            for key, event in self._recent:
+                durations[key].append(event["duration_ms"])
+
+            rows = []
+            for key, stats in sorted(stages.items()):
+                stage, labels = key
+                calls = sum(stats.calls.values())
+                recent = sorted(durations[key])
+                rows.append({
+                    "etap": stage,
+                    "etykiety": ", ".join(f"{name}={value}" for name, value in labels),
+                    "wywołania": calls,
+                    "błędy": stats.calls["error"],
+                    "średnio [ms]": round(stats.duration_sum * 1000 / calls, 2),
+                    "p50 [ms]": round(recent[len(recent) // 2], 2) if recent else None,
+                    "p95 [ms]": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))], 2) if recent else None,
+                    "maks. [ms]": round(stats.duration_max * 1000, 2),
+                    **{kind: stats.tokens[kind] for kind in TOKEN_KINDS},
+                })
+            return rows
+
+    # Eksport ostatnich pomiarów w formacie JSON Lines (jeden pomiar w wierszu)
+    def to_jsonl(self):
+        with self._lock:
+            return "".join(json.dumps(event, ensure_ascii=False) + "\n" for _, event in self._recent)
+
+    # Eksport w formacie tekstowym Prometheus (histogram czasu, liczniki wywołań i tokenów);
+    # etykiety pomiarów (model, cache, stream, strategy) są etykietami serii
+    def to_prometheus(self):
+        lines = [
+            "# HELP mailgen_stage_duration_seconds Czas wykonania etapu generowania.",
+            "# TYPE mailgen_stage_duration_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+
+            for (stage, labels), stats in stages:
+                series = _prometheus_labels(stage, labels)
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ("+Inf",), stats.bucket_counts):
+                    cumulative += count
+                    lines.append(f'mailgen_stage_duration_seconds_bucket{{{_prometheus_labels(stage, labels, le=bound)}}} {cumulative}')
+                lines.append(f'mailgen_stage_duration_seconds_sum{{{series}}} {stats.duration_sum:.6f}')
+                lines.append(f'mailgen_stage_duration_seconds_count{{{series}}} {cumulative}')
+
+            lines += [
+                "# HELP mailgen_stage_calls_total Liczba wywołań etapu według statusu.",
+                "# TYPE mailgen_stage_calls_total counter",
+            ]
+            for (stage, labels), stats in stages:
+                for status, count in sorted(stats.calls.items()):
+                    lines.append(f'mailgen_stage_calls_total{{{_prometheus_labels(stage, labels, status=status)}}} {count}')
+
+            lines += [
+                "# HELP mailgen_tokens_total Tokeny zużyte przez zapytania etapu.",
+                "# TYPE mailgen_tokens_total counter",
+            ]
+            for (stage, labels), stats in stages:
+                for kind in TOKEN_KINDS:
+                    series = _prometheus_labels(stage, labels, kind=kind.removesuffix("_tokens"))
+                    lines.append(f'mailgen_tokens_total{{{series}}} {stats.tokens[kind]}')
+
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._recent.clear()
+
+
+# Rejestr pomiarów współdzielony w obrębie procesu
+@functools.lru_cache(maxsize=None)
+def get_metrics():
+    return MetricsRegistry()
+
+
+# Dekorator mierzący czas wywołań funkcji jako etap stage. Jeśli wynik ma atrybut usage
+# (lista wpisów zużycia tokenów, np. GenerationResult), tokeny są doliczane do etapu.
+def timed(stage):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with get_metrics().span(stage) as span:
+                result = func(*args, **kwargs)
+                usage = getattr(result, "usage", None)
+                if isinstance(usage, list):
+                    span.add_usage(usage)
+                return result
+        return wrapper
+    return decorator
+
+
+# Funkcja uruchamiająca (raz na proces) serwer HTTP z metrykami w formacie Prometheus
+@functools.lru_cache(maxsize=None)
+def start_metrics_server(port=METRICS_PORT):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = get_metrics().to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+    except OSError as e:
+        logger.warning("Nie udało się uruchomić serwera metryk na porcie %s: %s", port, e)
+        return None
+    threading.Thread(target=server.serve_forever, name="mailgen-metrics", daemon=True).start()
+    return server
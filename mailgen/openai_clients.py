@@ -0,0 +1,54 @@
+import os
+import threading
+
+# Limit czasu pojedynczego zapytania do API (w sekundach)
+OPENAI_TIMEOUT = float(os.environ.get("MAILGEN_OPENAI_TIMEOUT", "600"))
+
+# Liczba ponownych prób wykonywanych przez klienta OpenAI przy błędach przejściowych
+# (domyślnie 0 - ponowieniami i limitami zarządza mailgen.rate_limiter)
+OPENAI_MAX_RETRIES = int(os.environ.get("MAILGEN_OPENAI_MAX_RETRIES", "0"))
+
+# Rejestr klientów współdzielonych w obrębie procesu (przetrwa kolejne przebiegi skryptu
+# Streamlit, bo moduł importowany jest tylko raz). Każdy klient utrzymuje własną pulę
+# połączeń keep-alive, więc kolejne zapytania nie nawiązują ponownie połączenia TLS.
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+# Funkcja zwracająca współdzielonego klienta OpenAI dla danego klucza API.
+# Adres serwera można zmienić standardową zmienną OPENAI_BASE_URL (np. lokalny serwer testowy).
+def get_openai_client(api_key, timeout=None, max_retries=None):
+    timeout = OPENAI_TIMEOUT if timeout is None else timeout
+    max_retries = OPENAI_MAX_RETRIES if max_retries is None else max_retries
+    registry_key = (api_key, timeout, max_retries)
+
+    with _clients_lock:
+        client = _clients.get(registry_key)
+        if client is None:
+            # Import na żądanie - sam import modułu nie ładuje biblioteki openai
+            from openai import OpenAI
+
+            client = OpenAI(api_key=api_key, timeout=timeout, max_retries=max_retries)
+            _clients[registry_key] = client
+    return client
+
+
+# Funkcja tworząca asynchronicznego klienta OpenAI dla jednej serii równoległych zapytań.
+# Pula połączeń klienta asynchronicznego jest związana z pętlą zdarzeń, dlatego klient
+# nie trafia do rejestru - należy go używać jako menedżera kontekstu (async with).
+def get_async_openai_client(api_key, timeout=None, max_retries=None):
+    from openai import AsyncOpenAI
+
+    return AsyncOpenAI(
+        api_key=api_key,
+        timeout=OPENAI_TIMEOUT if timeout is None else timeout,
+        max_retries=OPENAI_MAX_RETRIES if max_retries is None else max_retries
+    )
+
+
+# Funkcja zamykająca wszystkie współdzielone klienty (np. przy zakończeniu procesu wsadowego)
+def close_openai_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,20 @@
+import hashlib
+
+from mailgen.disk_cache import DiskTextCache
+
+
+# Funkcja do wyliczania skrótu SHA-256 zawartości dokumentu
+def document_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+# Trwała pamięć podręczna tekstu wyodrębnionego z plików PDF.
+# Klucz to skrót SHA-256 zawartości pliku oraz wersja pypdf (nowa wersja biblioteki
+# może inaczej wyodrębniać tekst, więc nie korzystamy wtedy ze starych wpisów).
+class PdfTextCache(DiskTextCache):
+    def make_key(self, data, variant=""):
+        # Import na żądanie - wersja pypdf potrzebna jest dopiero przy wyliczaniu klucza
+        import pypdf
+
+        key_source = f"{document_hash(data)}:{pypdf.__version__}:{variant}"
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
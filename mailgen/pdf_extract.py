@@ -0,0 +1,127 @@
+import functools
+import io
+import mmap
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import pypdf
+
+# Poniżej tej liczby stron koszt uruchomienia procesów przewyższa zysk z równoległości
+PARALLEL_MIN_PAGES = int(os.environ.get("MAILGEN_PARALLEL_MIN_PAGES", "40"))
+
+# Rozmiar wspólnej puli procesów odczytu PDF (wszystkie odczyty w procesie - sesje Streamlit,
+# wątki batch_cli i zadania w tle - korzystają z tej samej puli, więc procesów nie przybywa
+# wraz z liczbą jednoczesnych odczytów)
+PDF_MAX_WORKERS = max(1, int(os.environ.get("MAILGEN_PDF_WORKERS", str(min(4, os.cpu_count() or 1)))))
+
+# Liczba zakresów stron przypadających na jeden proces (lepsze równoważenie obciążenia)
+RANGES_PER_WORKER = 4
+
+
+# Funkcja do podziału stron dokumentu na ciągłe zakresy [start, stop)
+def split_page_ranges(page_count, parts):
+    parts = max(1, min(parts, page_count))
+    base, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for i in range(parts):
+        stop = start + base + (1 if i < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+# Funkcja wykonywana w procesie roboczym - każdy proces otwiera własny czytnik
+# nad plikiem tymczasowym zmapowanym w pamięci (bez kopiowania całego PDF przez pickle)
+def _extract_page_range(pdf_path, start, stop):
+    with open(pdf_path, "rb") as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            pdf_reader = pypdf.PdfReader(mapped)
+            return [pdf_reader.pages[i].extract_text() for i in range(start, stop)]
+
+
+# Pula procesów odczytu PDF tworzona raz na proces (przy pierwszym użyciu). Procesy uruchamiane
+# są metodą "spawn" - fork wielowątkowego serwera Streamlit mógłby skopiować zajęte blokady.
+@functools.lru_cache(maxsize=None)
+def get_pdf_process_pool():
+    return ProcessPoolExecutor(max_workers=PDF_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+
+# Generator zwracający tekst kolejnych stron w miarę ich dekodowania (sekwencyjnie)
+def iter_pages_serial(pdf_reader, page_count):
+    for page_num in range(page_count):
+        yield pdf_reader.pages[page_num].extract_text()
+
+
+# Generator zwracający tekst kolejnych stron ze wspólnej puli procesów - zakresy stron
+# przetwarzane są równolegle, a wyniki oddawane w kolejności stron
+def iter_pages_parallel(pdf_bytes, page_count, max_workers):
+    page_ranges = split_page_ranges(page_count, max_workers * RANGES_PER_WORKER)
+
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf")
+    futures = []
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+
+        executor = get_pdf_process_pool()
+        futures = [
+            executor.submit(_extract_page_range, pdf_path, start, stop)
+            for start, stop in page_ranges
+        ]
+        for future in futures:
+            yield from future.result()
+    except BrokenProcessPool:
+        # Proces roboczy zakończył się awaryjnie - kolejny odczyt utworzy nową pulę
+        get_pdf_process_pool.cache_clear()
+        raise
+    finally:
+        # Przy wcześniejszym zakończeniu (limit stron/znaków) anuluj zakresy, które jeszcze
+        # nie wystartowały, i zaczekaj na trwające - dopiero wtedy plik można usunąć
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        os.remove(pdf_path)
+
+
+# Generator tekstu stron PDF: zwraca krotki (numer_strony, liczba_stron, tekst).
+# Opcjonalne limity stron i znaków pozwalają przerwać odczyt bardzo dużych plików.
+def iter_pdf_pages(pdf_bytes, max_pages=None, max_chars=None, max_workers=None):
+    pdf_reader = pypdf.PdfReader(io.BytesIO(pdf_bytes))
+    page_count = len(pdf_reader.pages)
+    if max_pages:
+        page_count = min(page_count, max_pages)
+
+    workers = max_workers or PDF_MAX_WORKERS
+    if page_count < PARALLEL_MIN_PAGES or workers < 2:
+        page_texts = iter_pages_serial(pdf_reader, page_count)
+    else:
+        page_texts = iter_pages_parallel(pdf_bytes, page_count, workers)
+
+    total_chars = 0
+    try:
+        for page_num, text in enumerate(page_texts):
+            if max_chars and total_chars + len(text) >= max_chars:
+                # Ostatnia strona przycinana do limitu znaków
+                yield page_num, page_count, text[:max_chars - total_chars]
+                return
+            total_chars += len(text)
+            yield page_num, page_count, text
+    finally:
+        page_texts.close()
+
+
+# Funkcja do wyodrębnienia tekstu z PDF - wybiera ścieżkę sekwencyjną lub równoległą.
+# Wynik jest identyczny niezależnie od wybranej ścieżki.
+def extract_pdf_text(pdf_bytes, max_pages=None, max_chars=None, max_workers=None, on_page=None):
+    page_texts = []
+    for page_num, page_count, text in iter_pdf_pages(pdf_bytes, max_pages, max_chars, max_workers):
+        page_texts.append(text)
+        if on_page:
+            on_page(page_num, page_count, text)
+
+    # Jednokrotne złączenie zamiast wielokrotnego doklejania (+=)
+    return "".join(page_texts)
@@ -0,0 +1,48 @@
+# Budowanie wiadomości dla modelu w układzie sprzyjającym buforowaniu promptu po stronie
+# dostawcy: najpierw stała część (instrukcja systemowa i treść e-booka, identyczna bajt
+# w bajt przy każdym zapytaniu o ten sam dokument), a dopiero na końcu zmienne instrukcje
+# (persona, ton, sekcje, długości). Dzięki temu kolejne generowania i regeneracje sekcji
+# współdzielą ten sam prefiks.
+
+# Wspólna instrukcja systemowa dla wszystkich zapytań opartych na treści e-booka
+EBOOK_SYSTEM_PROMPT = (
+    "Jesteś ekspertem w tworzeniu najwyższej klasy treści marketingowych i perswazyjnych. "
+    "Twoje teksty charakteryzują się wysoką skutecznością, profesjonalizmem i doskonałym "
+    "dopasowaniem do grupy docelowej. W pierwszej wiadomości użytkownika otrzymujesz treść "
+    "e-booka, a w kolejnej - szczegółowe zadanie do wykonania."
+)
+
+
+# Funkcja do deterministycznego przygotowania bloku z treścią e-booka
+# (ujednolicone końce linii i brak zbędnych białych znaków na brzegach)
+def build_document_block(ebook_text):
+    normalized = ebook_text.replace("\r\n", "\n").replace("\r", "\n").strip()
+    return f"TREŚĆ E-BOOKA:\n{normalized}\n"
+
+
+# Funkcja do zbudowania listy wiadomości: stały prefiks (system + e-book) i zmienne instrukcje
+def build_messages(ebook_text, instructions):
+    return [
+        {"role": "system", "content": EBOOK_SYSTEM_PROMPT},
+        {"role": "user", "content": build_document_block(ebook_text)},
+        {"role": "user", "content": instructions.strip()}
+    ]
+
+
+# Funkcja do odczytania zużycia tokenów z odpowiedzi API, w tym tokenów
+# wejściowych obsłużonych z pamięci podręcznej promptu
+def extract_usage(response):
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+
+    prompt_tokens = getattr(usage, "prompt_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+
+    return {
+        "prompt_tokens": prompt_tokens,
+        "cached_tokens": cached_tokens,
+        "uncached_tokens": prompt_tokens - cached_tokens,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0
+    }
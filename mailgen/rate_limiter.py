@@ -0,0 +1,302 @@
+import asyncio
+import email.utils
+import functools
+import logging
+import os
+import random
+import threading
+import time
+
+from mailgen.errors import RateLimitExceededError
+
+# Wspólny harmonogram zapytań do API OpenAI w obrębie procesu. Wszystkie wywołania modelu
+# (generowanie, naprawa, regeneracja sekcji, streszczenia) przechodzą przez jeden obiekt,
+# który pilnuje limitów zapytań i tokenów na minutę (kubełki żetonów), dobiera liczbę
+# jednoczesnych zapytań metodą AIMD (wolny wzrost po sukcesach, połowa po odpowiedzi 429)
+# i ponawia błędy przejściowe z wykładniczym opóźnieniem z losowym rozrzutem,
+# respektując nagłówek Retry-After. Dzięki temu przy wielu równoległych e-bookach
+# przepustowość trzyma się blisko limitu konta zamiast serii błędów 429.
+
+logger = logging.getLogger(__name__)
+
+# Limit zapytań na minutę (0 - bez limitu)
+RATE_LIMIT_RPM = int(os.environ.get("MAILGEN_RATE_LIMIT_RPM", "500"))
+
+# Limit tokenów na minutę (0 - bez limitu)
+RATE_LIMIT_TPM = int(os.environ.get("MAILGEN_RATE_LIMIT_TPM", "200000"))
+
+# Początkowa i maksymalna liczba jednoczesnych zapytań (AIMD dobiera wartość z zakresu)
+RATE_LIMIT_INITIAL_CONCURRENCY = int(os.environ.get("MAILGEN_RATE_LIMIT_CONCURRENCY", "8"))
+RATE_LIMIT_MAX_CONCURRENCY = int(os.environ.get("MAILGEN_RATE_LIMIT_MAX_CONCURRENCY", "32"))
+
+# Ile sekund limitu może zostać wykorzystane naraz (pojemność kubełków); API egzekwuje
+# limity minutowe także w krótszych oknach, więc pełna minuta w jednej serii kończy się 429
+RATE_LIMIT_BURST_SECONDS = float(os.environ.get("MAILGEN_RATE_LIMIT_BURST_SECONDS", "0.1"))
+
+# Maksymalna liczba ponowień zapytania po błędzie przejściowym
+RATE_LIMIT_MAX_RETRIES = int(os.environ.get("MAILGEN_RATE_LIMIT_MAX_RETRIES", "6"))
+
+# Opóźnienie pierwszego ponowienia i górny limit opóźnienia (w sekundach)
+RETRY_BASE_DELAY = float(os.environ.get("MAILGEN_RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.environ.get("MAILGEN_RETRY_MAX_DELAY", "60"))
+
+# Minimalny odstęp (w sekundach) między kolejnymi zmniejszeniami liczby jednoczesnych zapytań
+DECREASE_INTERVAL = 1.0
+
+# Co ile sekund oczekujące zapytanie sprawdza, czy zwolniło się miejsce
+SLOT_POLL_INTERVAL = 0.05
+
+# Szacunkowa liczba znaków na token przy rezerwacji tokenów przed zapytaniem
+# (rzeczywiste zużycie z odpowiedzi koryguje stan kubełka)
+ESTIMATE_CHARS_PER_TOKEN = 3.0
+
+# Kody HTTP uznawane za błędy przejściowe (poza 429)
+TRANSIENT_STATUS_CODES = frozenset({408, 409, 500, 502, 503, 504})
+
+
+# Kubełek żetonów: uzupełniany równomiernie (rate_per_minute na minutę) do pojemności
+# odpowiadającej burst_seconds limitu (co najmniej jeden żeton). Stan może spaść poniżej
+# zera - rezerwacja szacunkowa jest później korygowana rzeczywistym zużyciem (adjust).
+class TokenBucket:
+    def __init__(self, rate_per_minute, burst_seconds=RATE_LIMIT_BURST_SECONDS):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1.0, self.rate * burst_seconds) if rate_per_minute else 0.0
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    # Funkcja zwracająca czas (w sekundach), po którym będzie dostępne amount żetonów
+    # (zapytania większe niż cały kubełek czekają tylko na jego pełne uzupełnienie)
+    def wait_time(self, amount, now):
+        if not self.capacity:
+            return 0.0
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        return 0.0 if self.level >= amount else (amount - self.level) / self.rate
+
+    def take(self, amount):
+        if self.capacity:
+            self.level -= amount
+
+    def adjust(self, amount):
+        if self.capacity:
+            self.level = min(self.capacity, self.level + amount)
+
+
+# Funkcja szacująca liczbę tokenów wejściowych zapytania na podstawie długości wiadomości
+def estimate_request_tokens(messages):
+    return int(sum(len(message.get("content") or "") for message in messages) / ESTIMATE_CHARS_PER_TOKEN)
+
+
+# Funkcja zwracająca łączne zużycie tokenów z odpowiedzi API (lub None)
+def response_total_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+# Funkcja odczytująca czas oczekiwania z nagłówków odpowiedzi (retry-after-ms, retry-after
+# w sekundach lub jako data HTTP); None, jeśli serwer go nie podał
+def parse_retry_after(headers):
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+# Funkcja klasyfikująca błąd zapytania: "rate_limit" (429), "transient" (przekroczony czas,
+# błąd połączenia lub serwera) albo None - błąd trwały, którego nie warto ponawiać
+def classify_error(error):
+    status_code = getattr(error, "status_code", None)
+    if status_code == 429:
+        # Wyczerpany budżet konta to nie chwilowy limit - ponowienie nic nie da
+        if getattr(error, "code", None) == "insufficient_quota":
+            return None
+        return "rate_limit"
+    if status_code in TRANSIENT_STATUS_CODES:
+        return "transient"
+    if status_code is None:
+        # Import na żądanie - klasyfikacja błędów połączenia wymaga biblioteki openai
+        try:
+            import openai
+        except ImportError:
+            return None
+        if isinstance(error, openai.APIConnectionError):
+            return "transient"
+    return None
+
+
+class RateLimitScheduler:
+    def __init__(self, requests_per_minute=RATE_LIMIT_RPM, tokens_per_minute=RATE_LIMIT_TPM, concurrency=RATE_LIMIT_INITIAL_CONCURRENCY, max_concurrency=RATE_LIMIT_MAX_CONCURRENCY, min_concurrency=1, max_retries=RATE_LIMIT_MAX_RETRIES, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY, burst_seconds=RATE_LIMIT_BURST_SECONDS):
+        self.request_bucket = TokenBucket(requests_per_minute, burst_seconds)
+        self.token_bucket = TokenBucket(tokens_per_minute, burst_seconds)
+        self.min_concurrency = max(1, min_concurrency)
+        self.max_concurrency = max(self.min_concurrency, max_concurrency)
+        self.concurrency = float(min(max(concurrency, self.min_concurrency), self.max_concurrency))
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self._cooldown_until = 0.0
+        self._last_decrease = float("-inf")
+        self._lock = threading.Lock()
+        self._counters = {"requests": 0, "rate_limited": 0, "retries": 0, "failures": 0, "wait_seconds": 0.0}
+
+    # Funkcja próbująca zająć miejsce na zapytanie; zwraca 0, jeśli się udało,
+    # a w przeciwnym razie czas (w sekundach), po którym warto spróbować ponownie
+    def _try_acquire(self, estimated_tokens):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._cooldown_until:
+                return self._cooldown_until - now
+            if self.in_flight >= int(self.concurrency):
+                return SLOT_POLL_INTERVAL
+            wait = max(self.request_bucket.wait_time(1, now), self.token_bucket.wait_time(estimated_tokens, now))
+            if wait > 0:
+                return wait
+            self.request_bucket.take(1)
+            self.token_bucket.take(estimated_tokens)
+            self.in_flight += 1
+            self._counters["requests"] += 1
+            return 0.0
+
+    # Funkcja zwalniająca miejsce i korygująca kubełek tokenów rzeczywistym zużyciem
+    # (None - zużycie nieznane; przy błędzie zarezerwowane tokeny wracają do kubełka)
+    def _release(self, estimated_tokens, actual_tokens=None, success=True):
+        with self._lock:
+            self.in_flight -= 1
+            if not success:
+                self.token_bucket.adjust(estimated_tokens)
+                return
+            if actual_tokens is not None:
+                self.token_bucket.adjust(estimated_tokens - actual_tokens)
+            # Wzrost addytywny: około +1 zapytania na każde "okno" udanych zapytań
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+
+    # Funkcja obsługująca błąd zapytania; zwraca opóźnienie przed kolejną próbą
+    # albo zgłasza wyjątek, jeśli błędu nie warto (lub nie można już) ponawiać
+    def _on_error(self, error, attempt):
+        kind = classify_error(error)
+        with self._lock:
+            if kind is None or attempt > self.max_retries:
+                self._counters["failures"] += 1
+                if kind == "rate_limit":
+                    raise RateLimitExceededError(
+                        "Przekroczono limit zapytań API OpenAI mimo kolejnych prób. Spróbuj ponownie za chwilę."
+                    ) from error
+                raise error
+
+            self._counters["retries"] += 1
+            delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+            # Pełny rozrzut (full jitter) - ponowienia wielu zapytań nie trafiają w tę samą chwilę
+            delay = random.uniform(0, delay)
+
+            if kind == "rate_limit":
+                self._counters["rate_limited"] += 1
+                now = time.monotonic()
+                retry_after = parse_retry_after(getattr(getattr(error, "response", None), "headers", None))
+                if retry_after is not None:
+                    retry_after = min(self.max_delay, retry_after)
+                    # Wstrzymanie wszystkich nowych zapytań do upływu Retry-After; ponawiane
+                    # zapytania dostają dodatkowy rozrzut, aby nie wróciły w tej samej chwili
+                    self._cooldown_until = max(self._cooldown_until, now + retry_after)
+                    delay = retry_after + random.uniform(0, self.base_delay)
+
+                # Spadek multiplikatywny - najwyżej raz na DECREASE_INTERVAL, a nie po każdej
+                # z wielu równoczesnych odpowiedzi 429
+                if now - self._last_decrease >= DECREASE_INTERVAL:
+                    self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+                    self._last_decrease = now
+
+        logger.info("Zapytanie do API nieudane (%s, próba %s) - ponowienie za %.1f s: %s", kind, attempt, delay, error)
+        return delay
+
+    # Funkcja wykonująca zapytanie (request - funkcja bez argumentów) z zachowaniem limitów
+    # i ponowieniami. count_tokens(wynik) zwraca rzeczywiste zużycie tokenów (lub None).
+    def run(self, request, estimated_tokens=0, count_tokens=response_total_tokens):
+        attempt = 0
+        while True:
+            attempt += 1
+            self._wait_for_slot(estimated_tokens)
+            try:
+                result = request()
+            except BaseException as e:
+                self._release(estimated_tokens, success=False)
+                if not isinstance(e, Exception):
+                    raise
+                time.sleep(self._on_error(e, attempt))
+                continue
+            self._release(estimated_tokens, count_tokens(result) if count_tokens else None)
+            return result
+
+    # Wersja asynchroniczna run (request - funkcja zwracająca obiekt oczekiwalny)
+    async def run_async(self, request, estimated_tokens=0, count_tokens=response_total_tokens):
+        attempt = 0
+        while True:
+            attempt += 1
+            await self._wait_for_slot_async(estimated_tokens)
+            try:
+                result = await request()
+            except BaseException as e:
+                self._release(estimated_tokens, success=False)
+                if not isinstance(e, Exception):
+                    raise
+                await asyncio.sleep(self._on_error(e, attempt))
+                continue
+            self._release(estimated_tokens, count_tokens(result) if count_tokens else None)
+            return result
+
+    def _wait_for_slot(self, estimated_tokens):
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if not wait:
+                break
+            time.sleep(wait)
+            waited += wait
+        self._record_wait(waited)
+
+    async def _wait_for_slot_async(self, estimated_tokens):
+        waited = 0.0
+        while True:
+            wait = self._try_acquire(estimated_tokens)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+            waited += wait
+        self._record_wait(waited)
+
+    def _record_wait(self, waited):
+        if waited:
+            with self._lock:
+                self._counters["wait_seconds"] += waited
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._counters,
+                "concurrency": int(self.concurrency),
+                "in_flight": self.in_flight,
+            }
+
+
+# Harmonogram współdzielony przez wszystkie zapytania w procesie
+@functools.lru_cache(maxsize=None)
+def get_rate_limiter():
+    return RateLimitScheduler()
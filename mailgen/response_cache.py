@@ -0,0 +1,188 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from mailgen.errors import GenerationCancelledError, GenerationError
+from mailgen.prompts import extract_usage
+from mailgen.rate_limiter import estimate_request_tokens, get_rate_limiter
+
+# Czas ważności zapamiętanej odpowiedzi (w sekundach, domyślnie 7 dni)
+RESPONSE_CACHE_TTL = int(os.environ.get("MAILGEN_RESPONSE_CACHE_TTL", str(7 * 24 * 3600)))
+
+# Maksymalna liczba zapamiętanych odpowiedzi
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get("MAILGEN_RESPONSE_CACHE_MAX_ENTRIES", "500"))
+
+
+# Pamięć podręczna odpowiedzi modelu w bazie SQLite.
+# Klucz to deterministyczny odcisk zapytania (model, wiadomości, dodatkowe parametry),
+# więc identyczne zapytanie - np. po odświeżeniu strony - nie jest wysyłane ponownie.
+class ResponseCache:
+    def __init__(self, path, ttl_seconds=RESPONSE_CACHE_TTL, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+
+    # Funkcja do wyliczenia odcisku zapytania (klucze słowników sortowane dla determinizmu)
+    @staticmethod
+    def fingerprint(model, messages, **params):
+        payload = json.dumps(
+            {"model": model, "messages": messages, "params": params},
+            sort_keys=True,
+            ensure_ascii=False
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT content, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    with self._connection:
+                        self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+
+            with self._connection:
+                self._connection.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, content):
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, content, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, content, now, now)
+            )
+            # Usunięcie przeterminowanych wpisów i najdawniej używanych ponad limit
+            self._connection.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE key NOT IN "
+                "(SELECT key FROM responses ORDER BY accessed DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+
+    def delete(self, key):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+# Funkcja do przygotowania parametrów zapytania i klucza pamięci podręcznej
+# (response_format, np. schemat JSON, jest wysyłany do API i wchodzi do odcisku zapytania)
+def _prepare_request(model, messages, response_cache, response_format, cache_params):
+    request_params = {}
+    if response_format is not None:
+        request_params["response_format"] = response_format
+        cache_params["response_format"] = response_format
+
+    cache_key = None
+    if response_cache is not None:
+        cache_key = response_cache.fingerprint(model, messages, **cache_params)
+    return request_params, cache_key
+
+
+# Funkcja do wywołania modelu z użyciem pamięci podręcznej odpowiedzi.
+# Zwraca krotkę (treść, zużycie tokenów); dla odpowiedzi z pamięci zużycie to None.
+# cache_params trafiają tylko do odcisku zapytania (np. poprzednia wersja sekcji).
+def create_completion(client, model, messages, response_cache=None, bypass_cache=False, response_format=None, **cache_params):
+    request_params, cache_key = _prepare_request(model, messages, response_cache, response_format, cache_params)
+    if cache_key is not None and not bypass_cache:
+        content = response_cache.get(cache_key)
+        if content is not None:
+            return content, None
+
+    # Zapytanie przez wspólny harmonogram (limity zapytań i tokenów, ponowienia po 429)
+    response = get_rate_limiter().run(
+        lambda: client.chat.completions.create(model=model, messages=messages, **request_params),
+        estimate_request_tokens(messages)
+    )
+    # Przy odmowie modelu (structured outputs) treść jest pusta
+    content = response.choices[0].message.content or ""
+
+    if cache_key is not None and content:
+        response_cache.put(cache_key, content)
+    return content, extract_usage(response)
+
+
+# Funkcja do strumieniowego wywołania modelu: on_delta otrzymuje kolejne fragmenty treści
+# zaraz po ich nadejściu (odpowiedź z pamięci podręcznej - w całości, jednym wywołaniem).
+# should_cancel (opcjonalne) sprawdzane jest po każdym fragmencie; przerwanie - także
+# wyjątkiem zgłoszonym w on_delta - zamyka połączenie, więc model przestaje generować
+# tokeny. Niepełna odpowiedź nie trafia do pamięci podręcznej.
+def stream_completion(client, model, messages, on_delta, response_cache=None, bypass_cache=False, response_format=None, should_cancel=None, **cache_params):
+    request_params, cache_key = _prepare_request(model, messages, response_cache, response_format, cache_params)
+    if cache_key is not None and not bypass_cache:
+        content = response_cache.get(cache_key)
+        if content is not None:
+            on_delta(content)
+            return content, None
+
+    # Całe strumieniowanie zajmuje jedno miejsce w harmonogramie zapytań. Ponawiane jest
+    # tylko otwarcie strumienia - po przekazaniu pierwszych fragmentów do on_delta
+    # przerwane połączenie kończy generowanie błędem (fragmenty nie mogą się powtórzyć).
+    def request():
+        stream = client.chat.completions.create(
+            model=model,
+            messages=messages,
+            stream=True,
+            stream_options={"include_usage": True},
+            **request_params
+        )
+        parts = []
+        usage = None
+        try:
+            for chunk in stream:
+                if should_cancel is not None and should_cancel():
+                    raise GenerationCancelledError("Generowanie zostało przerwane.")
+                # Zużycie tokenów przychodzi w ostatnim fragmencie (bez choices)
+                if getattr(chunk, "usage", None):
+                    usage = extract_usage(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    on_delta(chunk.choices[0].delta.content)
+        except GenerationCancelledError:
+            raise
+        except Exception as e:
+            if parts:
+                raise GenerationError(f"Połączenie z modelem przerwane w trakcie odpowiedzi: {e}") from e
+            raise
+        finally:
+            stream.close()
+        return parts, usage
+
+    parts, usage = get_rate_limiter().run(
+        request,
+        estimate_request_tokens(messages),
+        count_tokens=lambda result: result[1] and result[1]["prompt_tokens"] + result[1]["completion_tokens"]
+    )
+
+    content = "".join(parts)
+    if cache_key is not None and content:
+        response_cache.put(cache_key, content)
+    return content, usage
@@ -0,0 +1,202 @@
+import hashlib
+import json
+import math
+import os
+import re
+
+from mailgen.digest import iter_text_chunks
+from mailgen.disk_cache import DiskTextCache
+
+# Lokalny indeks BM25 fragmentów e-booka: przy regeneracji pojedynczej sekcji e-booka,
+# który nie mieści się w całości w zapytaniu, model dostaje tylko kilka fragmentów
+# najbardziej związanych z tą sekcją (zapytaniem jest opis sekcji z ALL_VARIABLES)
+# zamiast przyciętego tekstu lub streszczenia. Indeks budowany jest raz na
+# dokument i zapisywany w pamięci podręcznej według skrótu treści; ocena fragmentów
+# to kilka operacji na tablicach NumPy.
+
+# Długość fragmentu indeksu (w znakach)
+RETRIEVAL_CHUNK_CHARS = int(os.environ.get("MAILGEN_RETRIEVAL_CHUNK_CHARS", "1500"))
+
+# Liczba fragmentów dobieranych dla sekcji
+RETRIEVAL_TOP_K = int(os.environ.get("MAILGEN_RETRIEVAL_TOP_K", "6"))
+
+# Parametry BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Wersja formatu indeksu - zmiana unieważnia zapisane indeksy
+RETRIEVAL_INDEX_VERSION = "1"
+
+WORD_PATTERN = re.compile(r"\w+")
+
+# Prosty stemming dla języka polskiego: porównywany jest tylko początek słowa,
+# dzięki czemu różne formy fleksyjne ("klient", "klienta", "klientów") dają ten sam termin
+STEM_LENGTH = 6
+
+# Najczęstsze słowa bez znaczenia dla trafności
+STOPWORDS = frozenset("""
+aby ale albo ani bez bardzo był była było były będzie być czy dla dlatego gdy gdzie jak jako
+jednak jego jej jest jeszcze już kiedy która które który którzy lub ich nad nie niż oraz
+pod przez przy się sobie tak także tam tego tej ten też tylko tym wiele więc wszystko został
+zostać the and for that with this are you your from have not but
+""".split())
+
+CHUNK_SEPARATOR = "\n\n[...]\n\n"
+
+
+# Funkcja dzieląca tekst na terminy (małe litery, bez słów nieistotnych, ze stemmingiem)
+def tokenize(text):
+    return [
+        word[:STEM_LENGTH]
+        for word in WORD_PATTERN.findall(text.lower())
+        if len(word) > 2 and word not in STOPWORDS
+    ]
+
+
+# Indeks BM25 w postaci list wystąpień (posting lists) zapisanych w tablicach NumPy:
+# dla terminu t numery fragmentów to doc_ids[offsets[t]:offsets[t + 1]],
+# a liczby wystąpień - term_freqs w tym samym zakresie
+class Bm25Index:
+    def __init__(self, chunk_bounds, vocabulary, offsets, doc_ids, term_freqs, doc_lengths):
+        # Import na żądanie - NumPy potrzebny jest dopiero przy budowie lub użyciu indeksu
+        import numpy as np
+
+        self.chunk_bounds = chunk_bounds
+        self.vocabulary = {term: i for i, term in enumerate(vocabulary)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.doc_ids = np.asarray(doc_ids, dtype=np.int32)
+        self.term_freqs = np.asarray(term_freqs, dtype=np.float32)
+        self.doc_lengths = np.asarray(doc_lengths, dtype=np.float32)
+
+        doc_count = len(chunk_bounds)
+        doc_freqs = np.diff(self.offsets).astype(np.float32)
+        self.idf = np.log(1 + (doc_count - doc_freqs + 0.5) / (doc_freqs + 0.5))
+        average_length = float(self.doc_lengths.mean()) if doc_count else 0.0
+        # Mianownik BM25 zależny tylko od długości fragmentu - liczony raz
+        self._length_norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths / max(average_length, 1.0))
+
+    @property
+    def chunk_count(self):
+        return len(self.chunk_bounds)
+
+    # Funkcja budująca indeks z tekstu (fragmenty na granicach akapitów)
+    @classmethod
+    def build(cls, text, chunk_chars=RETRIEVAL_CHUNK_CHARS):
+        chunk_bounds = []
+        position = 0
+        postings = {}
+        doc_lengths = []
+        for doc_id, chunk in enumerate(iter_text_chunks([text], chunk_chars)):
+            chunk_bounds.append((position, position + len(chunk)))
+            position += len(chunk)
+
+            terms = tokenize(chunk)
+            doc_lengths.append(len(terms))
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_id, count))
+
+        vocabulary = sorted(postings)
+        offsets = [0]
+        doc_ids = []
+        term_freqs = []
+        for term in vocabulary:
+            for doc_id, count in postings[term]:
+                doc_ids.append(doc_id)
+                term_freqs.append(count)
+            offsets.append(len(doc_ids))
+
+        return cls(chunk_bounds, vocabulary, offsets, doc_ids, term_freqs, doc_lengths)
+
+    def to_json(self):
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        return json.dumps({
+            "version": RETRIEVAL_INDEX_VERSION,
+            "chunk_bounds": self.chunk_bounds,
+            "vocabulary": terms,
+            "offsets": self.offsets.tolist(),
+            "doc_ids": self.doc_ids.tolist(),
+            "term_freqs": self.term_freqs.astype(int).tolist(),
+            "doc_lengths": self.doc_lengths.astype(int).tolist(),
+        }, ensure_ascii=False, separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload):
+        data = json.loads(payload)
+        return cls(
+            [tuple(bounds) for bounds in data["chunk_bounds"]],
+            data["vocabulary"],
+            data["offsets"],
+            data["doc_ids"],
+            data["term_freqs"],
+            data["doc_lengths"],
+        )
+
+    # Funkcja zwracająca ocenę BM25 wszystkich fragmentów dla zapytania
+    def score(self, query):
+        import numpy as np
+
+        scores = np.zeros(self.chunk_count, dtype=np.float32)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, stop = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.doc_ids[start:stop]
+            freqs = self.term_freqs[start:stop]
+            scores[docs] += self.idf[term_id] * freqs * (BM25_K1 + 1) / (freqs + self._length_norm[docs])
+        return scores
+
+    # Funkcja zwracająca numery top_k najlepiej ocenionych fragmentów (tylko z oceną > 0)
+    def search(self, query, top_k=RETRIEVAL_TOP_K):
+        import numpy as np
+
+        scores = self.score(query)
+        top_k = min(top_k, self.chunk_count)
+        if top_k == 0:
+            return []
+        best = np.argpartition(-scores, top_k - 1)[:top_k]
+        best = best[np.argsort(-scores[best], kind="stable")]
+        return [int(doc_id) for doc_id in best if scores[doc_id] > 0]
+
+
+# Trwała pamięć podręczna indeksów - klucz to skrót treści, długość fragmentów i wersja formatu
+class RetrievalIndexCache(DiskTextCache):
+    def make_key(self, text, chunk_chars=RETRIEVAL_CHUNK_CHARS):
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key_source = f"{text_hash}:{chunk_chars}:{RETRIEVAL_INDEX_VERSION}"
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+# Funkcja zwracająca indeks dokumentu (z pamięci podręcznej lub zbudowany i zapisany)
+def load_or_build_index(text, index_cache=None):
+    if index_cache is None:
+        return Bm25Index.build(text)
+
+    cache_key = index_cache.make_key(text)
+    payload = index_cache.get(cache_key)
+    if payload is not None:
+        return Bm25Index.from_json(payload)
+
+    index = Bm25Index.build(text)
+    index_cache.put(cache_key, index.to_json())
+    return index
+
+
+# Funkcja składająca kontekst sekcji z top_k fragmentów najbardziej związanych z zapytaniem.
+# Pierwszy fragment (tytuł, wstęp, często spis treści) dołączany jest zawsze, a wybrane
+# fragmenty podawane są w kolejności z książki.
+def select_relevant_text(text, index, query, top_k=RETRIEVAL_TOP_K):
+    chunk_ids = set(index.search(query, top_k))
+    if index.chunk_count:
+        chunk_ids.add(0)
+    return CHUNK_SEPARATOR.join(
+        text[start:stop].strip() for start, stop in (index.chunk_bounds[i] for i in sorted(chunk_ids))
+    )
+
+
+# Funkcja szacująca, czy dobór fragmentów ma sens (krótki tekst wysyłany jest w całości)
+def should_retrieve(text, top_k=RETRIEVAL_TOP_K, chunk_chars=RETRIEVAL_CHUNK_CHARS):
+    return len(text) > math.ceil(1.5 * (top_k + 1) * chunk_chars)
@@ -0,0 +1,132 @@
+import re
+
+from mailgen.metrics import timed
+
+# Wszystkie wzorce kompilowane raz, przy imporcie modułu
+
+# Div z klasą, div bez atrybutów oraz atrybut class w innych znacznikach
+DIV_WITH_CLASS_PATTERN = re.compile(r'<div\s+class="[^"]*">(.*?)</div>', re.DOTALL)
+BARE_DIV_PATTERN = re.compile(r'<div>(.*?)</div>', re.DOTALL)
+CLASS_ATTRIBUTE_PATTERN = re.compile(r'<([a-z]+)\s+class="[^"]*"')
+
+# Tytuły sekcji, które model czasem dodaje na początku treści
+SECTION_TITLE_PATTERNS = {
+    key: re.compile(pattern, re.IGNORECASE)
+    for key, pattern in {
+        "intro": r'^(Wstęp|Wprowadzenie|Kontekst)[:;-]\s*',
+        "why_created": r'^(Dlaczego|Geneza|Powód)[:;-]\s*',
+        "contents": r'^(Zawartość|Spis treści|Co znajdziesz)[:;-]\s*',
+        "problems_solved": r'^(Problemy|Rozwiązania|Korzyści)[:;-]\s*',
+        "target_audience": r'^(Dla kogo|Odbiorcy|Grupa docelowa)[:;-]\s*',
+        "example": r'^(Przykład|Fragment|Cytat)[:;-]\s*',
+        "call_to_action": r'^(Wezwanie|CTA|Działaj|Zrób)[:;-]\s*',
+        "key_benefits": r'^(Korzyści|Zalety|Benefity)[:;-]\s*',
+        "guarantee": r'^(Gwarancja|Obietnica|Zapewnienie)[:;-]\s*',
+        "testimonials": r'^(Opinie|Rekomendacje|Co mówią)[:;-]\s*',
+        "value_summary": r'^(Podsumowanie|Wartość|W skrócie)[:;-]\s*',
+        "faq": r'^(FAQ|Pytania|Q&A)[:;-]\s*',
+        "urgency": r'^(Pilne|Ogranicz|Nie czekaj)[:;-]\s*',
+        "comparison": r'^(Porównanie|Wyróżnienie|Co nas wyróżnia)[:;-]\s*',
+        "transformation_story": r'^(Historia|Transformacja|Zmiana|Case study)[:;-]\s*'
+    }.items()
+}
+
+
+# Funkcje konwertujące listy zwrócone przez model na prosty HTML (jedno złączenie zamiast +=)
+def _contents_to_html(items):
+    parts = []
+    for item in items:
+        if isinstance(item, dict) and "rozdzial" in item and "opis" in item:
+            parts.append(f"<li><strong>{item['rozdzial']}</strong> - {item['opis']}</li>")
+        elif isinstance(item, str):
+            parts.append(f"<li>{item}</li>")
+    return "<ul>" + "".join(parts) + "</ul>"
+
+
+def _faq_to_html(items):
+    parts = []
+    for item in items:
+        if isinstance(item, dict) and "pytanie" in item and "odpowiedz" in item:
+            parts.append(f"<strong>{item['pytanie']}</strong><br>{item['odpowiedz']}<br><br>")
+        elif isinstance(item, dict) and "question" in item and "answer" in item:
+            parts.append(f"<strong>{item['question']}</strong><br>{item['answer']}<br><br>")
+    return "".join(parts)
+
+
+def _key_benefits_to_html(items):
+    parts = []
+    for item in items:
+        if isinstance(item, str):
+            parts.append(f"<li>{item}</li>")
+        elif isinstance(item, dict) and "benefit" in item:
+            parts.append(f"<li>{item['benefit']}</li>")
+    return "<ul>" + "".join(parts) + "</ul>"
+
+
+def _testimonials_to_html(items):
+    parts = []
+    for item in items:
+        if isinstance(item, str):
+            parts.append(f"\"{item}\"<br><br>")
+        elif isinstance(item, dict) and "text" in item and "author" in item:
+            parts.append(f"\"{item['text']}\" - {item['author']}<br><br>")
+        elif isinstance(item, dict) and "testimonial" in item:
+            parts.append(f"\"{item['testimonial']}\"<br><br>")
+    return "".join(parts)
+
+
+LIST_CONVERTERS = {
+    "contents": _contents_to_html,
+    "faq": _faq_to_html,
+    "key_benefits": _key_benefits_to_html,
+    "testimonials": _testimonials_to_html,
+}
+
+
+# Funkcja do usunięcia niepotrzebnych divów i klas z fragmentu HTML
+# (wyrażenia uruchamiane tylko wtedy, gdy tekst zawiera dany znacznik/atrybut)
+def strip_html_wrappers(value):
+    if "<div" in value:
+        # Uproszczenie struktury HTML, usunięcie div z klasami
+        value = DIV_WITH_CLASS_PATTERN.sub(r'\1', value)
+        # Usunięcie pozostałych divów
+        value = BARE_DIV_PATTERN.sub(r'\1', value)
+    if "class=" in value:
+        # Usunięcie atrybutów class z innych tagów
+        value = CLASS_ATTRIBUTE_PATTERN.sub(r'<\1', value)
+    return value
+
+
+# Funkcja do usunięcia tytułu sekcji z początku treści
+def strip_section_title(section_name, content):
+    pattern = SECTION_TITLE_PATTERNS.get(section_name)
+    return pattern.sub('', content) if pattern else content
+
+
+# Funkcja do oczyszczenia pojedynczego pola: lista -> HTML, konwersja na tekst,
+# usunięcie divów/klas i (opcjonalnie) tytułu sekcji
+def sanitize_field(key, value, strip_titles=True):
+    if isinstance(value, list) and key in LIST_CONVERTERS:
+        value = LIST_CONVERTERS[key](value)
+    elif isinstance(value, list):
+        value = ", ".join(str(item) for item in value)
+    elif not isinstance(value, str):
+        value = str(value)
+
+    value = strip_html_wrappers(value)
+    if strip_titles:
+        value = strip_section_title(key, value)
+    return value
+
+
+# Funkcja do oczyszczenia całej odpowiedzi modelu w jednym przejściu po polach
+@timed("normalize")
+def sanitize_generated_data(data, strip_titles=True):
+    for key, value in data.items():
+        data[key] = sanitize_field(key, value, strip_titles)
+    return data
+
+
+# Funkcja do obsługi specjalnych przypadków formatu danych (bez usuwania tytułów sekcji)
+def normalize_json_data(data):
+    return sanitize_generated_data(data, strip_titles=False)
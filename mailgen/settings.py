@@ -0,0 +1,18 @@
+import os
+
+# Katalog na trwałe pamięci podręczne (można go nadpisać zmienną środowiskową)
+CACHE_DIR = os.environ.get("MAILGEN_CACHE_DIR") or os.path.join(
+    os.path.expanduser("~"), ".cache", "automailcopy"
+)
+
+# Maksymalny rozmiar pamięci podręcznej tekstu z plików PDF (w megabajtach)
+PDF_CACHE_MAX_BYTES = int(os.environ.get("MAILGEN_PDF_CACHE_MAX_MB", "256")) * 1024 * 1024
+
+# Maksymalny rozmiar pamięci podręcznej streszczeń e-booków (w megabajtach)
+DIGEST_CACHE_MAX_BYTES = int(os.environ.get("MAILGEN_DIGEST_CACHE_MAX_MB", "64")) * 1024 * 1024
+
+# Maksymalny rozmiar pamięci podręcznej liczby tokenów dokumentów (w megabajtach)
+TOKEN_CACHE_MAX_BYTES = int(os.environ.get("MAILGEN_TOKEN_CACHE_MAX_MB", "4")) * 1024 * 1024
+
+# Maksymalny rozmiar pamięci podręcznej indeksów fragmentów e-booków (w megabajtach)
+RETRIEVAL_CACHE_MAX_BYTES = int(os.environ.get("MAILGEN_RETRIEVAL_CACHE_MAX_MB", "64")) * 1024 * 1024
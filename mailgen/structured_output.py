@@ -0,0 +1,95 @@
+import threading
+
+from mailgen.metrics import timed
+
+# Tryb structured outputs: schemat wymaganych zmiennych wysyłany jako response_format,
+# dzięki czemu model nie może zwrócić niepoprawnego JSON-a. Klucze, których mimo to
+# brakuje (np. odmowa lub odpowiedź ucięta limitem tokenów), uzupełniane są jednym
+# małym zapytaniem naprawczym - bez powtarzania całego, kosztownego zapytania.
+
+# Prefiksy modeli obsługujących response_format typu json_schema
+STRUCTURED_OUTPUT_MODEL_PREFIXES = ("gpt-4o", "gpt-4.1", "gpt-5", "o1", "o3", "o4")
+
+
+# Funkcja sprawdzająca, czy model obsługuje structured outputs
+def supports_structured_output(model):
+    return model.startswith(STRUCTURED_OUTPUT_MODEL_PREFIXES)
+
+
+# Funkcja do zbudowania parametru response_format ze schematem wymaganych zmiennych
+# (tryb strict wymaga opisania i wymagania wszystkich kluczy oraz zakazu dodatkowych)
+def build_response_format(variables, descriptions=None):
+    descriptions = descriptions or {}
+    properties = {}
+    for var in variables:
+        properties[var] = {"type": "string"}
+        if var in descriptions:
+            properties[var]["description"] = descriptions[var]
+
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": "mail_sections",
+            "strict": True,
+            "schema": {
+                "type": "object",
+                "properties": properties,
+                "required": list(variables),
+                "additionalProperties": False
+            }
+        }
+    }
+
+
+# Funkcja porównująca odpowiedź ze schematem JSON: zwraca wymagane klucze, których
+# brakuje lub których wartości nie spełniają schematu (w kolejności ze schematu)
+@timed("validate")
+def find_invalid_keys(data, schema):
+    # Import na żądanie - jsonschema nie jest potrzebny do samego importu modułu
+    from jsonschema import Draft7Validator
+
+    invalid = set()
+    for error in Draft7Validator(schema).iter_errors(data):
+        if error.validator == "required":
+            invalid.update(key for key in schema["required"] if key not in data)
+        elif error.path:
+            invalid.add(error.path[0])
+    return [key for key in schema["required"] if key in invalid]
+
+
+# Liczniki generowań w obu trybach (zwykłym i structured outputs): ile odpowiedzi
+# wymagało ponownego generowania kluczy i ile tokenów zostało zmarnowanych
+# na odrzucone fragmenty odpowiedzi.
+class GenerationStats:
+    MODES = ("json_schema", "prompt")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {mode: {"runs": 0, "retried_runs": 0, "retried_keys": 0, "wasted_tokens": 0} for mode in self.MODES}
+
+    def record(self, mode, retried_keys=0, wasted_tokens=0):
+        with self._lock:
+            counters = self._counters[mode]
+            counters["runs"] += 1
+            counters["retried_runs"] += 1 if retried_keys else 0
+            counters["retried_keys"] += retried_keys
+            counters["wasted_tokens"] += wasted_tokens
+
+    def stats(self):
+        with self._lock:
+            result = {}
+            for mode, counters in self._counters.items():
+                runs = counters["runs"]
+                result[mode] = {**counters, "retry_rate": counters["retried_runs"] / runs if runs else 0.0}
+            return result
+
+
+# Funkcja do oszacowania tokenów zmarnowanych na odrzuconą część odpowiedzi:
+# przy całkowicie nieczytelnej odpowiedzi całe zapytanie, w przeciwnym razie
+# proporcjonalna część tokenów wyjściowych
+def estimate_wasted_tokens(usage, invalid_count, total_count, parsed):
+    if not usage or not invalid_count:
+        return 0
+    if not parsed:
+        return usage["prompt_tokens"] + usage["completion_tokens"]
+    return round(usage["completion_tokens"] * invalid_count / max(1, total_count))
@@ -0,0 +1,126 @@
+import functools
+import re
+import uuid
+
+# Wzór do wykrywania zmiennych w formie {!{ nazwa_zmiennej }!}
+PLACEHOLDER_PATTERN = re.compile(r'\{!\{\s*([a-zA-Z_]+)\s*\}!\}')
+
+
+# Szablon skompilowany raz do listy fragmentów: stałe fragmenty tekstu przeplatane
+# miejscami na zmienne. Renderowanie to podstawienie wartości w miejsca zmiennych
+# i jedno złączenie ''.join - bez ponownego przeszukiwania szablonu wyrażeniem regularnym.
+class CompiledTemplate:
+    __slots__ = ("source", "variables", "slot_names", "slot_indices", "fragments", "_parts", "_slots")
+
+    def __init__(self, source):
+        self.source = source
+        parts = []
+        slots = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            parts.append(source[position:match.start()])
+            slots.append((len(parts), match.group(1)))
+            parts.append(None)
+            position = match.end()
+        parts.append(source[position:])
+
+        self._parts = parts
+        self._slots = tuple(slots)
+        # Nazwy zmiennych kolejnych miejsc w szablonie (zmienna może wystąpić kilka razy)
+        # i stałe fragmenty tekstu między nimi (o jeden więcej niż miejsc)
+        self.slot_names = tuple(name for _, name in slots)
+        self.fragments = tuple(parts[0::2])
+        # Numery miejsc każdej zmiennej
+        slot_indices = {}
+        for index, name in enumerate(self.slot_names):
+            slot_indices.setdefault(name, []).append(index)
+        self.slot_indices = {name: tuple(indices) for name, indices in slot_indices.items()}
+        # Zbiór zmiennych używanych w szablonie (bez duplikatów)
+        self.variables = frozenset(self.slot_names)
+
+    # Funkcja zwracająca wartość podstawianą w miejsce zmiennej
+    @staticmethod
+    def slot_value(name, data):
+        return data[name] if name in data else f"[Zmienna {name} nie znaleziona]"
+
+    # Funkcja zwracająca listę fragmentów z podstawionymi wartościami (przed złączeniem)
+    def render_parts(self, data):
+        parts = self._parts.copy()
+        for index, name in self._slots:
+            parts[index] = self.slot_value(name, data)
+        return parts
+
+    def render(self, data):
+        return "".join(self.render_parts(data))
+
+
+# Wyrenderowany szablon z zapamiętanymi wartościami zmiennych. Dokument przechowywany jest
+# jako lista fragmentów, w której każde miejsce na zmienną ma stałą pozycję (slot_indices) -
+# po zmianie danych (edycja lub regeneracja sekcji) podmieniane są tylko zmienione miejsca,
+# a pełny HTML składany jest dopiero wtedy, gdy jest potrzebny (i zapamiętywany).
+# Każda zmiana zwiększa version; slot_versions to wersja ostatniej zmiany każdego miejsca,
+# więc odbiorca znający wcześniejszą wersję może dostać tylko zmienione miejsca (patches_since).
+class RenderedTemplate:
+    def __init__(self, template, data):
+        self.id = uuid.uuid4().hex
+        self.template = template
+        self.values = {name: template.slot_value(name, data) for name in template.variables}
+        self.version = 0
+        self.slot_versions = [0] * len(template.slot_names)
+        self._parts = template.render_parts(data)
+        self._html = None
+        self._encoded = None
+
+    @property
+    def html(self):
+        if self._html is None:
+            self._html = "".join(self._parts)
+        return self._html
+
+    # Kod HTML zakodowany w UTF-8 (np. do pobrania pliku) - wyliczany raz dla każdej wersji
+    def encoded(self):
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = self.html.encode("utf-8")
+        return encoded
+
+    # Funkcja aktualizująca dokument dla nowych danych; zwraca listę zmienionych zmiennych
+    def update(self, data):
+        changed = []
+        for name, previous in self.values.items():
+            value = self.template.slot_value(name, data)
+            if value != previous:
+                changed.append(name)
+        if not changed:
+            return changed
+
+        self.version += 1
+        for name in changed:
+            value = self.template.slot_value(name, data)
+            self.values[name] = value
+            for index in self.template.slot_indices[name]:
+                # Miejsce na zmienną numer index to fragment 2 * index + 1 (fragmenty stałe są parzyste)
+                self._parts[2 * index + 1] = value
+                self.slot_versions[index] = self.version
+        self._html = None
+        self._encoded = None
+        return changed
+
+    # Funkcja zwracająca wartości miejsc zmienionych po podanej wersji {numer miejsca: wartość}
+    def patches_since(self, version):
+        return {
+            index: self._parts[2 * index + 1]
+            for index, slot_version in enumerate(self.slot_versions)
+            if slot_version > version
+        }
+
+    # Wartości kolejnych miejsc (razem z template.fragments opisują cały dokument)
+    def slot_values(self):
+        return self._parts[1::2]
+
+
+# Funkcja zwracająca skompilowany szablon (kolejne wywołania dla tego samego
+# szablonu korzystają z pamięci podręcznej)
+@functools.lru_cache(maxsize=64)
+def compile_template(source):
+    return CompiledTemplate(source)
@@ -0,0 +1,233 @@
+import functools
+import hashlib
+import logging
+import math
+import os
+from dataclasses import dataclass
+
+from mailgen.disk_cache import DiskTextCache
+from mailgen.errors import GenerationError
+
+# Budżet tokenów zapytania: liczenie tokenów tokenizerem modelu (tiktoken, jeśli jest
+# dostępny), okna kontekstu modeli, rezerwa na odpowiedź wynikająca z długości sekcji
+# oraz wybór postaci e-booka w prompcie - pełny tekst, przycięty tekst lub streszczenie
+# map-reduce - tak, aby zapytanie nigdy nie przekroczyło okna kontekstu.
+
+logger = logging.getLogger(__name__)
+
+
+# Limity modelu: okno kontekstu, maksymalna długość odpowiedzi, tokenizer
+# i rezerwa na tokeny rozumowania (modele "o" liczą je do limitu odpowiedzi)
+@dataclass(frozen=True)
+class ModelLimits:
+    context_window: int
+    max_output_tokens: int
+    encoding: str
+    reasoning_reserve: int = 0
+
+
+# Limity modeli dostępnych w interfejsie
+MODEL_LIMITS = {
+    "o4-mini": ModelLimits(200_000, 100_000, "o200k_base", reasoning_reserve=8_000),
+    "gpt-4o": ModelLimits(128_000, 16_384, "o200k_base"),
+    "gpt-4": ModelLimits(8_192, 8_192, "cl100k_base"),
+}
+
+# Limity przyjmowane dla modeli spoza listy
+DEFAULT_MODEL_LIMITS = ModelLimits(128_000, 16_384, "o200k_base")
+
+# Powyżej tej liczby tokenów e-book jest streszczany nawet wtedy, gdy zmieściłby się
+# w oknie kontekstu (koszt każdego zapytania rośnie z długością promptu)
+MAX_FULL_TEXT_TOKENS = int(os.environ.get("MAILGEN_MAX_FULL_TEXT_TOKENS", "100000"))
+
+# Najmniejsza część e-booka, jaka może zostać w prompcie po przycięciu;
+# jeśli trzeba by uciąć więcej, e-book jest streszczany
+TRIM_MIN_KEPT_RATIO = float(os.environ.get("MAILGEN_TRIM_MIN_KEPT_RATIO", "0.8"))
+
+# Docelowa liczba tokenów fragmentu e-booka przy streszczaniu map-reduce
+DIGEST_CHUNK_TOKENS = int(os.environ.get("MAILGEN_DIGEST_CHUNK_TOKENS", "10000"))
+
+# Rezerwa na odpowiedź przy streszczaniu fragmentu lub łączeniu streszczeń
+DIGEST_OUTPUT_TOKENS = 2_000
+
+# Zapas na narzut formatu wiadomości i niedokładność szacunków
+SAFETY_MARGIN_TOKENS = 512
+
+# Szacunkowa liczba znaków na token w generowanej odpowiedzi (polski tekst z HTML)
+# i narzut JSON na każdą sekcję (klucz, cudzysłowy, przecinki)
+OUTPUT_CHARS_PER_TOKEN = 2.5
+OUTPUT_TOKENS_PER_SECTION = 32
+
+# Liczba znaków na token używana, gdy tiktoken jest niedostępny - celowo zaniżona
+# dla tekstu polskiego, aby szacunek raczej zawyżał liczbę tokenów niż ją zaniżał
+FALLBACK_CHARS_PER_TOKEN = {"o200k_base": 3.0, "cl100k_base": 2.2}
+
+# Część limitu zachowywana z początku tekstu przy przycinaniu (reszta - z końca)
+TRIM_HEAD_RATIO = 0.8
+TRIM_MARKER = "\n\n[...]\n\n"
+
+
+# Funkcja zwracająca limity modelu (także dla wersji z datą, np. gpt-4o-2024-08-06)
+def get_model_limits(model):
+    if model in MODEL_LIMITS:
+        return MODEL_LIMITS[model]
+    for name, limits in MODEL_LIMITS.items():
+        if model.startswith(name + "-"):
+            return limits
+    return DEFAULT_MODEL_LIMITS
+
+
+# Funkcja zwracająca tokenizer tiktoken lub None, jeśli biblioteka albo plik
+# kodowania są niedostępne (np. brak sieci przy pierwszym użyciu)
+@functools.lru_cache(maxsize=None)
+def get_encoding(encoding_name):
+    try:
+        import tiktoken
+
+        return tiktoken.get_encoding(encoding_name)
+    except Exception as e:
+        logger.warning("Tokenizer %s niedostępny, liczba tokenów będzie szacowana: %s", encoding_name, e)
+        return None
+
+
+# Funkcja sprawdzająca, czy tokeny dla modelu liczone są tokenizerem (False - szacunek
+# z liczby znaków, a wybór pełnego tekstu, przycięcia lub streszczenia jest przybliżony)
+def has_exact_token_count(model):
+    return get_encoding(get_model_limits(model).encoding) is not None
+
+
+# Funkcja licząca tokeny tekstu dla modelu (tokenizerem lub szacunkowo)
+def count_tokens(text, model):
+    limits = get_model_limits(model)
+    encoding = get_encoding(limits.encoding)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return math.ceil(len(text) / FALLBACK_CHARS_PER_TOKEN[limits.encoding])
+
+
+# Trwała pamięć podręczna liczby tokenów dokumentów - klucz to skrót treści
+# i tokenizer (szacunki i dokładne wyniki nie są ze sobą mieszane)
+class TokenCountCache(DiskTextCache):
+    def make_key(self, text, model):
+        encoding_name = get_model_limits(model).encoding
+        method = "tiktoken" if has_exact_token_count(model) else "estimate"
+        text_hash = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        key_source = f"{text_hash}:{encoding_name}:{method}"
+        return hashlib.sha256(key_source.encode("utf-8")).hexdigest()
+
+
+# Funkcja licząca tokeny dokumentu z użyciem pamięci podręcznej (liczenie
+# tokenów książki liczącej kilkaset stron trwa zauważalnie długo)
+def count_document_tokens(text, model, token_cache=None):
+    if token_cache is None:
+        return count_tokens(text, model)
+
+    cache_key = token_cache.make_key(text, model)
+    cached = token_cache.get(cache_key)
+    if cached is not None:
+        return int(cached)
+
+    token_count = count_tokens(text, model)
+    token_cache.put(cache_key, str(token_count))
+    return token_count
+
+
+# Licznik tokenów tekstu odczytywanego stronami - tokeny strony liczone są zaraz po jej
+# odczycie, a suma zapisywana jest jako liczba tokenów całego tekstu, więc
+# count_document_tokens nie liczy ich ponownie (suma stron w praktyce nie jest mniejsza
+# od liczby tokenów całości, budżet pozostaje bezpieczny)
+class PageTokenCounter:
+    def __init__(self, model):
+        self.model = model
+        self.pages = 0
+        self.tokens = 0
+
+    def add(self, page_text):
+        self.pages += 1
+        self.tokens += count_tokens(page_text, self.model)
+        return self.tokens
+
+    def store(self, text, token_cache):
+        if self.pages:
+            token_cache.put(token_cache.make_key(text, self.model), str(self.tokens))
+
+
+# Funkcja przycinająca tekst do podanej liczby tokenów: zachowuje początek
+# i końcówkę tekstu (wstęp i podsumowanie), a środek zastępuje znacznikiem
+def trim_to_tokens(text, max_tokens, model):
+    limits = get_model_limits(model)
+    encoding = get_encoding(limits.encoding)
+    budget = max(0, max_tokens - count_tokens(TRIM_MARKER, model))
+    head_tokens = int(budget * TRIM_HEAD_RATIO)
+    tail_tokens = budget - head_tokens
+
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        tail = encoding.decode(tokens[-tail_tokens:]) if tail_tokens else ""
+        return encoding.decode(tokens[:head_tokens]) + TRIM_MARKER + tail
+
+    chars_per_token = FALLBACK_CHARS_PER_TOKEN[limits.encoding]
+    if len(text) <= max_tokens * chars_per_token:
+        return text
+    head_chars = int(head_tokens * chars_per_token)
+    tail_chars = int(tail_tokens * chars_per_token)
+    return text[:head_chars] + TRIM_MARKER + (text[-tail_chars:] if tail_chars else "")
+
+
+# Funkcja szacująca liczbę tokenów odpowiedzi na podstawie długości sekcji (w znakach)
+def estimate_output_tokens(lengths, model):
+    limits = get_model_limits(model)
+    content_tokens = math.ceil(sum(lengths.values()) / OUTPUT_CHARS_PER_TOKEN)
+    reserve = content_tokens + OUTPUT_TOKENS_PER_SECTION * len(lengths) + limits.reasoning_reserve
+    return min(limits.max_output_tokens, reserve)
+
+
+# Plan zapytania: postać e-booka w prompcie (strategy: "full", "trimmed" lub "digest")
+# oraz budżety tokenów, z których wynika (estimated - liczby tokenów szacowane bez tokenizera)
+@dataclass(frozen=True)
+class ContextPlan:
+    strategy: str
+    document_tokens: int
+    document_budget: int
+    prompt_tokens: int
+    output_tokens: int
+    context_window: int
+    chunk_chars: int = 0
+    estimated: bool = False
+
+
+# Funkcja wybierająca strategię tak, aby prompt i odpowiedź zmieściły się w oknie kontekstu
+def plan_context(document_chars, document_tokens, model, prompt_tokens, output_tokens):
+    limits = get_model_limits(model)
+    available = limits.context_window - prompt_tokens - output_tokens - SAFETY_MARGIN_TOKENS
+    if available < DIGEST_OUTPUT_TOKENS:
+        raise GenerationError(
+            f"Wymagane długości sekcji (około {output_tokens} tokenów odpowiedzi) nie mieszczą się "
+            f"w oknie kontekstu modelu {model} ({limits.context_window} tokenów). Skróć sekcje lub wybierz inny model."
+        )
+
+    document_budget = min(available, MAX_FULL_TEXT_TOKENS)
+    plan = {
+        "document_tokens": document_tokens,
+        "document_budget": document_budget,
+        "prompt_tokens": prompt_tokens,
+        "output_tokens": output_tokens,
+        "context_window": limits.context_window,
+        "estimated": not has_exact_token_count(model),
+    }
+
+    if document_tokens <= document_budget:
+        return ContextPlan("full", **plan)
+    if document_tokens * TRIM_MIN_KEPT_RATIO <= document_budget:
+        return ContextPlan("trimmed", **plan)
+
+    # Fragmenty do streszczenia muszą zmieścić się w oknie razem z odpowiedzią;
+    # liczba znaków fragmentu wynika z proporcji znaków do tokenów tego dokumentu
+    chunk_tokens = min(
+        DIGEST_CHUNK_TOKENS,
+        limits.context_window - DIGEST_OUTPUT_TOKENS - limits.reasoning_reserve - 2 * SAFETY_MARGIN_TOKENS
+    )
+    chars_per_token = document_chars / max(1, document_tokens)
+    return ContextPlan("digest", **plan, chunk_chars=max(1000, int(chunk_tokens * chars_per_token)))
@@ -1,544 +1,477 @@
 import streamlit as st
-import json
-import re
 import os
-import pypdf
-import base64
-from openai import OpenAI
-from jsonschema import validate, ValidationError
-
-# Konfiguracja strony
-st.set_page_config(
-    page_title="Generator treści marketingowych do maili",
-    layout="wide"
+import functools
+import hashlib
+import time
+from mailgen import core
+from mailgen import jobs
+from mailgen.core import (
+    ALL_VARIABLES,
+    DEFAULT_VAR_LENGTHS,
+    extract_variables_from_template,
+    get_generation_stats,
+    get_pdf_cache,
+    get_response_cache,
 )
+from mailgen.errors import MailGenError, ResponseParseError
+from mailgen.metrics import METRICS_PORT, get_metrics, start_metrics_server
+from mailgen.rate_limiter import get_rate_limiter
+from mailgen.token_budget import PageTokenCounter, has_exact_token_count
 
-# Lista wszystkich dostępnych zmiennych z opisami
-ALL_VARIABLES = {
-    "intro": "Wstęp — akapit otwierający, prezentuje kontekst sytuacyjny odbiorcy i główny problem, bez podawania nazwy e-booka ani zachęty do zakupu",
-
-    "why_created": "Cel powstania e-booka — precyzyjne wskazanie luki rynkowej lub potrzeby edukacyjnej, wyjaśnienie motywacji autora lub zespołu, bez użycia pierwszej osoby liczby pojedynczej",
-
-    "contents": "Zawartość e-booka — szczegółowy spis kluczowych rozdziałów, modułów, dodatków lub checklist wraz z krótkimi opisami, umożliwiający szybkie zrozumienie struktury materiału",
-
-    "problems_solved": "Problemy rozwiązane — jednoznaczna lista bolączek eliminowanych dzięki treści, sformułowana w języku korzyści mierzalnych dla odbiorcy",
-
-    "target_audience": "Grupa docelowa — jasne wskazanie, kto skorzysta z publikacji oraz komu może ona nie przynieść wartości, z podaniem konkretnych cech lub poziomu zaawansowania",
+# Interfejs Streamlit - cienka warstwa nad mailgen.core: wywołuje logikę generatora,
+# a zgłaszane przez nią wyjątki i zużycie tokenów pokazuje użytkownikowi.
 
-    "example": "Przykład z e-booka — cytowany fragment, kod, tabela lub ilustracja prezentująca styl oraz praktyczną wartość materiału",
-
-    "call_to_action": "Wezwanie do działania — pojedynczy, zwięzły komunikat w trybie rozkazującym, zachęcający do pobrania lub zakupu, ewentualnie z elementem limitu czasowego lub ilościowego",
+# Grupy zmiennych w zakładkach edytora wygenerowanych treści
+VARIABLE_GROUPS = {
+    "Podstawowe informacje": ["intro", "why_created", "contents", "problems_solved", "target_audience", "example"],
+    "Korzyści i wartość": ["key_benefits", "guarantee", "value_summary", "comparison"],
+    "Elementy perswazyjne": ["call_to_action", "testimonials", "urgency", "transformation_story"],
+    "Dodatkowe elementy": ["faq", "author_credentials"]
+}
 
-    "key_benefits": "Główne korzyści — uporządkowany zbiór konkretnych efektów, jakie czytelnik osiągnie po wdrożeniu wiedzy, pisany językiem rezultatów, nie cech produktu",
+# Podstawowe style podglądu kreacji
+PREVIEW_STYLE = """
+    <style>
+    body {
+        font-family: Arial, sans-serif;
+        line-height: 1.6;
+        color: #333;
+        margin: 20px;
+        max-width: 800px;
+    }
+    h1, h2, h3, h4, h5, h6 {
+        color: #2c3e50;
+        margin-top: 1.5em;
+        margin-bottom: 0.5em;
+    }
+    p {
+        margin-bottom: 1em;
+    }
+    ul, ol {
+        margin-bottom: 1em;
+        padding-left: 2em;
+    }
+    blockquote {
+        border-left: 4px solid #ddd;
+        padding: 0.5em 1em;
+        margin: 1em 0;
+        background-color: #f9f9f9;
+    }
+    </style>
+    """
 
-    "guarantee": "Gwarancja jakości — jednoznaczna deklaracja dotycząca wartości merytorycznej lub możliwości zwrotu, eliminująca ryzyko po stronie klienta",
+# Funkcja do przygotowania kreacji do podglądu (HTML z podstawowymi stylami)
+def get_preview_html(final_html):
+    return PREVIEW_STYLE + final_html
 
-    "testimonials": "Opinie — autentyczne cytaty czytelników lub ekspertów, opatrzone imieniem, stanowiskiem lub firmą i odnoszące się bezpośrednio do efektów osiągniętych dzięki e-bookowi",
+# Funkcja do zapisania zużycia tokenów ostatnich zapytań (do wyświetlenia w panelu bocznym)
+def record_usage(usage_entries):
+    if not usage_entries:
+        return
+    history = st.session_state.setdefault("usage_history", [])
+    history.extend(usage_entries)
+    # Przechowuj tylko ostatnie wpisy
+    del history[:-20]
 
-    "value_summary": "Podsumowanie wartości — syntetyczne zestawienie najważniejszych punktów i korzyści zamykające treść oferty, przygotowujące odbiorcę do finalnego CTA",
+# Funkcja do odczytywania zawartości pliku PDF przesłanego w formularzu
+def read_pdf(pdf_file, max_pages=None, max_chars=None, on_page=None, token_counter=None):
+    try:
+        return core.read_pdf(
+            pdf_file.getvalue(), max_pages=max_pages, max_chars=max_chars,
+            on_page=on_page, token_counter=token_counter
+        )
+    except MailGenError as e:
+        st.error(str(e))
+        return None
 
-    "faq": "FAQ — lista najczęściej stawianych pytań z klarownymi odpowiedziami rozwiewającymi wątpliwości dotyczące zawartości, formatu i procesu zakupu",
+# Funkcja do wygenerowania treści dla wymaganych zmiennych (błędy pokazywane w interfejsie)
+def analyze_pdf_with_openai(*args, **kwargs):
+    try:
+        result = core.analyze_pdf_with_openai(*args, **kwargs)
+    except ResponseParseError as e:
+        st.error(str(e))
+        st.code(e.raw_content)  # Wyświetl surową odpowiedź, aby pomóc w diagnostyce
+        return None
+    except MailGenError as e:
+        st.error(str(e))
+        return None
+    
+    record_usage(result.usage)
+    return result.data
 
-    "urgency": "Pilność — wyraźna informacja o ograniczeniu czasowym, ilościowym lub cenowym, budująca presję szybkiej decyzji bez użycia scenariuszy straszenia",
+# Funkcja do ponownego generowania pojedynczej sekcji (błędy pokazywane w interfejsie)
+def regenerate_single_section(*args, **kwargs):
+    try:
+        result = core.regenerate_single_section(*args, **kwargs)
+    except MailGenError as e:
+        st.error(str(e))
+        return None
+    
+    record_usage(result.usage)
+    return result.content
 
-    "comparison": "Porównanie — przejrzyste zestawienie przewag e-booka nad alternatywnymi rozwiązaniami, wskazujące unikalne cechy oraz mierzalne różnice",
+# Funkcja do równoległej regeneracji wielu sekcji - zwraca {sekcja: nowa treść}
+def regenerate_sections_concurrently(*args, **kwargs):
+    try:
+        result = core.regenerate_sections_concurrently(*args, **kwargs)
+    except MailGenError as e:
+        st.error(str(e))
+        return {}
+    
+    for error in result.errors.values():
+        st.error(str(error))
+    record_usage(result.usage)
+    return {name: section.content for name, section in result.sections.items()}
 
-    "transformation_story": "Historia transformacji — opis stanu przed oraz po zastosowaniu wiedzy z e-booka z uwzględnieniem konkretnych metryk lub rezultatów",
+# Panel regeneracji wielu sekcji jednocześnie (wyniki stosowane w jednym przebiegu).
+# Fragment strony - wybór sekcji nie uruchamia całego skryptu od nowa.
+@st.fragment
+def render_batch_regeneration(required_variables, openai_model, tone, concurrency, bypass_cache=False, api_key=None):
+    available_sections = [var for var in ALL_VARIABLES if var in required_variables and var in st.session_state.current_json_data]
+    
+    col1, col2 = st.columns([4, 1])
+    with col1:
+        selected_sections = st.multiselect(
+            "Sekcje do ponownego wygenerowania",
+            available_sections,
+            format_func=lambda var: var.replace('_', ' ').title(),
+            key="batch_regenerate_sections"
+        )
+    with col2:
+        batch_btn = st.button(
+            "🔄 Wygeneruj ponownie wybrane",
+            disabled=not selected_sections,
+            help="Wszystkie wybrane sekcje są generowane równolegle"
+        )
+    
+    if batch_btn and selected_sections:
+        with st.spinner(f"Regeneruję {len(selected_sections)} sekcji równolegle..."):
+            new_contents = regenerate_sections_concurrently(
+                pdf_text=st.session_state.pdf_text,
+                persona=st.session_state.persona,
+                section_names=selected_sections,
+                author_info=st.session_state.author_info or "",
+                model=openai_model,
+                tone=tone,
+                lengths=st.session_state.var_lengths,
+                concurrency=concurrency,
+                bypass_cache=bypass_cache,
+                current_contents=st.session_state.current_json_data,
+                api_key=api_key
+            )
+        
+        if new_contents:
+            # Aktualizuj wszystkie sekcje naraz i odśwież stronę tylko raz
+            st.session_state.current_json_data.update(new_contents)
+            st.rerun()
 
-    "author_credentials": "Kwalifikacje autora — fakty potwierdzające kompetencje, takie jak doświadczenie branżowe, liczba zrealizowanych projektów lub uzyskane certyfikaty"
-}
+# Funkcja do wyliczenia skrótu treści (klucz zapamiętanych wartości pochodnych)
+def content_hash(*parts):
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
 
+# Funkcja zwracająca wartość pochodną (np. dokument podglądu) zapamiętaną w sesji dla skrótu
+# danych wejściowych - wyliczana ponownie tylko po zmianie treści
+def memoized_view(name, digest, build):
+    view_cache = st.session_state.setdefault("view_cache", {})
+    cached = view_cache.get(name)
+    if cached is not None and cached[0] == digest:
+        return cached[1]
+    value = build()
+    view_cache[name] = (digest, value)
+    return value
 
-# Funkcja do odczytywania zawartości pliku PDF
-def read_pdf(pdf_file):
-    pdf_text = ""
-    try:
-        # Utwórz czytnik PDF z biblioteki pypdf
-        pdf_reader = pypdf.PdfReader(pdf_file)
-        
-        # Odczytaj tekst ze wszystkich stron
-        for page_num in range(len(pdf_reader.pages)):
-            page = pdf_reader.pages[page_num]
-            pdf_text += page.extract_text()
-            
-        return pdf_text
-    except Exception as e:
-        st.error(f"Błąd podczas odczytywania pliku PDF: {e}")
-        return None
+# Funkcja synchronizująca pola edytora z treściami w sesji. Pole ustawiane jest od nowa tylko
+# wtedy, gdy treść sekcji zmieniła się poza edytorem (nowe generowanie, regeneracja);
+# wywoływana przed utworzeniem pól, bo później Streamlit nie pozwala zmienić ich stanu.
+def sync_editor_state(json_data):
+    editor_sources = st.session_state.setdefault("editor_sources", {})
+    for var, content in json_data.items():
+        if editor_sources.get(var) != content or f"edit_{var}" not in st.session_state:
+            st.session_state[f"edit_{var}"] = content
+            editor_sources[var] = content
 
-# Funkcja do analizy szablonu HTML i znalezienia używanych zmiennych
-def extract_variables_from_template(html_template):
-    # Wzór do wykrywania zmiennych w formie {!{ nazwa_zmiennej }!}
-    pattern = r'\{!\{\s*([a-zA-Z_]+)\s*\}!\}'
+# Edytor jednej sekcji - fragment strony: wpisywanie treści odświeża tylko ten fragment,
+# bez przebudowy pozostałych sekcji, panelu bocznego i podglądu kreacji
+@st.fragment
+def render_section_editor(var, openai_model, tone, bypass_cache=False, api_key=None):
+    title = var.replace('_', ' ').title()
     
-    # Znajdź wszystkie wystąpienia zmiennych
-    matches = re.findall(pattern, html_template)
+    # Dwie kolumny: jedna na edytor tekstu, druga na przycisk regeneracji
+    col1, col2 = st.columns([4, 1])
     
-    # Utwórz unikalny zbiór zmiennych (eliminując duplikaty)
-    unique_variables = set(matches)
+    with col1:
+        st.text_area(title, key=f"edit_{var}", height=200)
     
-    return unique_variables
+    with col2:
+        # Przycisk do regeneracji tylko tej sekcji
+        regenerate_btn = st.button(
+            "🔄 Wygeneruj ponownie", 
+            key=f"regenerate_{var}",
+            help=f"Wygeneruj ponownie tylko sekcję '{title}'"
+        )
+        
+        if regenerate_btn:
+            with st.spinner(f"Regeneruję sekcję {title}..."):
+                new_content = regenerate_single_section(
+                    pdf_text=st.session_state.pdf_text,
+                    persona=st.session_state.persona,
+                    section_name=var,
+                    author_info=st.session_state.author_info if var == "author_credentials" else "",
+                    model=openai_model,
+                    tone=tone,
+                    length=st.session_state.var_lengths.get(var, 300),
+                    bypass_cache=bypass_cache,
+                    current_content=st.session_state.current_json_data.get(var),
+                    api_key=api_key
+                )
+            
+            if new_content:
+                # Aktualizuj dane w sesji i odśwież stronę (podgląd kreacji z nową treścią)
+                st.session_state.current_json_data[var] = new_content
+                st.rerun()
 
-# Funkcja do dynamicznego tworzenia schematu JSON na podstawie wymaganych zmiennych
-def create_dynamic_json_schema(required_variables):
-    schema = {
-        "type": "object",
-        "required": list(required_variables),
-        "properties": {}
-    }
+# Edytor wygenerowanych treści: zakładki z grupami zmiennych, każda sekcja jako osobny fragment.
+# Zwraca True, jeśli kliknięto "Zastosuj zmiany" (treści z pól edytora trafiają do sesji).
+def render_content_editor(required_variables, openai_model, tone, concurrency, bypass_cache=False, api_key=None):
+    json_data = st.session_state.current_json_data
+    sync_editor_state(json_data)
     
-    # Dodanie właściwości dla każdej wymaganej zmiennej
-    for var in required_variables:
-        if var in ALL_VARIABLES:
-            schema["properties"][var] = {
-                "type": "string", 
-                "description": ALL_VARIABLES[var]
-            }
+    st.subheader("Edytuj wygenerowane treści:")
     
-    return schema
-
-# Funkcja do obsługi specjalnych przypadków formatu danych
-def normalize_json_data(data):
-    # Sprawdzenie czy contents jest listą i konwersja na string w formacie HTML
-    if "contents" in data and isinstance(data["contents"], list):
-        html_content = "<ul>"
-        for item in data["contents"]:
-            if isinstance(item, dict) and "rozdzial" in item and "opis" in item:
-                html_content += f"<li><strong>{item['rozdzial']}</strong> - {item['opis']}</li>"
-            elif isinstance(item, str):
-                html_content += f"<li>{item}</li>"
-        html_content += "</ul>"
-        data["contents"] = html_content
+    # Zakładki tylko dla grup zawierających wymagane zmienne
+    groups = {}
+    for group_name, vars_in_group in VARIABLE_GROUPS.items():
+        group_vars = [var for var in vars_in_group if var in required_variables and var in json_data]
+        if group_vars:
+            groups[group_name] = group_vars
     
-    # Podobnie dla sekcji FAQ - jeśli jest listą, konwertuj na prostą listę HTML
-    if "faq" in data and isinstance(data["faq"], list):
-        html_content = ""
-        for item in data["faq"]:
-            if isinstance(item, dict) and "pytanie" in item and "odpowiedz" in item:
-                html_content += f"<strong>{item['pytanie']}</strong><br>{item['odpowiedz']}<br><br>"
-            elif isinstance(item, dict) and "question" in item and "answer" in item:
-                html_content += f"<strong>{item['question']}</strong><br>{item['answer']}<br><br>"
-        data["faq"] = html_content
+    for group_tab, group_vars in zip(st.tabs(list(groups)), groups.values()):
+        with group_tab:
+            for var in group_vars:
+                render_section_editor(var, openai_model, tone, bypass_cache, api_key)
     
-    # Podobnie dla sekcji key_benefits - jeśli jest listą, konwertuj na prostą listę HTML
-    if "key_benefits" in data and isinstance(data["key_benefits"], list):
-        html_content = "<ul>"
-        for item in data["key_benefits"]:
-            if isinstance(item, str):
-                html_content += f"<li>{item}</li>"
-            elif isinstance(item, dict) and "benefit" in item:
-                html_content += f"<li>{item['benefit']}</li>"
-        html_content += "</ul>"
-        data["key_benefits"] = html_content
+    # Regeneracja wielu sekcji naraz
+    render_batch_regeneration(required_variables, openai_model, tone, concurrency, bypass_cache, api_key)
     
-    # Podobnie dla sekcji testimonials - jeśli jest listą, konwertuj na prosty tekst
-    if "testimonials" in data and isinstance(data["testimonials"], list):
-        html_content = ""
-        for item in data["testimonials"]:
-            if isinstance(item, str):
-                html_content += f"\"{item}\"<br><br>"
-            elif isinstance(item, dict) and "text" in item and "author" in item:
-                html_content += f"\"{item['text']}\" - {item['author']}<br><br>"
-            elif isinstance(item, dict) and "testimonial" in item:
-                html_content += f"\"{item['testimonial']}\"<br><br>"
-        data["testimonials"] = html_content
+    # Zastosowanie zmian z pól edytora (klucze bez pola edytora pozostają bez zmian)
+    if not st.button("Zastosuj zmiany"):
+        return False
     
-    # Upewnienie się, że wszystkie pola są stringami
-    for key in data:
-        if not isinstance(data[key], str):
-            # Konwersja innych typów na string
-            if isinstance(data[key], list):
-                data[key] = ", ".join(str(item) for item in data[key])
-            else:
-                data[key] = str(data[key])
+    edited_json = dict(json_data)
+    for var in json_data:
+        if f"edit_{var}" in st.session_state:
+            edited_json[var] = st.session_state[f"edit_{var}"]
+    st.session_state.editor_sources.update(edited_json)
+    st.session_state.current_json_data = edited_json
+    st.success("Zmiany zostały zastosowane!")
+    return True
+
+# Kod HTML kreacji pokazywany na żądanie - fragment strony, więc przełączenie
+# nie wysyła ponownie podglądu, a ukryty kod nie jest składany ani wysyłany do przeglądarki
+@st.fragment
+def render_html_code(rendered):
+    if st.toggle("Pokaż kod HTML", key="show_html_code"):
+        st.code(rendered.html, language="html")
+
+# Komponent podglądu kreacji (components/mail_preview) rejestrowany raz na proces
+@functools.lru_cache(maxsize=None)
+def get_mail_preview_component():
+    return st.components.v1.declare_component(
+        "mail_preview",
+        path=os.path.join(os.path.dirname(os.path.abspath(__file__)), "components", "mail_preview")
+    )
+
+# Podgląd kreacji aktualizowany przyrostowo. Pełny dokument (stałe fragmenty szablonu i wartości
+# zmiennych) wysyłany jest tylko przy pierwszym wyświetleniu, po zmianie szablonu, gdy podgląd
+# nie był widoczny w poprzednim przebiegu lub na prośbę komponentu; po edycji lub regeneracji
+# sekcji komponent dostaje wyłącznie zmienione miejsca szablonu. Przycisk kopiowania do schowka
+# jest częścią komponentu i korzysta z dokumentu przechowywanego w przeglądarce.
+def render_mail_preview(rendered, height=600):
+    sent = st.session_state.get("preview_sent")
+    full = sent is None or sent[0] != rendered.id or not st.session_state.get("preview_mounted")
     
-    # Usunięcie wszelkich niepotrzebnych divów i klas
-    for key in data:
-        if isinstance(data[key], str):
-            # Uproszczenie struktury HTML, usunięcie div z klasami
-            data[key] = re.sub(r'<div\s+class="[^"]*">(.*?)</div>', r'\1', data[key], flags=re.DOTALL)
-            # Usunięcie pozostałych divów
-            data[key] = re.sub(r'<div>(.*?)</div>', r'\1', data[key], flags=re.DOTALL)
-            # Usunięcie atrybutów class z innych tagów
-            data[key] = re.sub(r'<([a-z]+)\s+class="[^"]*"', r'<\1', data[key])
+    # Komponent nie zna wersji, od której liczone są zmiany (np. po ponownym zamontowaniu)
+    request = st.session_state.get("mail_preview")
+    if request and request.get("nonce") != st.session_state.get("preview_request_handled"):
+        st.session_state.preview_request_handled = request["nonce"]
+        full = True
     
-    return data
+    if full:
+        args = {
+            "style": PREVIEW_STYLE,
+            "fragments": list(rendered.template.fragments),
+            "values": rendered.slot_values(),
+        }
+    else:
+        args = {
+            "base_version": sent[1],
+            "patches": {str(index): value for index, value in rendered.patches_since(sent[1]).items()},
+        }
+    get_mail_preview_component()(
+        document=rendered.id, version=rendered.version, height=height, key="mail_preview", default=None, **args
+    )
+    st.session_state.preview_sent = (rendered.id, rendered.version)
+    st.session_state.preview_rendered = True
 
-# Funkcja do generowania sekcji dla kwalifikacji autora
-def generate_author_credentials(author_info, model="o4-mini", api_key=None):
-    if not author_info or author_info.strip() == "":
-        return None
-    
-    try:
-        # Sprawdzenie, czy klucz API OpenAI jest ustawiony
-        if not api_key:
-            api_key = os.environ.get("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-            if not api_key:
-                return author_info  # Fallback do oryginalnych danych
-        
-        # Inicjalizacja klienta OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        # Prompt dla AI do przetworzenia informacji o autorze
-        prompt = f"""
-        Na podstawie poniższych surowych informacji o autorze, stwórz profesjonalny, 
-        angażujący i zwięzły biogram podkreślający jego kompetencje, doświadczenie i autorytet. 
-        Napisz w trzeciej osobie. Użyj maksymalnie 3-4 zdań.
-        
-        INFORMACJE O AUTORZE:
-        {author_info}
-        
-        Zwróć tylko przetworzoną treść bez dodatkowych tytułów, wprowadzeń czy formatowań.
-        Możesz używać podstawowego formatowania HTML (<strong>, <em>) dla podkreślenia 
-        kluczowych informacji.
-        """
-        
-        # Wywołanie API OpenAI
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Jesteś ekspertem w tworzeniu profesjonalnych biogramów autorów."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Zwrócenie wygenerowanego biogramu
-        return response.choices[0].message.content.strip()
+# Przycisk pobrania kodu kreacji. Plik tworzony jest dopiero po kliknięciu (Streamlit wywołuje
+# wtedy rendered.encoded w osobnym wątku), więc przy zwykłym przebiegu skryptu do przeglądarki
+# trafia tylko sam przycisk, a bajty wyliczane są raz dla każdej wersji dokumentu.
+def render_download_button(rendered):
+    st.download_button(
+        "💾 Pobierz kod HTML",
+        data=rendered.encoded,
+        file_name="kreacja.html",
+        mime="text/html",
+        on_click="ignore",
+        key="download_html"
+    )
+
+# Podgląd kreacji (z przyciskiem kopiowania do schowka), jej kod HTML (na żądanie) i pobranie pliku
+def render_preview(rendered):
+    st.subheader("Podgląd kreacji:")
+    render_mail_preview(rendered)
     
-    except Exception as e:
-        # W przypadku błędu, zwróć oryginalne dane
-        st.warning(f"Nie udało się przetworzyć informacji o autorze. Używam oryginalnych danych.")
-        return author_info
+    render_html_code(rendered)
+    render_download_button(rendered)
 
-# Funkcja do ponownego generowania pojedynczej sekcji
-def regenerate_single_section(pdf_text, persona, section_name, author_info="", model="o4-mini", tone="przyjazny", length=300):
-    try:
-        # Sprawdzenie, czy klucz API OpenAI jest ustawiony
-        api_key = os.environ.get("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-        if not api_key:
-            st.error("Brak klucza API OpenAI. Ustaw zmienną środowiskową OPENAI_API_KEY lub dodaj ją do sekretu Streamlit.")
-            return None
-        
-        # Inicjalizacja klienta OpenAI
-        client = OpenAI(api_key=api_key)
-        
-        # Dostosowanie tonu komunikacji
-        tone_instruction = ""
-        if tone == "profesjonalny":
-            tone_instruction = "Użyj rzeczowego, uprzejmego języka, bez emocjonalnych wyrażeń. Zachowaj profesjonalny ton."
-        elif tone == "przyjazny":
-            tone_instruction = "Użyj ciepłego, osobistego i otwartego języka. Bądź przyjazny i bezpośredni."
-        elif tone == "zabawny":
-            tone_instruction = "Użyj lekkiego, żartobliwego języka z elementami humoru. Nie przesadzaj, ale bądź zabawny."
-        elif tone == "motywujący":
-            tone_instruction = "Użyj inspirującego, podnoszącego na duchu języka. Zachęcaj i motywuj czytelnika."
-        elif tone == "poważny":
-            tone_instruction = "Użyj formalnego, zdystansowanego i neutralnego języka. Zachowaj powagę i oficjalny ton."
-        elif tone == "empatyczny":
-            tone_instruction = "Użyj wspierającego języka, który pokazuje zrozumienie dla emocji i potrzeb odbiorcy."
-        
-        # Specjalny przypadek dla informacji o autorze
-        if section_name == "author_credentials" and author_info:
-            return generate_author_credentials(author_info, model=model, api_key=api_key)
-        
-        # Opis dla wybranej sekcji
-        section_description = ALL_VARIABLES.get(section_name, "Sekcja treści marketingowej")
-        
-        # Przygotowanie promptu dla OpenAI - tylko dla jednej sekcji
-        prompt = f"""
-        Przeanalizuj poniższy e-book i utwórz wysokiej jakości treść marketingową dla JEDNEJ sekcji.
-        
-        PERSONA:
-        {persona}
-        
-        TON KOMUNIKACJI:
-        {tone_instruction}
-        
-        WYMAGANA SEKCJA:
-        {section_name} - {section_description}
-        Długość: około {length} znaków
-        
-        TREŚĆ E-BOOKA:
-        {pdf_text}
-        
-        WAŻNE WSKAZÓWKI DLA TWORZENIA TREŚCI:
-        - Stwórz treść, która jest WYSOCE ANGAŻUJĄCA i PRZEKONUJĄCA marketingowo
-        - Używaj języka, który wzbudza emocje i zainteresowanie
-        - Zastosuj konkretne, obrazowe przykłady i opisy
-        - Wykorzystaj krótkie, dynamiczne zdania naprzemiennie z bardziej złożonymi
-        - Podkreśl unikalne korzyści i wartość, wykorzystaj tzw. "unique selling points"
-        - Pisz w drugiej osobie (Ty, Twój) aby stworzyć bezpośredni kontakt z czytelnikiem
-        - Używaj aktywnych czasowników i unikaj strony biernej
-        - NIE DODAWAJ TYTUŁÓW SEKCJI, tylko jej zawartość
-        - UŻYWAJ TYLKO PODSTAWOWEGO FORMATOWANIA HTML - wyłącznie <strong>, <em>, <br>, <li> dla list oraz <ul> dla list punktowanych
-        - NIE DODAWAJ znaczników <div>, <span>, <p>, <blockquote>, <dl>, atrybutów 'class', 'id' lub jakichkolwiek innych elementów formatowania
-        
-        Zwróć TYLKO treść sekcji, bez dodatkowego tekstu przed lub po, bez nazwy sekcji, bez formatowania JSON.
-        """
-        
-        # Wywołanie API OpenAI
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Jesteś ekspertem w tworzeniu najwyższej klasy treści marketingowych i perswazyjnych."},
-                {"role": "user", "content": prompt}
-            ]
+# Wynik generowania zapisany w sesji: edytor treści i podgląd kreacji. Kreacja zawsze
+# odpowiada bieżącym treściom (także po zastosowaniu zmian i regeneracji sekcji), a w szablonie
+# podstawiane są ponownie tylko sekcje, które zmieniły się od poprzedniego przebiegu.
+def render_results(openai_model, tone, concurrency, bypass_cache=False, api_key=None):
+    render_content_editor(st.session_state.required_variables, openai_model, tone, concurrency, bypass_cache, api_key)
+    
+    if st.session_state.current_template:
+        rendered = core.render_html_incremental(
+            st.session_state.current_template,
+            st.session_state.current_json_data,
+            st.session_state.get("rendered_mail")
         )
-        
-        # Pobierz treść odpowiedzi
-        content = response.choices[0].message.content.strip()
-        
-        # Usuń ewentualne tytuły sekcji
-        title_pattern = {
-            "intro": r'^(Wstęp|Wprowadzenie|Kontekst)[:;-]\s*',
-            "why_created": r'^(Dlaczego|Geneza|Powód)[:;-]\s*',
-            "contents": r'^(Zawartość|Spis treści|Co znajdziesz)[:;-]\s*',
-            "problems_solved": r'^(Problemy|Rozwiązania|Korzyści)[:;-]\s*',
-            "target_audience": r'^(Dla kogo|Odbiorcy|Grupa docelowa)[:;-]\s*',
-            "example": r'^(Przykład|Fragment|Cytat)[:;-]\s*',
-            "call_to_action": r'^(Wezwanie|CTA|Działaj|Zrób)[:;-]\s*',
-            "key_benefits": r'^(Korzyści|Zalety|Benefity)[:;-]\s*',
-            "guarantee": r'^(Gwarancja|Obietnica|Zapewnienie)[:;-]\s*',
-            "testimonials": r'^(Opinie|Rekomendacje|Co mówią)[:;-]\s*',
-            "value_summary": r'^(Podsumowanie|Wartość|W skrócie)[:;-]\s*',
-            "faq": r'^(FAQ|Pytania|Q&A)[:;-]\s*',
-            "urgency": r'^(Pilne|Ogranicz|Nie czekaj)[:;-]\s*',
-            "comparison": r'^(Porównanie|Wyróżnienie|Co nas wyróżnia)[:;-]\s*',
-            "transformation_story": r'^(Historia|Transformacja|Zmiana|Case study)[:;-]\s*'
-        }
-        
-        if section_name in title_pattern:
-            content = re.sub(title_pattern[section_name], '', content, flags=re.IGNORECASE)
-        
-        # Formatowanie specjalne dla list
-        if section_name == "contents" and "<ul>" not in content and "<li>" not in content:
-            lines = content.split("\n")
-            if len(lines) > 1:
-                content = "<ul>" + "".join([f"<li>{line.strip()}</li>" for line in lines if line.strip()]) + "</ul>"
-        
-        if section_name == "key_benefits" and "<ul>" not in content and "<li>" not in content:
-            lines = content.split("\n")
-            if len(lines) > 1:
-                content = "<ul>" + "".join([f"<li>{line.strip()}</li>" for line in lines if line.strip()]) + "</ul>"
-        
-        return content
+        st.session_state.rendered_mail = rendered
+        render_preview(rendered)
+
+# Funkcja ładująca wynik zakończonego zadania w tle do sesji (dalej działa jak po zwykłym generowaniu)
+def attach_job_result(job):
+    st.session_state.current_json_data = job.result["data"]
+    st.session_state.current_template = job.payload["html_template"]
+    st.session_state.required_variables = set(job.result["required_variables"])
+    st.session_state.persona = job.payload["persona"]
+    st.session_state.author_info = job.payload["author_info"]
+    st.session_state.pdf_text = jobs.read_job_pdf_text(job)
+    st.session_state.attached_job = job.id
+    record_usage(job.result["usage"])
+
+# Stan zadania w tle: status, ostatni błąd, a dla zadania w toku - przycisk przerwania
+# i sekcje gotowe przed zakończeniem zadania (zapisywane przez wątek roboczy)
+def show_job_status(job):
+    status_labels = {
+        "queued": "⏳ w kolejce",
+        "running": "⚙️ w trakcie",
+        "failed": "❌ błąd",
+        "cancelled": "⏹️ przerwane",
+    }
+    st.subheader(f"Zadanie {job.id[:8]}: {status_labels.get(job.status, job.status)}")
+    if job.attempts > 1 or job.status == "failed":
+        st.caption(f"Próba {job.attempts}/{job.max_attempts}")
+    if job.error:
+        (st.error if job.status == "failed" else st.caption)(f"Ostatni błąd: {job.error}")
     
-    except Exception as e:
-        st.error(f"Błąd podczas generowania sekcji {section_name}: {e}")
-        return None
+    if not job.finished:
+        if st.button("⏹️ Przerwij zadanie", key=f"cancel_job_{job.id}"):
+            jobs.get_job_queue().cancel(job.id)
+        
+        sections = job.progress.get("sections", {})
+        for var in ALL_VARIABLES:
+            if var in sections:
+                st.markdown(f"**{var.replace('_', ' ').title()}**\n\n{sections[var]}", unsafe_allow_html=True)
 
-# Funkcja do wywołania API OpenAI dla wymaganych zmiennych
-def analyze_pdf_with_openai(pdf_text, persona, required_variables, author_info="", model="o4-mini", tone="przyjazny", lengths=None):
-    try:
-        # Sprawdzenie, czy klucz API OpenAI jest ustawiony
-        api_key = os.environ.get("OPENAI_API_KEY") or st.secrets.get("OPENAI_API_KEY")
-        if not api_key:
-            st.error("Brak klucza API OpenAI. Ustaw zmienną środowiskową OPENAI_API_KEY lub dodaj ją do sekretu Streamlit.")
-            return None
-        
-        # Inicjalizacja klienta OpenAI (nowy sposób w wersji >=1.0.0)
-        client = OpenAI(api_key=api_key)
-        
-        # Dostosowanie tonu komunikacji
-        tone_instruction = ""
-        if tone == "profesjonalny":
-            tone_instruction = "Użyj rzeczowego, uprzejmego języka, bez emocjonalnych wyrażeń. Zachowaj profesjonalny ton."
-        elif tone == "przyjazny":
-            tone_instruction = "Użyj ciepłego, osobistego i otwartego języka. Bądź przyjazny i bezpośredni."
-        elif tone == "zabawny":
-            tone_instruction = "Użyj lekkiego, żartobliwego języka z elementami humoru. Nie przesadzaj, ale bądź zabawny."
-        elif tone == "motywujący":
-            tone_instruction = "Użyj inspirującego, podnoszącego na duchu języka. Zachęcaj i motywuj czytelnika."
-        elif tone == "poważny":
-            tone_instruction = "Użyj formalnego, zdystansowanego i neutralnego języka. Zachowaj powagę i oficjalny ton."
-        elif tone == "empatyczny":
-            tone_instruction = "Użyj wspierającego języka, który pokazuje zrozumienie dla emocji i potrzeb odbiorcy."
-        
-        # Dodanie informacji o długościach sekcji, jeśli są dostępne
-        length_instructions = ""
-        if lengths:
-            length_instructions = "DŁUGOŚCI SEKCJI:\n"
-            for var in required_variables:
-                if var in lengths:
-                    length_instructions += f"- {var}: około {lengths.get(var)} znaków\n"
-        
-        # Informacje o autorze
-        author_instructions = ""
-        if "author_credentials" in required_variables and author_info and author_info.strip():
-            author_instructions = f"""
-            INFORMACJE O AUTORZE:
-            {author_info}
-            
-            Wykorzystaj powyższe informacje by stworzyć przekonującą sekcję author_credentials.
-            """
-        
-        # Przygotowanie listy wymaganych zmiennych z opisami
-        variables_instructions = "WYMAGANE ZMIENNE:\n"
-        for var in required_variables:
-            if var in ALL_VARIABLES:
-                variables_instructions += f"{var} - {ALL_VARIABLES[var]}\n"
-        
-        # Przygotowanie promptu dla OpenAI koncentrując się tylko na wymaganych zmiennych
-        prompt = f"""
-        Przeanalizuj pełny tekst e-booka i wygeneruj bloki treści marketingowej ściśle odpowiadające wskazanej personie.
+# Stan zadania w toku odświeżany co 2 sekundy (tylko ten fragment strony, nie cały skrypt).
+# Gdy zadanie się zakończy (w dowolny sposób), uruchamiany jest cały skrypt - pokazuje wynik
+# albo stan końcowy już bez fragmentu, więc odświeżanie ustaje.
+@st.fragment(run_every=2)
+def render_job_progress(job_id):
+    job = jobs.get_job_queue().get(job_id)
+    if job is None or job.finished:
+        st.rerun()
+    show_job_status(job)
 
-        ⚠️ GENERUJ WYŁĄCZNIE treści dla kluczy wymienionych w sekcji [OPISY ZMIENNYCH].  
-        ⚠️ NIE twórz dodatkowych kluczy ani nie zmieniaj ich nazewnictwa czy kolejności.
-        
-        [PERSONA]
-        {persona}
-        
-        TON KOMUNIKACJI:
-        {tone_instruction}
-        
-        {variables_instructions}
-        
-        {length_instructions}
-        
-        {author_instructions}
-        
-        TREŚĆ E-BOOKA:
-        {pdf_text}
-        
-        Zwróć wynik w formacie JSON zawierający TYLKO poniższe wymagane klucze:
+# Status zadania w tle. Identyfikator zadania jest w adresie strony, więc po odświeżeniu
+# strony lub w innej karcie widok podłącza się do tego samego zadania.
+def render_job_status(job_id):
+    job = jobs.get_job_queue().get(job_id)
+    if job is None:
+        st.warning("Nie znaleziono zadania - mogło zostać usunięte po upływie czasu przechowywania.")
+        return
+    
+    if job.status == "succeeded":
+        attach_job_result(job)
+        st.rerun()
+    
+    if job.finished:
+        show_job_status(job)
+    else:
+        render_job_progress(job_id)
 
-        [OPISY ZMIENNYCH]
-        """
-        
-        # Dodaj opis każdej wymaganej zmiennej
-        for i, var in enumerate(required_variables, 1):
-            if var in ALL_VARIABLES:
-                prompt += f"\n{i}. {var} - {ALL_VARIABLES[var]}. Nie dodawaj tytułów, tylko samą treść."
-        
-        prompt += """
-        
-        WAŻNE WSKAZÓWKI DLA TWORZENIA TREŚCI:
-        • Twórz teksty maksymalnie angażujące, skupione na praktycznej wartości.  
-        • Podkreślaj unique selling points – konkrety zamiast ogólników.  
-        • Pisz w drugiej osobie („Ty”, „Twój”) i stosuj aktywne czasowniki.  
-        • Mieszaj krótkie zdania z rozbudowanymi dla rytmu i dynamiki.  
-        • Wplataj obrazowe przykłady i dane liczbowe (jeśli znajdują się w e-booku).  
-        • NIE dodawaj tytułów sekcji – zwróć wyłącznie treść odpowiadającą zmiennym.  
-        • Dopuszczalne tagi HTML: <strong>, <em>, <ul>, <li>, <br>.  
-            – Zakaz używania <div>, <span>, <p>, <blockquote>, <dl>, atrybutów class/id i inline-style.  
-        • Jeśli brak danych w e-booku dla danej zmiennej, zwróć pusty string "" (nie placeholder).
-        
-        Odpowiedź musi być w formacie JSON, używaj minimalnego formatowania HTML.
-        WAŻNE: Zwróć TYLKO obiekt JSON bez dodatkowego tekstu przed lub po.
-        """
-        
-        # Wywołanie API OpenAI
-        response = client.chat.completions.create(
-            model=model,
-            messages=[
-                {"role": "system", "content": "Jesteś ekspertem w tworzeniu najwyższej klasy treści marketingowych i perswazyjnych. Twoje teksty charakteryzują się wysoką skutecznością, profesjonalizmem i doskonałym dopasowaniem do grupy docelowej."},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        
-        # Parsowanie odpowiedzi do JSON
-        content = response.choices[0].message.content
-        
-        # Wydobycie fragmentu JSON z odpowiedzi (na wypadek, gdyby model dodał tekst przed/po JSON)
-        json_match = re.search(r'({[\s\S]*})', content)
-        if json_match:
-            json_content = json.loads(json_match.group(1))
-        else:
-            json_content = json.loads(content)
-        
-        # Normalizacja danych JSON przed walidacją
-        json_content = normalize_json_data(json_content)
-        
-        # Dodatkowe sprawdzenie, czy treści nie zawierają tytułów sekcji
-        title_patterns = {
-            "intro": r'^(Wstęp|Wprowadzenie|Kontekst)[:;-]\s*',
-            "why_created": r'^(Dlaczego|Geneza|Powód)[:;-]\s*',
-            "contents": r'^(Zawartość|Spis treści|Co znajdziesz)[:;-]\s*',
-            "problems_solved": r'^(Problemy|Rozwiązania|Korzyści)[:;-]\s*',
-            "target_audience": r'^(Dla kogo|Odbiorcy|Grupa docelowa)[:;-]\s*',
-            "example": r'^(Przykład|Fragment|Cytat)[:;-]\s*',
-            "call_to_action": r'^(Wezwanie|CTA|Działaj|Zrób)[:;-]\s*',
-            "key_benefits": r'^(Korzyści|Zalety|Benefity)[:;-]\s*',
-            "guarantee": r'^(Gwarancja|Obietnica|Zapewnienie)[:;-]\s*',
-            "testimonials": r'^(Opinie|Rekomendacje|Co mówią)[:;-]\s*',
-            "value_summary": r'^(Podsumowanie|Wartość|W skrócie)[:;-]\s*',
-            "faq": r'^(FAQ|Pytania|Q&A)[:;-]\s*',
-            "urgency": r'^(Pilne|Ogranicz|Nie czekaj)[:;-]\s*',
-            "comparison": r'^(Porównanie|Wyróżnienie|Co nas wyróżnia)[:;-]\s*',
-            "transformation_story": r'^(Historia|Transformacja|Zmiana|Case study)[:;-]\s*'
-        }
+# Lista ostatnich zadań w tle (odnośniki podłączają widok do wybranego zadania)
+def render_job_list():
+    recent_jobs = jobs.get_job_queue().list(limit=10)
+    if not recent_jobs:
+        return
+    with st.sidebar.expander("🗂️ Zadania w tle", expanded=False):
+        for job in recent_jobs:
+            created = time.strftime("%H:%M:%S", time.localtime(job.created))
+            st.markdown(f"[{job.id[:8]}](?job={job.id}) · {job.status} · {created}")
+
+# Ustawienia długości zmiennych - fragment strony: przesunięcie suwaka zapisuje długość
+# w sesji bez ponownego uruchamiania całego skryptu
+@st.fragment
+def render_length_settings():
+    with st.expander("⚙️ Ustawienia długości zmiennych", expanded=False):
+        # Pogrupuj zmienne w zakładki
+        length_tabs = st.tabs(["Podstawowe", "Korzyści", "Perswazja", "Dodatkowe"])
         
-        for key, pattern in title_patterns.items():
-            if key in json_content:
-                value = json_content[key]
-                json_content[key] = re.sub(pattern, '', value, flags=re.IGNORECASE)
+        with length_tabs[0]:
+            # Podstawowe elementy
+            st.subheader("Podstawowe sekcje")
+            st.session_state.var_lengths["intro"] = st.slider("Wstęp", 150, 800, st.session_state.var_lengths["intro"])
+            st.session_state.var_lengths["why_created"] = st.slider("Dlaczego powstał", 150, 800, st.session_state.var_lengths["why_created"])
+            st.session_state.var_lengths["contents"] = st.slider("Zawartość", 200, 1000, st.session_state.var_lengths["contents"])
+            st.session_state.var_lengths["problems_solved"] = st.slider("Rozwiązania problemów", 200, 800, st.session_state.var_lengths["problems_solved"])
+            st.session_state.var_lengths["target_audience"] = st.slider("Grupa docelowa", 150, 800, st.session_state.var_lengths["target_audience"])
+            st.session_state.var_lengths["example"] = st.slider("Przykład", 150, 800, st.session_state.var_lengths["example"])
         
-        # Walidacja JSON według dynamicznie utworzonego schematu
-        json_schema = create_dynamic_json_schema(required_variables)
-        validate(instance=json_content, schema=json_schema)
+        with length_tabs[1]:
+            # Elementy korzyści
+            st.subheader("Korzyści i wartość")
+            st.session_state.var_lengths["key_benefits"] = st.slider("Kluczowe korzyści", 200, 1000, st.session_state.var_lengths["key_benefits"])
+            st.session_state.var_lengths["guarantee"] = st.slider("Gwarancja", 150, 800, st.session_state.var_lengths["guarantee"])
+            st.session_state.var_lengths["value_summary"] = st.slider("Podsumowanie wartości", 150, 800, st.session_state.var_lengths["value_summary"])
+            st.session_state.var_lengths["comparison"] = st.slider("Porównanie", 200, 1000, st.session_state.var_lengths["comparison"])
         
-        # Jeśli potrzebny jest author_credentials, a nie został wygenerowany
-        if "author_credentials" in required_variables and "author_credentials" not in json_content and author_info:
-            json_content["author_credentials"] = generate_author_credentials(author_info, model=model, api_key=api_key)
+        with length_tabs[2]:
+            # Elementy perswazyjne
+            st.subheader("Elementy perswazyjne")
+            st.session_state.var_lengths["call_to_action"] = st.slider("Wezwanie do działania", 150, 800, st.session_state.var_lengths["call_to_action"])
+            st.session_state.var_lengths["testimonials"] = st.slider("Opinie", 300, 1200, st.session_state.var_lengths["testimonials"])
+            st.session_state.var_lengths["urgency"] = st.slider("Pilność", 150, 800, st.session_state.var_lengths["urgency"])
+            st.session_state.var_lengths["transformation_story"] = st.slider("Historia transformacji", 200, 1000, st.session_state.var_lengths["transformation_story"])
         
-        return json_content
-    
-    except json.JSONDecodeError as e:
-        st.error(f"Błąd parsowania JSON: {e}")
-        st.code(content)  # Wyświetl surową odpowiedź, aby pomóc w diagnostyce
-        return None
-    except ValidationError as e:
-        st.error(f"Błąd walidacji JSON: {e}")
-        return None
-    except Exception as e:
-        st.error(f"Błąd podczas analizy z OpenAI: {e}")
-        return None
-
-# Funkcja do podstawiania wartości z JSON w kreacji mailowej
-def replace_variables_in_html(html_content, json_data):
-    # Wzór do wykrywania zmiennych w formie {!{ nazwa_zmiennej }!}
-    pattern = r'\{!\{\s*([a-zA-Z_]+)\s*\}!\}'
-    
-    def replacer(match):
-        var_name = match.group(1)
-        if var_name in json_data:
-            return json_data[var_name]
-        else:
-            return f"[Zmienna {var_name} nie znaleziona]"
-    
-    # Zastąpienie wszystkich zmiennych w HTML
-    result = re.sub(pattern, replacer, html_content)
-    return result
-
-# Funkcja do kopiowania kodu do schowka
-def get_copy_button_html(text):
-    encoded_text = base64.b64encode(text.encode()).decode()
-    return f"""
-    <script>
-    function copyToClipboard() {{
-        const textarea = document.createElement('textarea');
-        textarea.value = atob("{encoded_text}");
-        document.body.appendChild(textarea);
-        textarea.select();
-        document.execCommand('copy');
-        document.body.removeChild(textarea);
-        document.getElementById('copy-status').innerHTML = 'Skopiowano!';
-        setTimeout(() => {{
-            document.getElementById('copy-status').innerHTML = '';
-        }}, 2000);
-    }}
-    </script>
-    <button onclick="copyToClipboard()">Kopiuj do schowka</button>
-    <span id="copy-status" style="margin-left: 10px;"></span>
-    """
+        with length_tabs[3]:
+            # Dodatkowe elementy
+            st.subheader("Dodatkowe elementy")
+            st.session_state.var_lengths["faq"] = st.slider("FAQ", 300, 1500, st.session_state.var_lengths["faq"])
+            st.session_state.var_lengths["author_credentials"] = st.slider("O autorze", 150, 800, st.session_state.var_lengths["author_credentials"])
 
 # Inicjalizacja sesji
 def init_session_state():
     if "current_json_data" not in st.session_state:
         st.session_state.current_json_data = None
     
-    if "current_html" not in st.session_state:
-        st.session_state.current_html = None
+    if "current_template" not in st.session_state:
+        st.session_state.current_template = None
     
     if "required_variables" not in st.session_state:
         st.session_state.required_variables = set()
@@ -554,39 +487,29 @@ def init_session_state():
         
     # Inicjalizacja domyślnych długości dla zmiennych
     if "var_lengths" not in st.session_state:
-        st.session_state.var_lengths = {
-            # Podstawowe zmienne
-            "intro": 300,
-            "why_created": 300,
-            "contents": 400,
-            "problems_solved": 350,
-            "target_audience": 300,
-            "example": 300,
-            
-            # Korzyści i wartość
-            "key_benefits": 400,
-            "guarantee": 300,
-            "value_summary": 300,
-            "comparison": 400,
-            
-            # Elementy perswazyjne
-            "call_to_action": 250,
-            "testimonials": 500,
-            "urgency": 250,
-            "transformation_story": 400,
-            
-            # Dodatkowe elementy
-            "faq": 800,
-            "author_credentials": 300
-        }
+        st.session_state.var_lengths = dict(DEFAULT_VAR_LENGTHS)
 
 # Główna aplikacja Streamlit
 def main():
+    # Konfiguracja strony (wywoływana w main, aby import modułu nie zmieniał stanu Streamlit)
+    st.set_page_config(
+        page_title="Generator treści marketingowych do maili",
+        layout="wide"
+    )
+    
     st.title("Generator treści marketingowych dla e-booków")
     
     # Inicjalizacja stanu sesji
     init_session_state()
     
+    # Czy podgląd kreacji był wyświetlony w poprzednim przebiegu (jeśli nie, komponent podglądu
+    # został usunięty ze strony i potrzebuje pełnego dokumentu)
+    st.session_state.preview_mounted = st.session_state.pop("preview_rendered", False)
+    
+    # Metryki w formacie Prometheus pod /metrics (jeśli ustawiono MAILGEN_METRICS_PORT)
+    if METRICS_PORT:
+        start_metrics_server()
+    
     # Obsługa klucza API w Streamlit Cloud
     api_key = os.environ.get("OPENAI_API_KEY")
     
@@ -609,6 +532,13 @@ def main():
         help="Wybierz model OpenAI"
     )
     
+    # Bez tokenizera budżet promptu opiera się na szacunku z liczby znaków
+    if not has_exact_token_count(openai_model):
+        st.sidebar.warning(
+            "Tokenizer modelu (tiktoken) jest niedostępny - liczba tokenów e-booka jest szacowana "
+            "na podstawie liczby znaków, więc wybór pełnego tekstu, przycięcia lub streszczenia jest przybliżony."
+        )
+    
     tone = st.sidebar.selectbox(
         "Ton komunikacji",
         ["profesjonalny", "przyjazny", "zabawny", "motywujący", "poważny", "empatyczny"],
@@ -616,6 +546,108 @@ def main():
         help="Wybierz preferowany ton komunikacji dla generowanych treści."
     )
     
+    regeneration_concurrency = st.sidebar.slider(
+        "Równoległe zapytania przy regeneracji",
+        1, 8, 4,
+        help="Maksymalna liczba sekcji generowanych jednocześnie przy regeneracji wielu sekcji."
+    )
+    
+    # Limity odczytu bardzo dużych plików PDF (0 = bez limitu)
+    with st.sidebar.expander("📄 Odczyt PDF", expanded=False):
+        pdf_max_pages = st.number_input("Maksymalna liczba stron", min_value=0, value=0, step=10)
+        pdf_max_chars = st.number_input("Maksymalna liczba znaków", min_value=0, value=0, step=10000)
+    
+    # Schemat JSON jako ograniczenie odpowiedzi modelu (structured outputs)
+    structured_output = st.sidebar.checkbox(
+        "Wymuś schemat JSON odpowiedzi",
+        value=True,
+        help="Model otrzymuje schemat wymaganych zmiennych i nie może zwrócić niepoprawnego JSON-a. "
+             "Brakujące sekcje uzupełnia jedno zapytanie naprawcze. Modele bez obsługi schematu (np. gpt-4) używają zwykłego trybu."
+    )
+    
+    # Strumieniowanie odpowiedzi - sekcje pojawiają się w miarę generowania
+    stream_output = st.sidebar.checkbox(
+        "Strumieniowanie odpowiedzi",
+        value=True,
+        help="Sekcje i podgląd kreacji wypełniają się, gdy tylko model skończy daną sekcję. "
+             "Generowanie można przerwać przed otrzymaniem całej odpowiedzi."
+    )
+    
+    # Generowanie w tle - zadanie trafia do kolejki i nie przerywa go odświeżenie strony
+    background_jobs = st.sidebar.checkbox(
+        "Generuj w tle (kolejka zadań)",
+        value=True,
+        help="Generowanie wykonuje wątek roboczy serwera. Postęp można śledzić po odświeżeniu strony "
+             "lub w innej karcie, a kilka e-booków może być przetwarzanych jednocześnie."
+    )
+    
+    # Pamięć podręczna odpowiedzi modelu
+    bypass_response_cache = st.sidebar.checkbox(
+        "Pomiń pamięć podręczną odpowiedzi",
+        value=False,
+        help="Zawsze wysyłaj nowe zapytanie do modelu, nawet jeśli identyczne zapytanie było już wykonane."
+    )
+    response_cache_stats = get_response_cache().stats()
+    st.sidebar.caption(
+        f"Pamięć podręczna odpowiedzi: {response_cache_stats['hits']} trafień, "
+        f"{response_cache_stats['misses']} chybień, {response_cache_stats['entries']} wpisów"
+    )
+    
+    # Statystyki pamięci podręcznej tekstu PDF
+    pdf_cache_stats = get_pdf_cache().stats()
+    st.sidebar.caption(
+        f"Pamięć podręczna PDF: {pdf_cache_stats['hits']} trafień, "
+        f"{pdf_cache_stats['misses']} chybień, {pdf_cache_stats['entries']} plików"
+    )
+    
+    # Odsetek generowań wymagających ponownego generowania sekcji i zmarnowane tokeny
+    for mode, label in (("json_schema", "Schemat JSON"), ("prompt", "Zwykły JSON")):
+        mode_stats = get_generation_stats().stats()[mode]
+        if mode_stats["runs"]:
+            st.sidebar.caption(
+                f"{label}: {mode_stats['runs']} generowań, ponowienia: {mode_stats['retry_rate']:.0%} "
+                f"({mode_stats['retried_keys']} sekcji), zmarnowane tokeny: {mode_stats['wasted_tokens']}"
+            )
+    
+    render_job_list()
+    
+    # Harmonogram zapytań do API: odpowiedzi 429, ponowienia i bieżąca liczba jednoczesnych zapytań
+    rate_limiter_stats = get_rate_limiter().stats()
+    if rate_limiter_stats["requests"]:
+        st.sidebar.caption(
+            f"Zapytania do API: {rate_limiter_stats['requests']}, odpowiedzi 429: {rate_limiter_stats['rate_limited']}, "
+            f"ponowienia: {rate_limiter_stats['retries']}, równoległość: {rate_limiter_stats['concurrency']}"
+        )
+    
+    # Czas i tokeny kolejnych etapów generowania (wszystkie sesje tego procesu) z eksportem
+    metrics = get_metrics()
+    stage_summary = metrics.summary()
+    if stage_summary:
+        with st.sidebar.expander("⏱️ Diagnostyka etapów", expanded=False):
+            st.dataframe(stage_summary, hide_index=True)
+            st.download_button(
+                "Pobierz pomiary (JSON Lines)",
+                metrics.to_jsonl(),
+                file_name="mailgen_metrics.jsonl",
+                mime="application/x-ndjson"
+            )
+            st.download_button(
+                "Pobierz metryki (Prometheus)",
+                metrics.to_prometheus(),
+                file_name="mailgen_metrics.prom",
+                mime="text/plain"
+            )
+    
+    # Zużycie tokenów ostatnich zapytań, z podziałem na tokeny z pamięci podręcznej promptu
+    usage_history = st.session_state.get("usage_history", [])
+    if usage_history:
+        with st.sidebar.expander("📊 Zużycie tokenów", expanded=False):
+            total_prompt = sum(entry["prompt_tokens"] for entry in usage_history)
+            total_cached = sum(entry["cached_tokens"] for entry in usage_history)
+            cached_share = 100 * total_cached / total_prompt if total_prompt else 0
+            st.caption(f"Tokeny wejściowe: {total_prompt} (z pamięci podręcznej: {total_cached}, {cached_share:.0f}%)")
+            st.dataframe(usage_history[::-1], hide_index=True)
+    
     # Dokumentacja zmiennych w panelu bocznym
     with st.sidebar.expander("📚 Dokumentacja dostępnych zmiennych", expanded=False):
         st.markdown("""
@@ -656,41 +688,8 @@ def main():
         st.markdown("💡 **Wskazówka:** Zmienne zawierają tylko podstawowe formatowanie HTML (bold, italic, listy).")
     
     # Ustawienia długości zmiennych w panelu bocznym
-    with st.sidebar.expander("⚙️ Ustawienia długości zmiennych", expanded=False):
-        # Pogrupuj zmienne w zakładki
-        length_tabs = st.tabs(["Podstawowe", "Korzyści", "Perswazja", "Dodatkowe"])
-        
-        with length_tabs[0]:
-            # Podstawowe elementy
-            st.subheader("Podstawowe sekcje")
-            st.session_state.var_lengths["intro"] = st.slider("Wstęp", 150, 800, st.session_state.var_lengths["intro"])
-            st.session_state.var_lengths["why_created"] = st.slider("Dlaczego powstał", 150, 800, st.session_state.var_lengths["why_created"])
-            st.session_state.var_lengths["contents"] = st.slider("Zawartość", 200, 1000, st.session_state.var_lengths["contents"])
-            st.session_state.var_lengths["problems_solved"] = st.slider("Rozwiązania problemów", 200, 800, st.session_state.var_lengths["problems_solved"])
-            st.session_state.var_lengths["target_audience"] = st.slider("Grupa docelowa", 150, 800, st.session_state.var_lengths["target_audience"])
-            st.session_state.var_lengths["example"] = st.slider("Przykład", 150, 800, st.session_state.var_lengths["example"])
-        
-        with length_tabs[1]:
-            # Elementy korzyści
-            st.subheader("Korzyści i wartość")
-            st.session_state.var_lengths["key_benefits"] = st.slider("Kluczowe korzyści", 200, 1000, st.session_state.var_lengths["key_benefits"])
-            st.session_state.var_lengths["guarantee"] = st.slider("Gwarancja", 150, 800, st.session_state.var_lengths["guarantee"])
-            st.session_state.var_lengths["value_summary"] = st.slider("Podsumowanie wartości", 150, 800, st.session_state.var_lengths["value_summary"])
-            st.session_state.var_lengths["comparison"] = st.slider("Porównanie", 200, 1000, st.session_state.var_lengths["comparison"])
-        
-        with length_tabs[2]:
-            # Elementy perswazyjne
-            st.subheader("Elementy perswazyjne")
-            st.session_state.var_lengths["call_to_action"] = st.slider("Wezwanie do działania", 150, 800, st.session_state.var_lengths["call_to_action"])
-            st.session_state.var_lengths["testimonials"] = st.slider("Opinie", 300, 1200, st.session_state.var_lengths["testimonials"])
-            st.session_state.var_lengths["urgency"] = st.slider("Pilność", 150, 800, st.session_state.var_lengths["urgency"])
-            st.session_state.var_lengths["transformation_story"] = st.slider("Historia transformacji", 200, 1000, st.session_state.var_lengths["transformation_story"])
-        
-        with length_tabs[3]:
-            # Dodatkowe elementy
-            st.subheader("Dodatkowe elementy")
-            st.session_state.var_lengths["faq"] = st.slider("FAQ", 300, 1500, st.session_state.var_lengths["faq"])
-            st.session_state.var_lengths["author_credentials"] = st.slider("O autorze", 150, 800, st.session_state.var_lengths["author_credentials"])
+    with st.sidebar:
+        render_length_settings()
     
     st.sidebar.markdown("""
     **Opis tonów komunikacji:**
@@ -702,6 +701,11 @@ def main():
     - **Empatyczny** – wspierający, rozumiejący emocje odbiorcy
     """)
     
+    # Poprzedni przebieg przerwany w trakcie generowania (np. przyciskiem "Przerwij")
+    if st.session_state.get("generation_running"):
+        st.session_state.generation_running = False
+        st.warning("Generowanie zostało przerwane przed otrzymaniem pełnej odpowiedzi.")
+    
     # Formularz główny
     with st.form("input_form"):
         # Upload pliku PDF
@@ -725,14 +729,55 @@ def main():
         # Przycisk analizy i generowania
         analyze_button = st.form_submit_button("Analizuj i generuj treść")
     
-    if analyze_button and uploaded_file is not None and persona and html_template:
+    active_job_id = st.query_params.get("job")
+    show_results = False
+    if analyze_button and uploaded_file is not None and persona and html_template and background_jobs:
+        # Zadanie w tle: plik i parametry trafiają do kolejki, a identyfikator zadania - do adresu strony
+        job_id = jobs.submit_generation_job(
+            uploaded_file.getvalue(),
+            persona,
+            html_template,
+            author_info,
+            model=openai_model,
+            tone=tone,
+            lengths=st.session_state.var_lengths,
+            structured_output=structured_output,
+            bypass_cache=bypass_response_cache,
+            max_pages=pdf_max_pages or None,
+            max_chars=pdf_max_chars or None
+        )
+        jobs.get_job_workers()
+        st.session_state.current_json_data = None
+        st.query_params["job"] = job_id
+        st.rerun()
+    
+    elif analyze_button and uploaded_file is not None and persona and html_template:
+        # Generowanie bez kolejki - adres strony nie wskazuje już zadania w tle
+        st.query_params.pop("job", None)
+        
         # Inicjalizacja informacji o postępie
         progress_text = st.empty()
         progress_text.text("Odczytywanie pliku PDF...")
         progress_bar = st.progress(0)
         
-        # Odczytanie zawartości PDF
-        pdf_text = read_pdf(uploaded_file)
+        # Odczytanie zawartości PDF z postępem aktualizowanym po każdej stronie (0-20%);
+        # tokeny stron liczone są tokenizerem modelu już w trakcie odczytu
+        page_tokens = PageTokenCounter(openai_model)
+        
+        def on_pdf_page(page_num, page_count, page_text):
+            progress_bar.progress(int(20 * (page_num + 1) / page_count))
+            progress_text.text(
+                f"Odczytywanie pliku PDF... strona {page_num + 1}/{page_count} "
+                f"({page_tokens.tokens} tokenów)"
+            )
+        
+        pdf_text = read_pdf(
+            uploaded_file,
+            max_pages=pdf_max_pages or None,
+            max_chars=pdf_max_chars or None,
+            on_page=on_pdf_page,
+            token_counter=page_tokens
+        )
         
         # Zapisz dane do sesji dla późniejszego użycia przy regeneracji
         st.session_state.pdf_text = pdf_text
@@ -770,12 +815,76 @@ def main():
             progress_bar.progress(40)
             progress_text.text("Generowanie treści dla wybranych zmiennych...")
             
-            # Informacja o długości tekstu
-            token_estimate = len(pdf_text) / 4  # Przybliżona liczba tokenów (4 znaki na token)
-            if token_estimate > 100000:
-                st.warning(f"Uwaga: Tekst zawiera około {int(token_estimate)} tokenów, co może przekroczyć limit kontekstu wybranego modelu.")
+            # Budżet tokenów: liczba tokenów e-booka (tokenizer modelu) i wybrana postać e-booka w prompcie
+            try:
+                context_plan = core.plan_ebook_context(
+                    pdf_text,
+                    openai_model,
+                    core.build_generation_instructions(persona, required_variables, author_info, tone, lengths),
+                    lengths
+                )
+            except MailGenError:
+                context_plan = None  # Błąd zostanie pokazany przy generowaniu
+            
+            if context_plan and context_plan.strategy == "trimmed":
+                st.info(
+                    f"E-book ma około {context_plan.document_tokens} tokenów, a w oknie kontekstu modelu {openai_model} "
+                    f"mieści się {context_plan.document_budget} - środek tekstu zostanie pominięty."
+                )
+            elif context_plan and context_plan.strategy == "digest":
+                st.info(
+                    f"E-book ma około {context_plan.document_tokens} tokenów (limit dla pełnego tekstu: {context_plan.document_budget}) - "
+                    "zostanie najpierw streszczony fragmentami, a treści powstaną na podstawie streszczenia."
+                )
+                progress_text.text("Streszczanie obszernego e-booka fragmentami i generowanie treści...")
+            
+            # Tryb strumieniowy: sekcje i podgląd kreacji pojawiają się, gdy tylko są gotowe
+            if stream_output:
+                live_area = st.empty()
+                with live_area.container():
+                    # Kliknięcie uruchamia skrypt od nowa - bieżące generowanie zostaje przerwane,
+                    # a połączenie z modelem zamknięte
+                    st.button("⏹️ Przerwij generowanie", key="cancel_generation")
+                    st.subheader("Generowane treści:")
+                    section_placeholders = {var: st.empty() for var in ALL_VARIABLES if var in required_variables}
+                    live_preview = st.empty()
+                streamed_sections = {}
+                live_rendered = [None]
+                generation_started = time.monotonic()
+                last_heartbeat = [0.0]
+                
+                def show_streamed_section(section_name, content):
+                    streamed_sections[section_name] = content
+                    if section_name in section_placeholders:
+                        section_placeholders[section_name].markdown(
+                            f"**{section_name.replace('_', ' ').title()}**\n\n{content}",
+                            unsafe_allow_html=True
+                        )
+                    progress_bar.progress(40 + int(50 * len(streamed_sections) / len(required_variables)))
+                    # Podgląd kreacji - w szablonie podstawiana jest tylko nowa sekcja
+                    preview_data = {var: streamed_sections.get(var, "") for var in required_variables}
+                    live_rendered[0] = core.render_html_incremental(html_template, preview_data, live_rendered[0])
+                    with live_preview.container():
+                        st.components.v1.html(
+                            get_preview_html(live_rendered[0].html),
+                            height=600,
+                            scrolling=True
+                        )
+                
+                # Aktualizacja licznika co pół sekundy - Streamlit przerywa skrypt przy najbliższym
+                # wywołaniu st.*, więc przycisk "Przerwij" działa także między sekcjami
+                def refresh_streaming_status():
+                    now = time.monotonic()
+                    if now - last_heartbeat[0] >= 0.5:
+                        last_heartbeat[0] = now
+                        progress_text.text(
+                            f"Generowanie treści... {now - generation_started:.0f} s, "
+                            f"gotowe sekcje: {len(streamed_sections)}/{len(required_variables)}"
+                        )
+                    return False
             
             # Analiza PDF i uzyskanie treści marketingowych tylko dla wymaganych zmiennych
+            st.session_state.generation_running = True
             json_data = analyze_pdf_with_openai(
                 pdf_text, 
                 persona, 
@@ -783,297 +892,46 @@ def main():
                 author_info, 
                 model=openai_model, 
                 tone=tone, 
-                lengths=lengths
+                lengths=lengths,
+                bypass_cache=bypass_response_cache,
+                structured_output=structured_output,
+                on_section=show_streamed_section if stream_output else None,
+                should_cancel=refresh_streaming_status if stream_output else None,
+                api_key=api_key
             )
+            st.session_state.generation_running = False
+            if stream_output:
+                live_area.empty()
             
             progress_bar.progress(90)
             
             if json_data:
-                # Zapisanie danych do sesji
+                # Zapisanie danych i szablonu do sesji (edytor i podgląd korzystają tylko ze stanu sesji)
                 st.session_state.current_json_data = json_data
+                st.session_state.current_template = html_template
                 
                 progress_text.text("Generowanie zakończone pomyślnie!")
                 progress_bar.progress(100)
-                
-                # Wyświetlenie edytora wygenerowanych treści
-                st.subheader("Edytuj wygenerowane treści:")
-                
-                # Podziel zmienne na grupy dla lepszej organizacji
-                variable_groups = {
-                    "Podstawowe informacje": ["intro", "why_created", "contents", "problems_solved", "target_audience", "example"],
-                    "Korzyści i wartość": ["key_benefits", "guarantee", "value_summary", "comparison"],
-                    "Elementy perswazyjne": ["call_to_action", "testimonials", "urgency", "transformation_story"],
-                    "Dodatkowe elementy": ["faq", "author_credentials"]
-                }
-                
-                # Utworzenie zakładek dla grup
-                group_names = []
-                for group_name, vars_in_group in variable_groups.items():
-                    # Sprawdź, czy grupa zawiera jakiekolwiek wymagane zmienne
-                    if any(var in required_variables for var in vars_in_group):
-                        group_names.append(group_name)
-                
-                group_tabs = st.tabs(group_names)
-                
-                # Dla każdej grupy
-                edited_json = {}
-                tab_index = 0
-                
-                for group_name, vars_in_group in variable_groups.items():
-                    # Jeśli grupa zawiera wymagane zmienne
-                    group_vars = [var for var in vars_in_group if var in required_variables]
-                    if group_vars:
-                        with group_tabs[tab_index]:
-                            # Dla każdej zmiennej w grupie
-                            for var in group_vars:
-                                if var in json_data:
-                                    # Dodajemy dwa kolumny: jedna na edytor tekstu, druga na przycisk regeneracji
-                                    col1, col2 = st.columns([4, 1])
-                                    
-                                    with col1:
-                                        edited_json[var] = st.text_area(
-                                            f"{var.replace('_', ' ').title()}", 
-                                            json_data[var], 
-                                            height=200
-                                        )
-                                    
-                                    with col2:
-                                        # Przycisk do regeneracji tylko tej sekcji
-                                        regenerate_btn = st.button(
-                                            "🔄 Wygeneruj ponownie", 
-                                            key=f"regenerate_{var}",
-                                            help=f"Wygeneruj ponownie tylko sekcję '{var.replace('_', ' ').title()}'"
-                                        )
-                                        
-                                        if regenerate_btn:
-                                            # Wyświetl komunikat o regeneracji
-                                            with st.spinner(f"Regeneruję sekcję {var.replace('_', ' ').title()}..."):
-                                                # Regeneruj tylko tę sekcję
-                                                new_content = regenerate_single_section(
-                                                    pdf_text=st.session_state.pdf_text,
-                                                    persona=st.session_state.persona,
-                                                    section_name=var,
-                                                    author_info=st.session_state.author_info if var == "author_credentials" else "",
-                                                    model=openai_model,
-                                                    tone=tone,
-                                                    length=st.session_state.var_lengths.get(var, 300)
-                                                )
-                                                
-                                                if new_content:
-                                                    # Aktualizuj dane w sesji
-                                                    st.session_state.current_json_data[var] = new_content
-                                                    # Odśwież stronę aby pokazać nowe dane
-                                                    st.rerun()
-                        
-                        tab_index += 1
-                
-                # Zastosowanie zmian
-                apply_changes = st.button("Zastosuj zmiany")
-                if apply_changes:
-                    # Upewnij się, że wszystkie klucze są zachowane
-                    for key in json_data:
-                        if key not in edited_json:
-                            edited_json[key] = json_data[key]
-                    
-                    json_data = edited_json
-                    st.session_state.current_json_data = json_data
-                    st.success("Zmiany zostały zastosowane!")
-                
-                # Podstawienie wartości w kreacji mailowej
-                final_html = replace_variables_in_html(html_template, json_data)
-                st.session_state.current_html = final_html
-                
-                # Podgląd kreacji
-                st.subheader("Podgląd kreacji:")
-                
-                # Przygotowanie HTML z CSS
-                html_with_style = f"""
-                <style>
-                body {{
-                    font-family: Arial, sans-serif;
-                    line-height: 1.6;
-                    color: #333;
-                    margin: 20px;
-                    max-width: 800px;
-                }}
-                h1, h2, h3, h4, h5, h6 {{
-                    color: #2c3e50;
-                    margin-top: 1.5em;
-                    margin-bottom: 0.5em;
-                }}
-                p {{
-                    margin-bottom: 1em;
-                }}
-                ul, ol {{
-                    margin-bottom: 1em;
-                    padding-left: 2em;
-                }}
-                blockquote {{
-                    border-left: 4px solid #ddd;
-                    padding: 0.5em 1em;
-                    margin: 1em 0;
-                    background-color: #f9f9f9;
-                }}
-                </style>
-                {final_html}
-                """
-                
-                # Używamy st.components.v1.html
-                st.components.v1.html(html_with_style, height=600, scrolling=True)
-                
-                # Wyświetlenie końcowej kreacji (kod HTML)
-                with st.expander("Pokaż kod HTML", expanded=False):
-                    st.code(final_html, language="html")
-                
-                # Przycisk do kopiowania kodu
-                st.subheader("Kopiuj kod do schowka:")
-                st.markdown(get_copy_button_html(final_html), unsafe_allow_html=True)
+                show_results = True
             else:
                 progress_text.text("Wystąpił błąd podczas analizy.")
                 progress_bar.empty()
     
+    elif active_job_id and st.session_state.get("attached_job") != active_job_id:
+        jobs.get_job_workers()
+        render_job_status(active_job_id)
+    
     elif st.session_state.current_json_data is not None:
         # Jeśli już mamy wygenerowane dane, wyświetl je ponownie
-        
-        # Wyświetlenie edytora wygenerowanych treści
-        st.subheader("Edytuj wygenerowane treści:")
-        
-        # Podziel zmienne na grupy dla lepszej organizacji
-        variable_groups = {
-            "Podstawowe informacje": ["intro", "why_created", "contents", "problems_solved", "target_audience", "example"],
-            "Korzyści i wartość": ["key_benefits", "guarantee", "value_summary", "comparison"],
-            "Elementy perswazyjne": ["call_to_action", "testimonials", "urgency", "transformation_story"],
-            "Dodatkowe elementy": ["faq", "author_credentials"]
-        }
-        
-        # Pobierz wymagane zmienne z sesji
-        required_variables = st.session_state.required_variables
-        
-        # Utworzenie zakładek dla grup
-        group_names = []
-        for group_name, vars_in_group in variable_groups.items():
-            # Sprawdź, czy grupa zawiera jakiekolwiek wymagane zmienne
-            if any(var in required_variables for var in vars_in_group):
-                group_names.append(group_name)
-        
-        group_tabs = st.tabs(group_names)
-        
-        # Dla każdej grupy
-        edited_json = {}
-        tab_index = 0
-        
-        for group_name, vars_in_group in variable_groups.items():
-            # Jeśli grupa zawiera wymagane zmienne
-            group_vars = [var for var in vars_in_group if var in required_variables]
-            if group_vars:
-                with group_tabs[tab_index]:
-                    # Dla każdej zmiennej w grupie
-                    for var in group_vars:
-                        if var in st.session_state.current_json_data:
-                            # Dodajemy dwie kolumny: jedna na edytor tekstu, druga na przycisk regeneracji
-                            col1, col2 = st.columns([4, 1])
-                            
-                            with col1:
-                                edited_json[var] = st.text_area(
-                                    f"{var.replace('_', ' ').title()}", 
-                                    st.session_state.current_json_data[var], 
-                                    height=200
-                                )
-                            
-                            with col2:
-                                # Przycisk do regeneracji tylko tej sekcji
-                                regenerate_btn = st.button(
-                                    "🔄 Wygeneruj ponownie", 
-                                    key=f"regenerate_{var}",
-                                    help=f"Wygeneruj ponownie tylko sekcję '{var.replace('_', ' ').title()}'"
-                                )
-                                
-                                if regenerate_btn:
-                                    # Wyświetl komunikat o regeneracji
-                                    with st.spinner(f"Regeneruję sekcję {var.replace('_', ' ').title()}..."):
-                                        # Regeneruj tylko tę sekcję
-                                        new_content = regenerate_single_section(
-                                            pdf_text=st.session_state.pdf_text,
-                                            persona=st.session_state.persona,
-                                            section_name=var,
-                                            author_info=st.session_state.author_info if var == "author_credentials" else "",
-                                            model=openai_model,
-                                            tone=tone,
-                                            length=st.session_state.var_lengths.get(var, 300)
-                                        )
-                                        
-                                        if new_content:
-                                            # Aktualizuj dane w sesji
-                                            st.session_state.current_json_data[var] = new_content
-                                            # Odśwież stronę aby pokazać nowe dane
-                                            st.rerun()
-                
-                tab_index += 1
-        
-        # Zastosowanie zmian
-        apply_changes = st.button("Zastosuj zmiany")
-        if apply_changes:
-            # Upewnij się, że wszystkie klucze są zachowane
-            for key in st.session_state.current_json_data:
-                if key not in edited_json:
-                    edited_json[key] = st.session_state.current_json_data[key]
-            
-            st.session_state.current_json_data = edited_json
-            st.success("Zmiany zostały zastosowane!")
-        
-        # Podstawienie wartości w kreacji mailowej (jeśli szablon jest dostępny)
-        if "current_html" in st.session_state and st.session_state.current_html:
-            final_html = st.session_state.current_html
-            
-            # Podgląd kreacji
-            st.subheader("Podgląd kreacji:")
-            
-            # Przygotowanie HTML z CSS
-            html_with_style = f"""
-            <style>
-            body {{
-                font-family: Arial, sans-serif;
-                line-height: 1.6;
-                color: #333;
-                margin: 20px;
-                max-width: 800px;
-            }}
-            h1, h2, h3, h4, h5, h6 {{
-                color: #2c3e50;
-                margin-top: 1.5em;
-                margin-bottom: 0.5em;
-            }}
-            p {{
-                margin-bottom: 1em;
-            }}
-            ul, ol {{
-                margin-bottom: 1em;
-                padding-left: 2em;
-            }}
-            blockquote {{
-                border-left: 4px solid #ddd;
-                padding: 0.5em 1em;
-                margin: 1em 0;
-                background-color: #f9f9f9;
-            }}
-            </style>
-            {final_html}
-            """
-            
-            # Używamy st.components.v1.html
-            st.components.v1.html(html_with_style, height=600, scrolling=True)
-            
-            # Wyświetlenie końcowej kreacji (kod HTML)
-            with st.expander("Pokaż kod HTML", expanded=False):
-                st.code(final_html, language="html")
-            
-            # Przycisk do kopiowania kodu
-            st.subheader("Kopiuj kod do schowka:")
-            st.markdown(get_copy_button_html(final_html), unsafe_allow_html=True)
+        show_results = True
     
     elif analyze_button:
         st.warning("Proszę wypełnić wszystkie wymagane pola formularza i dodać plik PDF.")
-        
+    
+    # Edytor i podgląd - ta sama ścieżka dla świeżego wyniku i wyniku zapamiętanego w sesji
+    if show_results:
+        render_results(openai_model, tone, regeneration_concurrency, bypass_response_cache, api_key)
+    
     # Informacja o przykładowym szablonie
     with st.expander("Przykładowy szablon HTML", expanded=False):
         st.code("""<!DOCTYPE html>